@@ -0,0 +1,66 @@
+from typing import Tuple
+
+import click
+
+from asmrmanager.filemanager.cache import NAMESPACES, CacheManager
+from asmrmanager.logger import logger
+
+
+def format_size(size: int | float | None) -> str:
+    if size is None:
+        return "-"
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GiB"
+
+
+@click.group()
+def cache():
+    """manage the cache files"""
+
+
+@click.command()
+@click.option("--raw", "-r", is_flag=True, help="output raw json format")
+def stats(raw: bool):
+    """show the file count and size of each cache namespace"""
+    from asmrmanager.common.output import print_table
+
+    print_table(
+        titles=["namespace", "files", "size", "budget", "ttl(h)"],
+        rows=[
+            (
+                s.name,
+                s.files,
+                s.size if raw else format_size(s.size),
+                s.budget if raw else format_size(s.budget),
+                "-" if s.ttl is None else f"{s.ttl / 3600:g}",
+            )
+            for s in CacheManager.get_cm().stats()
+        ],
+        raw=raw,
+    )
+
+
+@click.command()
+@click.argument(
+    "namespaces", nargs=-1, type=click.Choice(list(NAMESPACES.keys()))
+)
+@click.option(
+    "--clear",
+    is_flag=True,
+    default=False,
+    help="remove all files instead of only expired and over budget ones",
+)
+def prune(namespaces: Tuple[str, ...], clear: bool):
+    """
+    remove expired files and evict least recently used files of the
+    namespaces over budget, all namespaces are pruned if none is given
+    """
+    freed = CacheManager.get_cm().prune(namespaces or None, clear=clear)
+    logger.info(f"{format_size(freed)} freed")
+
+
+cache.add_command(stats)
+cache.add_command(prune)
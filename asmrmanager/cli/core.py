@@ -5,7 +5,6 @@ from functools import cache, lru_cache
 from pathlib import Path
 from typing import TYPE_CHECKING, Any, List, Literal, Tuple
 
-import asyncstdlib
 import click
 
 from asmrmanager.common.browse_params import BrowseParams
@@ -43,10 +42,10 @@ def create_database(
     from asmrmanager.database.manage import DataBaseManager
 
     db = DataBaseManager(tag_filter=config.tag_filter or tuple())
-    if not skip_check and not db.check_db_updated():
+    if not skip_check and (pending := db.pending_migrations()):
         logger.error(
-            "Your database is out dated, Please update your database schema"
-            " with asmr utils migrate!"
+            f"Your database is out dated ({len(pending)} pending migrations),"
+            " Please update your database schema with asmr utils migrate!"
         )
         exit(-1)
     return db
@@ -56,9 +55,18 @@ def create_database(
 def create_downloader_and_database(
     download_params: DownloadParams | None = None,
 ) -> Tuple["ASMRDownloadManager", "DataBaseManager"]:
+    from asmrmanager.database.tag_strategy import (
+        TagStrategyError,
+        compile_tag_strategy,
+    )
     from asmrmanager.spider import ASMRDownloadManager
 
     db = create_database()
+    try:
+        tag_strategy = compile_tag_strategy(config.tag_strategy)
+    except TagStrategyError as e:
+        logger.error(e)
+        exit(-1)
 
     if download_params is None:
         download_params = DownloadParams(False, False, True, True)
@@ -78,10 +86,10 @@ def create_downloader_and_database(
                 if download_params.force
                 else id_should_download
             ),  # 如果数据库中不存在或者文件不存在，都执行下载
-            json_should_download=lambda info: db.add_info(
+            json_should_download=lambda info: db.add_info_in_background(
                 info,
                 check=download_params.check_tag,
-                tag_strategy=config.tag_strategy,
+                tag_strategy=tag_strategy,
             ),
             name_should_download=(
                 name_should_download
@@ -94,6 +102,7 @@ def create_downloader_and_database(
             limit=config.api_max_concurrent_requests,
             fetch_cover=config.fetch_cover,
             tagger=config.default_tagger,
+            ingest_format=config.ingest_format,
         ),
         db,
     )
@@ -280,25 +289,38 @@ def save_source(rj: str):
 def convert2local_ids(
     source_ids: List[SourceID],
 ) -> List[LocalSourceID | None]:
-    downloader, db = create_downloader_and_database()
-
-    @asyncstdlib.lru_cache(None)
-    async def convert2local_id(source_id: SourceID):
+    """
+    the known ids are resolved in one query, the others are fetched
+    concurrently and the learned mappings are saved for the next time
+    """
+    db = create_database()
+    remote_ids = {
+        RemoteSourceID(i) for i in source_ids if not is_local_source_id(i)
+    }
+    known = db.func.get_local_ids(remote_ids)
+    if misses := [i for i in remote_ids if i not in known]:
+        downloader, _ = create_downloader_and_database()
+        infos = downloader.run(
+            *[downloader.downloader.get_voice_info(i) for i in misses]
+        )
+        learned = {
+            remote_id: source_name2id(info["source_id"])
+            for remote_id, info in zip(misses, infos)
+            if info is not None
+        }
+        db.save_id_mappings((lid, rid) for rid, lid in learned.items())
+        known.update(learned)
+
+    res: List[LocalSourceID | None] = []
+    for source_id in source_ids:
         if is_local_source_id(source_id):
-            return LocalSourceID(source_id)
-        source_id = RemoteSourceID(source_id)
-        res = db.func.get_local_id(source_id)
-        if res is not None:
-            return LocalSourceID(SourceID(res))
-        info = await downloader.downloader.get_voice_info(source_id)
-        if info is None:
+            res.append(LocalSourceID(source_id))
+        elif (local_id := known.get(source_id)) is not None:
+            res.append(LocalSourceID(SourceID(local_id)))
+        else:
             logger.warning(f"failed to convert {source_id} to local id")
-            return None
-        return LocalSourceID(source_name2id(info["source_id"]))
-
-    return downloader.run(
-        *[convert2local_id(remote_id) for remote_id in source_ids]
-    )
+            res.append(None)
+    return res
 
 
 def convert2local_id(x):
@@ -308,32 +330,56 @@ def convert2local_id(x):
 def convert2remote_ids(
     source_ids: List[SourceID],
 ) -> List[RemoteSourceID | None]:
-    downloader, db = create_downloader_and_database()
-
-    @asyncstdlib.lru_cache(None)
-    async def convert2remote_id(source_id: SourceID):
-        if is_remote_source_id(source_id):
-            return RemoteSourceID(source_id)
-        source_id = LocalSourceID(source_id)
-        remote_id = db.func.get_remote_id(source_id)
-        if remote_id is not None:
-            return RemoteSourceID(SourceID(remote_id))
-        source_name = id2source_name(source_id)
-        res = await downloader.downloader.get_search_result(source_name, {})
-        works = res["works"]
-        if len(works) == 0:
-            logger.warning(f"no remote resources for {source_name}")
-            return None
-        if len(works) > 1:
-            logger.warning(
-                f"multiple remote resources for {source_name}, choose the"
-                " first one by default"
+    """the same as `convert2local_ids`, but the other way round"""
+    from asmrmanager.spider.utils.concurrency import concurrent_rate_limit
+
+    db = create_database()
+    local_ids = {
+        LocalSourceID(i) for i in source_ids if not is_remote_source_id(i)
+    }
+    known = db.func.get_remote_ids(local_ids)
+    if misses := [i for i in local_ids if i not in known]:
+        downloader, _ = create_downloader_and_database()
+
+        @concurrent_rate_limit()
+        async def search(local_id: LocalSourceID) -> int | None:
+            source_name = id2source_name(local_id)
+            res = await downloader.downloader.get_search_result(
+                source_name, {}
             )
-        return works[0]["id"]
+            works = res["works"]
+            if len(works) == 0:
+                logger.warning(f"no remote resources for {source_name}")
+                return None
+            if len(works) > 1:
+                logger.warning(
+                    f"multiple remote resources for {source_name}, choose the"
+                    " first one by default"
+                )
+            return works[0]["id"]
 
-    return downloader.run(
-        *[convert2remote_id(local_id) for local_id in source_ids]
-    )
+        learned = {
+            local_id: remote_id
+            for local_id, remote_id in zip(
+                misses, downloader.run(*[search(i) for i in misses])
+            )
+            if remote_id is not None
+        }
+        db.save_id_mappings(learned.items())
+        known.update(learned)
+
+    return [
+        (
+            RemoteSourceID(source_id)
+            if is_remote_source_id(source_id)
+            else (
+                RemoteSourceID(SourceID(known[source_id]))
+                if source_id in known
+                else None
+            )
+        )
+        for source_id in source_ids
+    ]
 
 
 def convert2remote_id(x):
@@ -380,8 +426,14 @@ def rj_argument(convert: Literal[False, "local", "remote"] = False):
     return _
 
 
-def multi_rj_argument(convert: Literal[False, "local", "remote"] = False):
-    """parse multiple rj input to rj_id"""
+def multi_rj_argument(
+    convert: Literal[False, "local", "remote"] = False, optional: bool = False
+):
+    """
+    parse multiple rj input to rj_id, if `optional` the command gets an
+    empty list instead of an error when there is neither input nor previous
+    source id (for commands with --all)
+    """
 
     def _(f):
         @click.argument("source_ids", nargs=-1)
@@ -404,6 +456,8 @@ def multi_rj_argument(convert: Literal[False, "local", "remote"] = False):
 
             if len(source_ids) == 0:
                 source = get_prev_source()
+                if source == "" and optional:
+                    return f(*args, source_ids=[], **kwargs)
                 if source == "":
                     logger.error(
                         "No previous source id available,"
@@ -516,35 +570,32 @@ def pl_preprocess_cb(
         else:
             possible_names.append(name_or_uuid)
 
-    # check and get cached playlist
-    playlists_cache = fm.get_playlist_cache()
-    if playlists_cache is None:
-        logger.warning("no cached playlist, try getting from server")
+    # check and get cached playlist, only sync when it is missing, expired
+    # or some names can not be found in it
+    playlists_cache = fm.get_playlist_cache() if possible_names else None
+    synced = False
+    if possible_names and (playlists_cache is None or playlists_cache.expired):
+        logger.info("playlist cache missing or expired, syncing with server")
         pl = create_playlist()
-        # TODO use to CONSTANT to replace 100
-        playlists_cache, total = pl.run(
-            pl.playlist.get_playlists(page_size=100)
-        )[0]
-        if total > len(playlists_cache):
-            logger.warning(
-                f"total playlist number {total} is larger than"
-                f" {len(playlists_cache)}"
-            )
-        fm.save_playlist_cache(playlists_cache)
-    cached_names = [p.name for p in playlists_cache]
+        playlists_cache = pl.run(pl.sync())[0]
+        synced = True
+    if not synced and any(
+        name not in playlists_cache.by_name  # type: ignore
+        for name in possible_names
+    ):
+        logger.info("unknown playlist name, syncing with server")
+        pl = create_playlist()
+        playlists_cache = pl.run(pl.sync())[0]
 
     # check for valid names using playlist cache
     for name in possible_names:
-        if name in cached_names:
-            res.append(playlists_cache[cached_names.index(name)].id)
+        assert playlists_cache is not None
+        if (item := playlists_cache.by_name.get(name)) is not None:
+            res.append(item.id)
         else:
             logger.warning(f"invalid playlist name {name}")
 
     if not res:
-        logger.warning(
-            "If you just have created a playlist, you may need to use pl list"
-            " to cache the playlists to local"
-        )
         ctx.fail("no valid uuid, alias or names found")
 
     if param.nargs == 1:
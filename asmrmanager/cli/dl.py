@@ -57,10 +57,11 @@ def check(source_ids: List[LocalSourceID]):
     """check for existence of the file and its store field"""
     db = create_database()
     dl_queue = []
+    existing = db.check_exists_many(source_ids)
     for source_id in source_ids:
         source_name = id2source_name(source_id)
 
-        asmr = db.check_exists(source_id)
+        asmr = existing.get(source_id)
         if asmr is None:
             logger.warning(
                 f"Not found In Database: {source_name}, please manually download it"
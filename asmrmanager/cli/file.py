@@ -1,7 +1,9 @@
+import contextlib
 import re
 import typing
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Literal, Tuple
+from typing import Dict, List, Literal, Tuple
 
 import click
 
@@ -19,6 +21,31 @@ from asmrmanager.config import config
 from asmrmanager.filemanager.exceptions import DstItemAlreadyExistsException
 from asmrmanager.logger import logger
 
+# works stored concurrently by `file store`
+STORE_WORKERS = 4
+
+
+def _converter_or_nothing(hook) -> typing.ContextManager:
+    """the shared audio converter if there is a hook which may use it"""
+    if hook is None or not config.before_store.strip():
+        return contextlib.nullcontext()
+    from asmrmanager.common.fileconverter import AudioConverter
+
+    try:
+        return AudioConverter.get_converter()
+    except FileNotFoundError:  # no encoder, the hook may only convert lrc
+        return contextlib.nullcontext()
+
+
+def _index_media(source_id: LocalSourceID):
+    """index the audio files of a stored work, failures are only logged"""
+    from asmrmanager.database.media_index import MediaIndex
+
+    try:
+        MediaIndex.get_index().update([source_id], workers=2)
+    except Exception as e:
+        logger.warning(f"failed to index the audio files of {source_id}: {e}")
+
 
 @click.group()
 def file():
@@ -119,7 +146,7 @@ def recover(source_id: LocalSourceID, regex: str, ignore_filter: bool):
 
 
 @click.command()
-@multi_rj_argument("local")
+@multi_rj_argument("local", optional=True)
 @click.option(
     "--no-convert",
     "-nc",
@@ -191,7 +218,8 @@ def store(
                 convert_vtt2lrc(file)
             else:
                 logger.debug(f"converting {file} to {to}")
-                with AudioConverter(f"Audio conversion to {to}") as converter:
+                # the shared converter, works stored at once convert together
+                with AudioConverter.get_converter() as converter:
                     converter.convert(file, dst=to)
 
             if len(file.suffixes) == 1:
@@ -202,7 +230,7 @@ def store(
         def convert_all(
             from_: str,
             to: Literal["mp3", "flac", "m4a", "wav", "lrc"],
-            threads: int = 6,
+            threads: int | None = None,  # deprecated, decided by converter
         ):
             if to == "lrc":
                 for file in path.rglob(
@@ -224,19 +252,8 @@ def store(
                         f"No files to convert from {from_} to {to} in {markup_path(path)}"
                     )
                     return
-                with AudioConverter(
-                    f"Audio conversion to {to}", threads=threads
-                ) as converter:
-                    converter.convert(*src_paths, dst=to)
-
-                for src_path in src_paths:
-                    if src_path.suffix.lower() == f".{to}":
-                        continue
-                    if src_path.with_suffix(f".{to}").exists():
-                        logger.info(
-                            "Removing old file: %s", markup_path(src_path)
-                        )
-                        src_path.unlink()
+                with AudioConverter.get_converter() as converter:
+                    converter.convert(*src_paths, dst=to, remove_src=True)
 
         code = config.before_store
         logger.debug("executing before_store_hook code: %s", code)
@@ -260,7 +277,7 @@ def store(
             if res is None or res is False:
                 return
 
-            id_to_store = fm.list_("download")
+            id_to_store = list(fm.list_("download"))
         else:
             id_to_store = []
             for id_ in source_ids:
@@ -272,28 +289,59 @@ def store(
                     continue
                 id_to_store.append(id_)
 
-        for id_ in id_to_store:
-            if check != "none":
-                success = verify_voices(
-                    id_, offline=True if check != "online" else False
-                )
-                if not success:
-                    logger.error("Stop storing due to check failed")
-                    if on_error == "abort":
-                        return
-                    elif on_error == "skip":
-                        continue
-                    else:
-                        assert False
-            fm.store(id_, replace=replace, hook=hook)
-
-            res = db.check_exists(id_)
-            if not res:
-                logger.error(
-                    "no such id: %s, which is an unexpected situation", id_
-                )
-                continue
-            res.stored = True
+        existing = db.check_exists_many(id_to_store)
+
+        # works are stored concurrently, so the conversions of their hooks
+        # share the converter, the stored flag is set by this thread
+        aborted = False
+        with (
+            _converter_or_nothing(hook),
+            ThreadPoolExecutor(STORE_WORKERS) as executor,
+        ):
+            futures: Dict[Future, LocalSourceID] = {}
+            for id_ in id_to_store:
+                if check != "none":
+                    success = verify_voices(
+                        id_, offline=True if check != "online" else False
+                    )
+                    if not success:
+                        logger.error("Stop storing due to check failed")
+                        if on_error == "abort":
+                            aborted = True
+                            break
+                        elif on_error == "skip":
+                            continue
+                        else:
+                            assert False
+                futures[
+                    executor.submit(fm.store, id_, replace=replace, hook=hook)
+                ] = id_
+            error = None
+            for future in as_completed(futures):
+                id_ = futures[future]
+                try:
+                    future.result()
+                except DstItemAlreadyExistsException as e:
+                    error = e
+                    continue
+                except Exception as e:
+                    logger.error("failed to store %s: %s", id_, e)
+                    error = error or e
+                    continue
+                if not (res := existing.get(id_)):
+                    logger.error(
+                        "no such id: %s, which is an unexpected situation",
+                        id_,
+                    )
+                    continue
+                res.stored = True
+                executor.submit(_index_media, id_)
+            if isinstance(error, DstItemAlreadyExistsException):
+                raise error
+            if error is not None:
+                return
+        if aborted:
+            return
         logger.info("succesfully stored all files")
     except DstItemAlreadyExistsException as e:
         logger.error("storing terminated for %s", e)
@@ -401,6 +449,7 @@ def verify_voices(source_id: LocalSourceID, offline: bool) -> bool:
     remote_files_should_down_list = [
         Path(i["path"]) for i in recovers if i["should_download"]
     ]
+    raw_hashes = [i.get("hash") for i in recovers if i["should_download"]]
     file_ids = [i.get("fileId") for i in recovers if i["should_download"]]
     if not all(isinstance(i, int) for i in file_ids):
         logger.warning(
@@ -413,14 +462,24 @@ def verify_voices(source_id: LocalSourceID, offline: bool) -> bool:
 
     file_paths2check: List[Path] = []
     file_ids2check: List[int] = []
-    for file, file_id in zip(remote_files_should_down_list, file_ids):
+    hashes2check: List[str | None] = []
+    for file, file_id, raw_hash in zip(
+        remote_files_should_down_list, file_ids, raw_hashes
+    ):
         file_path = fm.get_path(source_id, str(file), prefer="download")
         assert file_path is not None, (
             f"Unexpected None value for file path = {file_path}"
             f" and source_id = {source_id}"
         )
         if not (file_path.exists() and file_path.is_file()):
-            if fm.check_exists(f"{id2source_name(source_id)}/{str(file)}"):
+            if raw_hash is not None and any(
+                fm.check_exists(f"{id2source_name(source_id)}/{str(file)}")
+            ):
+                # converted while downloading, verify the recorded hash
+                file_paths2check.append(file_path)
+                file_ids2check.append(file_id)
+                hashes2check.append(raw_hash)
+            elif fm.check_exists(f"{id2source_name(source_id)}/{str(file)}"):
                 logger.info(
                     "skipping file, since another file with same name "
                     f"and different extension exists: {markup_path(file_path)}"
@@ -433,6 +492,7 @@ def verify_voices(source_id: LocalSourceID, offline: bool) -> bool:
 
         file_paths2check.append(file_path)
         file_ids2check.append(file_id)
+        hashes2check.append(None)
 
     if len(file_ids2check) == 0:
         logger.warning(f"no files to verify for source_id: {source_id}")
@@ -440,8 +500,10 @@ def verify_voices(source_id: LocalSourceID, offline: bool) -> bool:
     api = create_general_api()
     res = api.run(
         *[
-            api.verify(file_path, file_id)
-            for file_path, file_id in zip(file_paths2check, file_ids2check)
+            api.verify(file_path, file_id, hash_)
+            for file_path, file_id, hash_ in zip(
+                file_paths2check, file_ids2check, hashes2check
+            )
         ]
     )
     if not all(res):
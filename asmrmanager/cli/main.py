@@ -6,6 +6,7 @@ from typing import Any
 import click
 
 from asmrmanager._version import __version__
+from asmrmanager.cli.cache import cache
 from asmrmanager.cli.dl import dl
 from asmrmanager.cli.file import file
 from asmrmanager.cli.hold import hold
@@ -72,6 +73,7 @@ main.add_command(file)
 main.add_command(pl)
 main.add_command(utils)
 main.add_command(vote)
+main.add_command(cache)
 
 if __name__ == "__main__":
     main()
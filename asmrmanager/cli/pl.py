@@ -3,7 +3,6 @@ import uuid
 from typing import List
 
 import click
-import toml
 from click.shell_completion import CompletionItem
 from typing_extensions import Literal
 
@@ -22,10 +21,9 @@ class PLID(click.ParamType):
     def shell_complete(
         self, ctx: "click.Context", param: "click.Parameter", incomplete: str
     ) -> List["CompletionItem"]:
-        playlists: List[PlayListItem] = [
-            PlayListItem(**i)
-            for i in toml.load(fm.CACHE_PATH / "playlist.cache")["playlists"]
-        ]
+        # completion must be instant, so never touch the network here
+        cache = fm.get_playlist_cache()
+        playlists: List[PlayListItem] = cache.playlists if cache else []
         return [
             CompletionItem(str(pl.name), help=pl.desc)
             for pl in playlists
@@ -54,10 +52,16 @@ def pl():
     show_default=True,
     help="raw output",
 )
-def list_(num: int, raw: bool):
+@click.option(
+    "--full",
+    is_flag=True,
+    default=False,
+    help="refetch all playlists instead of syncing incrementally",
+)
+def list_(num: int, raw: bool, full: bool):
     """list all playlists"""
     pl = create_playlist()
-    pl.run(pl.list(num, raw))
+    pl.run(pl.list(num, raw, full))
 
 
 @click.command()
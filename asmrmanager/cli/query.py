@@ -1,10 +1,28 @@
+from typing import Tuple
+
 import click
 
-from asmrmanager.cli.core import create_database, fm
+from asmrmanager.cli.core import (
+    create_database,
+    fm,
+    interval_preprocess_cb,
+    time_interval_preprocess_cb,
+)
+from asmrmanager.common.output import STREAM_FORMATS, StreamFormat
+
+COLUMNS = (
+    "id",
+    "title",
+    "circle_name",
+    "nsfw",
+    "has_subtitle",
+    "count",
+    "star",
+)
 
 
 @click.command()
-@click.argument("keyword", type=str)
+@click.argument("keyword", type=str, required=False, default="")
 @click.option("--limit", "-l", type=int, default=100, show_default=True)
 @click.option(
     "--raw",
@@ -14,53 +32,185 @@ from asmrmanager.cli.core import create_database, fm
     show_default=True,
     help="output raw json",
 )
-def query(keyword: str, limit: int, raw: bool):
+@click.option(
+    "--format",
+    "format_",
+    type=click.Choice(STREAM_FORMATS),
+    default=None,
+    help="stream the rows in this format as they arrive",
+)
+@click.option(
+    "--tags", "-t", type=str, multiple=True, help="tags to include[multiple]"
+)
+@click.option(
+    "--no-tags",
+    "-nt",
+    type=str,
+    multiple=True,
+    help="tags to exclude[multiple]",
+)
+@click.option(
+    "--vas",
+    "-v",
+    type=str,
+    multiple=True,
+    help="voice actor(cv) to include[multiple]",
+)
+@click.option(
+    "--no-vas",
+    "-nv",
+    type=str,
+    multiple=True,
+    help="voice actor(cv) to exclude[multiple]",
+)
+@click.option(
+    "--circle", "-c", type=str, default=None, help="circle(社团) to include"
+)
+@click.option(
+    "--no-circle",
+    "-nc",
+    type=str,
+    multiple=True,
+    help="circle(社团) to exclude[multiple]",
+)
+@click.option(
+    "--age",
+    "-a",
+    help="age limitation to include",
+    default=None,
+    type=click.Choice(["general", "r15", "adult"]),
+)
+@click.option(
+    "--no-age",
+    "-na",
+    help="age limitation to exclude[multiple]",
+    multiple=True,
+    type=click.Choice(["general", "r15", "adult"]),
+)
+@click.option(
+    "--price", "-pr", help="pirce interval", callback=interval_preprocess_cb
+)
+@click.option(
+    "--sell", "-s", help="selling interval", callback=interval_preprocess_cb
+)
+@click.option(
+    "--star", help="your star interval", callback=interval_preprocess_cb
+)
+@click.option(
+    "--subtitle/--no-subtitle",
+    default=None,
+    help="if the ASMR has subtitle(中文字幕)",
+)
+@click.option(
+    "--duration",
+    "-d",
+    help="total duration interval, needs `asmr utils index`",
+    callback=time_interval_preprocess_cb,
+)
+@click.option(
+    "-o",
+    "--order",
+    type=click.Choice(["id", "release", "dl_count", "price", "star", "count"]),
+    default=None,
+    help="ordering of the filtered result, default to release",
+)
+@click.option("--asc/--desc", default=False, help="ascending or descending")
+@click.option(
+    "--after",
+    type=int,
+    default=None,
+    help="id of the last work of the previous page",
+)
+@click.option(
+    "--facets",
+    is_flag=True,
+    default=False,
+    help="show the most common tags, vas and circles of the result",
+)
+def query(
+    keyword: str,
+    limit: int,
+    raw: bool,
+    format_: StreamFormat | None,
+    tags: Tuple[str, ...],
+    no_tags: Tuple[str, ...],
+    vas: Tuple[str, ...],
+    no_vas: Tuple[str, ...],
+    circle: str | None,
+    no_circle: Tuple[str, ...],
+    age: str | None,
+    no_age: Tuple[str, ...],
+    price: Tuple[int | None, int | None],
+    sell: Tuple[int | None, int | None],
+    star: Tuple[int | None, int | None],
+    subtitle: bool | None,
+    duration: Tuple[str | None, str | None],
+    order: str | None,
+    asc: bool,
+    after: int | None,
+    facets: bool,
+):
     """
-    simple keyword based query,
-    it will match the input with name, circle_name and tag field.
+    simple keyword based query, it will match the input with title,
+    circle_name, tags, vas and comment, best matches first.
+    width, case and kana (hiragana/katakana) are ignored.
     if you want to use more complex queries, please use `asmr sql` instead.
 
+    the filter options are the same as `asmr dl search`, but run against the
+    local database. with any of them (or --order/--after/--facets) the
+    result is ordered by --order instead of relevance, and the id to pass
+    to --after for the next page is printed.
+
     set limit to 0 if you want to get all results.
     """
-    from asmrmanager.common.output import print_table
-    from asmrmanager.database.database import (
-        ASMR,
-        ASMRs2Tags,
-        ASMRs2VAs,
-        Tag,
-        VoiceActor,
+    from asmrmanager.common.output import (
+        COVER_CELL_SIZE,
+        print_table,
+        stream_table,
+        support_image,
     )
+    from asmrmanager.database.facets import (
+        LocalFilter,
+        facet_counts,
+        iter_works,
+    )
+    from asmrmanager.logger import logger
 
     db = create_database()
-    res_query = (
-        db.query(
-            ASMR.id,
-            ASMR.title,
-            ASMR.circle_name,
-            ASMR.nsfw,
-            ASMR.has_subtitle,
-            ASMR.count,
-            ASMR.star,
-        )
-        .join(ASMRs2Tags, ASMRs2Tags.asmr_id == ASMR.id)
-        .join(Tag, Tag.id == ASMRs2Tags.tag_id)
-        .join(ASMRs2VAs, ASMRs2VAs.asmr_id == ASMR.id)
-        .join(VoiceActor, VoiceActor.id == ASMRs2VAs.actor_id)
-        .filter(
-            ASMR.circle_name.contains(keyword)
-            | ASMR.title.contains(keyword)
-            | Tag.name.contains(keyword)
-            | ASMR.comment.contains(keyword)
-            | VoiceActor.name.contains(keyword)
-        )
-        .group_by(ASMR.id)
+    assert limit >= 0
+    filter_ = LocalFilter(
+        keyword=keyword,
+        tags=tags,
+        no_tags=no_tags,
+        vas=vas,
+        no_vas=no_vas,
+        circle=circle,
+        no_circle=no_circle,
+        age=age,  # type: ignore
+        no_age=no_age,  # type: ignore
+        price=price,
+        sell=sell,
+        star=star,
+        subtitle=subtitle,
+        duration=duration,
     )
+    faceted = not filter_.is_empty() or order or after is not None or facets
+    if not faceted and not keyword.strip():
+        logger.error("Please give a keyword or some filters")
+        exit(-1)
 
-    assert limit >= 0
-    if limit == 0:
-        res = res_query.all()
+    if faceted:
+        rows = iter_works(
+            db.session,
+            filter_,
+            COLUMNS,
+            order=order or "release",  # type: ignore
+            asc=asc,
+            limit=limit,
+            after=after,
+        )
     else:
-        res = res_query.limit(limit).all()
+        rows = db.search(keyword, limit, columns=COLUMNS)
 
     titles = [
         "id",
@@ -72,9 +222,25 @@ def query(keyword: str, limit: int, raw: bool):
         "star",
     ]
 
+    if format_ is not None:
+        stream_table(titles, rows, format_)
+        return
+
+    res = list(rows)
     print_table(
         titles=titles,
         rows=res,
         raw=raw,
-        image_paths=[str(fm.get_cover_path(row[0])) for row in res],
+        image_paths=(
+            fm.get_cover_thumbnails([row[0] for row in res], COVER_CELL_SIZE)
+            if support_image()
+            else None
+        ),
     )
+
+    if faceted and limit and len(res) == limit:
+        logger.info(f"more results with --after {res[-1][0]}")
+
+    if facets:
+        for name, counts in facet_counts(db.session, filter_).items():
+            print_table(titles=[name, "count"], rows=counts, raw=raw)
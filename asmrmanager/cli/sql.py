@@ -1,12 +1,21 @@
 import os
+from itertools import chain
 from subprocess import run
 
 import click
 from click.shell_completion import CompletionItem
 
 from asmrmanager.cli.core import fm
-from asmrmanager.common.output import print_table, support_image
+from asmrmanager.common.output import (
+    COVER_CELL_SIZE,
+    STREAM_FORMATS,
+    StreamFormat,
+    print_table,
+    stream_table,
+    support_image,
+)
 from asmrmanager.config import config
+from asmrmanager.filemanager.cache import CacheManager
 from asmrmanager.logger import logger
 
 
@@ -23,6 +32,20 @@ class SQLName(click.ParamType):
         ]
 
 
+def print_rows(titles, rows, raw: bool):
+    if titles[0] == "id" and support_image():
+        print_table(
+            titles,
+            rows,
+            raw=raw,
+            image_paths=fm.get_cover_thumbnails(
+                [row[0] for row in rows], COVER_CELL_SIZE
+            ),
+        )
+    else:
+        print_table(titles, rows, raw=raw)
+
+
 @click.command()
 @click.argument("sql_name", type=SQLName())
 @click.option(
@@ -46,7 +69,30 @@ class SQLName(click.ParamType):
     default=True,
     help="should your change to the file be saved",
 )
-def sql(sql_name: str, save: bool, edit: bool, raw: bool):
+@click.option(
+    "--cache/--no-cache",
+    default=True,
+    show_default=True,
+    help=(
+        "reuse the result of the same read only query if the database has"
+        " not changed since"
+    ),
+)
+@click.option(
+    "--format",
+    "format_",
+    type=click.Choice(STREAM_FORMATS),
+    default=None,
+    help="stream the rows in this format as they arrive, without caching",
+)
+def sql(
+    sql_name: str,
+    save: bool,
+    edit: bool,
+    raw: bool,
+    cache: bool,
+    format_: StreamFormat | None,
+):
     """
     execute a sql statement by sql file name in `sqls` directory
     and print the results on your terminal
@@ -62,8 +108,7 @@ def sql(sql_name: str, save: bool, edit: bool, raw: bool):
         )
         return
 
-    fm.CACHE_PATH.mkdir(parents=True, exist_ok=True)
-    temp_file_path = fm.CACHE_PATH / "tempfile.sql"
+    temp_file_path = CacheManager.get_cm().path("tmp", "tempfile.sql")
     temp_file_path.write_text(
         sql_path.read_text(encoding="utf8"), encoding="utf8"
     )
@@ -80,20 +125,36 @@ def sql(sql_name: str, save: bool, edit: bool, raw: bool):
     #     ]
     # )
     from asmrmanager.cli.core import create_database
+    from asmrmanager.database import sql_cache
 
     db = create_database()
-    res = db.execute(temp_file_path.read_text(encoding="utf8"))
-    rows = res.fetchall()
-    titles = list(res.keys())
-    if titles[0] == "id" and support_image():
-        print_table(
-            titles,
-            rows,
-            raw=raw,
-            image_paths=[str(fm.get_cover_path(row[0])) for row in rows],
+    sql_text = temp_file_path.read_text(encoding="utf8")
+    normalized_sql, words = sql_cache.normalize_sql(sql_text)
+    db_path = db.engine.url.database
+    cache = (
+        cache
+        and format_ is None
+        and db_path is not None
+        and sql_cache.is_cacheable(words)
+    )
+    version = sql_cache.db_version(db_path) if cache else ""  # type: ignore
+    if format_ is not None:
+        res = db.execute(sql_text)
+        stream_table(
+            list(res.keys()),
+            chain.from_iterable(res.partitions(1000)),
+            format_,
         )
     else:
-        print_table(titles, rows, raw=raw)
+        if cache and (cached := sql_cache.get(normalized_sql, version)):
+            titles, rows = cached
+        else:
+            res = db.execute(sql_text)
+            rows = res.fetchall()
+            titles = list(res.keys())
+            if cache:
+                sql_cache.put(normalized_sql, version, titles, rows)
+        print_rows(titles, rows, raw)
 
     if save:
         sql_path.write_text(
@@ -1,13 +1,13 @@
+from concurrent.futures import Future
 from pathlib import Path
-from typing import List, Literal, Optional
+from typing import Dict, List, Literal, Optional, Set, Tuple
 
 import click
 
-from asmrmanager.cli.core import fm, rj_argument
+from asmrmanager.cli.core import fm, multi_rj_argument
 from asmrmanager.common import MUSIC_SUFFIXES
 from asmrmanager.common.fileconverter import convert_vtt2lrc
 from asmrmanager.common.rj_parse import id2source_name
-from asmrmanager.common.subtitle import generate_subtitle
 from asmrmanager.common.types import LocalSourceID, RemoteSourceID
 from asmrmanager.logger import logger
 
@@ -20,22 +20,92 @@ def utils():
 
 
 @click.command()
-def migrate():
-    "migrate the database to the latest version(2.0.0+)"
-    from sqlalchemy.sql import text
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    default=False,
+    help="only list the pending migrations",
+)
+def migrate(dry_run: bool):
+    "migrate the database to the latest schema version"
+    import sqlite3
+    from contextlib import closing
 
     from asmrmanager.cli.core import create_database
 
     db = create_database(skip_check=True)
-    if db.check_db_updated():
-        logger.error("Database already updated")
-        exit(-1)
-    db.session.execute(text("ALTER TABLE asmr ADD COLUMN remote_id integer;"))
-    db.session.execute(text("UPDATE asmr SET remote_id = id;"))
-    db.session.commit()
+    pending = db.pending_migrations()
+    if not pending:
+        logger.info("Database already updated")
+        return
+    for m in pending:
+        logger.info(f"pending migration {m.version}: {m.description}")
+    if dry_run:
+        return
+
+    if (db_path := db.engine.url.database) is not None:
+        backup_path = f"{db_path}.v{pending[0].version - 1}.bak"
+        # the online backup api also copies what is still in the wal and
+        # gives a consistent snapshot, unlike copying the file
+        with (
+            closing(sqlite3.connect(db_path)) as src,
+            closing(sqlite3.connect(backup_path)) as dst,
+        ):
+            src.backup(dst)
+        logger.info(f"Database backed up to {backup_path}")
+    db.migrate()
     logger.info("Database updated successfully")
 
 
+@click.command()
+@click.argument(
+    "dirs",
+    nargs=-1,
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+)
+@click.option(
+    "--processes",
+    "-j",
+    type=int,
+    default=None,
+    help="number of processes to parse the info files, default to cpu count",
+)
+@click.option(
+    "--chunk-size",
+    type=int,
+    default=1000,
+    show_default=True,
+    help="number of works written per transaction",
+)
+def reindex(dirs: Tuple[Path, ...], processes: int | None, chunk_size: int):
+    """
+    rebuild the database from the RJ*.json info files in DIRS,
+    default to the download and storage path. your reviews are kept
+    """
+    from asmrmanager.cli.core import create_database
+    from asmrmanager.config import config
+    from asmrmanager.database.tag_strategy import (
+        TagStrategyError,
+        compile_tag_strategy,
+    )
+    from asmrmanager.database.utils.reindex import reindex
+
+    try:
+        compile_tag_strategy(config.tag_strategy)
+    except TagStrategyError as e:
+        logger.error(e)
+        exit(-1)
+
+    db = create_database()
+    reindex(
+        db.session,
+        dirs or (fm.download_path, fm.storage_path),
+        tag_strategy=config.tag_strategy,
+        processes=processes,
+        chunk_size=chunk_size,
+    )
+
+
 @click.command()
 @click.argument("mode", type=click.Choice(["lrc", "mp3", "flac", "m4a"]))
 @click.option(
@@ -44,56 +114,189 @@ def migrate():
     default="storage",
     help="path to apply convert",
 )
-@rj_argument("local")
+@click.option(
+    "--all",
+    "-a",
+    "all_",
+    is_flag=True,
+    default=False,
+    help="convert all the works in the path, an interrupted run resumes"
+    " from where it stopped",
+)
+@click.option(
+    "--restart",
+    is_flag=True,
+    default=False,
+    help="with --all, forget the progress of the previous run",
+)
+@multi_rj_argument("local", optional=True)
 def convert(
-    source_id: LocalSourceID,
+    source_ids: List[LocalSourceID],
     mode: Literal["lrc", "mp3", "flac", "m4a"],
     dst: Literal["download", "storage"],
+    all_: bool,
+    restart: bool,
 ):
     """convert file format and replace the existing file"""
     from asmrmanager.filemanager.manager import FileManager
 
     fm = FileManager.get_fm()
 
-    path = fm.get_path(source_id, prefer=dst)
-    if path is None:
-        logger.error("Source not found")
+    # works finished by `--all`, one per line, so it survives interruptions
+    journal = fm.DATA_PATH / f"convert_{mode}_{dst}.done"
+    if all_:
+        if restart:
+            journal.unlink(missing_ok=True)
+        done = (
+            set(journal.read_text(encoding="utf8").split())
+            if journal.exists()
+            else set()
+        )
+        if done:
+            logger.info(f"resuming, skip {len(done)} converted works")
+        source_ids = [
+            i for i in fm.list_(dst) if id2source_name(i) not in done
+        ]
+    elif not source_ids:
+        logger.error("Please give some source ids or use --all")
         exit(-1)
+
+    paths: List[Path] = []
+    for source_id in source_ids:
+        path = fm.get_path(source_id, prefer=dst)
+        if path is None:
+            logger.error(f"Source not found: {id2source_name(source_id)}")
+            if not all_:
+                exit(-1)
+            continue
+        paths.append(path)
+
+    def finish(path: Path):
+        logger.info(f"converted {path.name}")
+        if all_:
+            with journal.open("a", encoding="utf8") as f:
+                f.write(path.name + "\n")
+
     if mode == "lrc":
-        for vtt_path in path.rglob("*.vtt"):
-            convert_vtt2lrc(vtt_path)
-            assert (
-                vtt_path.with_suffix(".lrc").exists()
-                or vtt_path.with_suffix("").with_suffix(".lrc").exists()
-            )
-            logger.info("Converted %s to LRC", vtt_path)
-            vtt_path.unlink()
-    else:
-        from asmrmanager.common.fileconverter import AudioConverter
-
-        src_paths = list(
-            filter(
-                lambda p: (
-                    not p.is_dir()
-                    and p.suffix.lower() in [".flac", ".wav", ".m4a"]
-                    and p.suffix.lower() != f".{mode}"
-                ),
-                path.rglob("*.*"),
-            )
+        for path in paths:
+            for vtt_path in path.rglob("*.vtt"):
+                convert_vtt2lrc(vtt_path)
+                assert (
+                    vtt_path.with_suffix(".lrc").exists()
+                    or vtt_path.with_suffix("").with_suffix(".lrc").exists()
+                )
+                logger.info("Converted %s to LRC", vtt_path)
+                vtt_path.unlink()
+            finish(path)
+        return
+
+    from asmrmanager.common.fileconverter import AudioConverter
+
+    converter = AudioConverter.get_converter()
+    with converter:
+        # all the works feed the same pool, a few works ahead of the workers
+        in_flight: Dict[Path, list] = {}
+        pending: Set[Future] = set()  # the conversions not done yet
+        for path in paths:
+            src_paths = [
+                p
+                for p in path.rglob("*.*")
+                if not p.is_dir()
+                and p.suffix.lower() in [".flac", ".wav", ".m4a"]
+                and p.suffix.lower() != f".{mode}"
+            ]
+            in_flight[path] = [
+                converter.submit(p, mode, remove_src=True) for p in src_paths
+            ]
+            pending.update(in_flight[path])
+            while len(pending) > 4 * converter.workers:
+                _finish_converted(in_flight, pending, finish)
+        while in_flight:
+            _finish_converted(in_flight, pending, finish)
+
+
+def _finish_converted(
+    in_flight: Dict[Path, list], pending: Set[Future], finish
+):
+    """
+    wait for a conversion of `pending`, then call `finish` for the works
+    whose conversions all succeeded
+    """
+    from concurrent.futures import FIRST_COMPLETED, wait
+
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    pending.difference_update(done)
+    for path, futures in list(in_flight.items()):
+        if not all(f.done() for f in futures):
+            continue
+        del in_flight[path]
+        if errors := [f.exception() for f in futures if f.exception()]:
+            logger.error(f"failed to convert {path.name}: {errors[0]}")
+            continue
+        finish(path)
+
+
+@click.command()
+@click.option(
+    "--all",
+    "-a",
+    "all_",
+    is_flag=True,
+    default=False,
+    help="index all the works in the download and storage path",
+)
+@click.option(
+    "--loudness",
+    is_flag=True,
+    default=False,
+    help="also measure the integrated loudness, slow and needs ffmpeg",
+)
+@click.option(
+    "--workers",
+    "-j",
+    type=int,
+    default=None,
+    help="number of files probed at once",
+)
+@multi_rj_argument("local", optional=True)
+def index(
+    source_ids: List[LocalSourceID],
+    all_: bool,
+    loudness: bool,
+    workers: int | None,
+):
+    """
+    index the duration, codec, sample rate, channels and bitrate of the
+    audio files, only new or changed files are probed
+    """
+    from rich.progress import Progress
+
+    from asmrmanager.cli.core import create_database
+    from asmrmanager.database.media_index import MediaIndex
+
+    create_database()  # creates the table on databases made before it
+    if all_:
+        source_ids = sorted(
+            set(fm.list_("download")) | set(fm.list_("storage"))
         )
+    elif not source_ids:
+        logger.error("Please give some source ids or use --all")
+        exit(-1)
 
-        with AudioConverter(f"utils convert to {mode}") as converter:
-            converter.convert(*src_paths, dst=mode)
-        for src_path in src_paths:
-            if src_path.suffix.lower() == f".{mode}":
-                continue
-            if src_path.with_suffix(f".{mode}").exists():
-                logger.info("Removing old file: %s", src_path)
-                src_path.unlink()
+    with Progress(transient=True) as progress:
+        task_id = progress.add_task("Indexing", total=None)
+        count = MediaIndex.get_index().update(
+            source_ids,
+            loudness=loudness,
+            workers=workers,
+            on_progress=lambda done, total: progress.update(
+                task_id, completed=done, total=total
+            ),
+        )
+    logger.info(f"indexed {count} files of {len(source_ids)} works")
 
 
 @click.command()
-@rj_argument("local")
 @click.option(
     "--force", "-f", is_flag=True, help="Overwrite existing LRC files"
 )
@@ -103,54 +306,123 @@ def convert(
     type=click.Path(path_type=Path),
     help="Output file path (defaults to a .lrc file with the same name as the audio file)",
 )
+@click.option(
+    "--all",
+    "-a",
+    "all_",
+    is_flag=True,
+    default=False,
+    help="generate for all the audio files without subtitles in the"
+    " storage path",
+)
+@click.option(
+    "--replicas",
+    "-j",
+    type=int,
+    default=None,
+    help="number of model replicas transcribing at once on cpu, each holds"
+    " a model in memory, default to the calibrated number",
+)
+@click.option(
+    "--recalibrate",
+    is_flag=True,
+    default=False,
+    help="measure the fastest number of replicas again",
+)
+@multi_rj_argument("local", optional=True)
 def subtitle(
-    source_id: LocalSourceID,
+    source_ids: List[LocalSourceID],
     output: Optional[Path],
+    all_: bool,
+    replicas: int | None,
+    recalibrate: bool,
     force: bool = False,
 ):
     """generate LRC subtitles for audio files using the Whisper model"""
+    from asmrmanager.common.subtitle import (
+        SubtitleService,
+        has_subtitle,
+        subtitle_path,
+    )
     from asmrmanager.filemanager.utils import folder_chooser
 
-    rj_path = fm.get_path(source_id)
-    if rj_path is None:
-        logger.error(f"RJ id {source_id} not found!")
-        return
-
-    try:
-        path = folder_chooser(
-            rj_path,
-            lambda _, count: bool(
-                set(count.keys()).intersection(MUSIC_SUFFIXES)
-            ),
-        )
-    except ValueError:
-        logger.error(
-            f"No music files{MUSIC_SUFFIXES} found, please check your local"
-            " file."
-        )
+    if all_:
+        if output is not None:
+            logger.error("--output can not be used with --all")
+            exit(-1)
+        source_ids = list(fm.list_("storage"))
+    elif not source_ids:
+        logger.error("Please give some source ids or use --all")
         exit(-1)
 
-    assert path.is_dir()
-
-    audio_paths: List[Path] = []
-    for file in path.iterdir():
-        if file.is_dir():
-            continue
-
-        if file.suffix not in MUSIC_SUFFIXES:
+    # (audio, lrc files to write), all checked before the model is loaded
+    jobs: List[Tuple[Path, List[Path]]] = []
+    for source_id in source_ids:
+        rj_path = fm.get_path(source_id)
+        if rj_path is None:
+            logger.error(f"RJ id {source_id} not found!")
+            if not all_:
+                exit(-1)
             continue
 
-        audio_paths.append(file)
+        if all_:
+            audio_paths = sorted(
+                p
+                for p in rj_path.rglob("*.*")
+                if p.suffix.lower() in MUSIC_SUFFIXES and p.is_file()
+            )
+        else:
+            try:
+                path = folder_chooser(
+                    rj_path,
+                    lambda _, count: bool(
+                        set(count.keys()).intersection(MUSIC_SUFFIXES)
+                    ),
+                )
+            except ValueError:
+                logger.error(
+                    f"No music files{MUSIC_SUFFIXES} found, please check"
+                    " your local file."
+                )
+                exit(-1)
+            audio_paths = sorted(
+                p
+                for p in path.iterdir()
+                if p.suffix in MUSIC_SUFFIXES and p.is_file()
+            )
 
-    if not audio_paths:
-        logger.error("No audio files found in the specified directory.")
+        # the same track in several formats (only differing in suffix in
+        # a folder) is transcribed once, the names are reused across the
+        # folders (本編/, おまけ/ ...) for different tracks
+        tracks: Dict[Path, List[Path]] = {}
+        for audio_path in audio_paths:
+            tracks.setdefault(audio_path.with_suffix(""), []).append(
+                audio_path
+            )
+        for same in tracks.values():
+            outputs: List[Path] = []
+            for audio_path in same:
+                lrc_path = subtitle_path(audio_path, output)
+                if lrc_path in outputs:
+                    continue
+                if not force and (
+                    lrc_path.exists() or (all_ and has_subtitle(audio_path))
+                ):
+                    logger.info(
+                        f"Skipping {audio_path.name}: subtitle already exists"
+                    )
+                    continue
+                outputs.append(lrc_path)
+            if outputs:
+                jobs.append((same[0], outputs))
+
+    if not jobs:
+        logger.info("No audio files need subtitles.")
         return
 
-    audio_paths.sort()
+    logger.info(f"Generating subtitles for {len(jobs)} audio files")
     try:
-        for audio_path in audio_paths:
-            logger.info(f"Generating LRC file for {audio_path.name}")
-            generate_subtitle(audio_path, output, force)
+        SubtitleService.get_service().run(jobs, replicas, recalibrate)
     except KeyboardInterrupt:
         logger.error("Subtitle generation interrupted by user.")
         return
@@ -190,6 +462,8 @@ def fetch_all_covers():
 
 
 utils.add_command(migrate)
+utils.add_command(reindex)
 utils.add_command(convert)
+utils.add_command(index)
 utils.add_command(subtitle)
 utils.add_command(fetch_all_covers)
@@ -8,7 +8,7 @@ from asmrmanager.cli.core import (
     id2source_name,
     rj_argument,
 )
-from asmrmanager.common.output import support_image
+from asmrmanager.common.output import COVER_CELL_SIZE, support_image
 from asmrmanager.common.types import LocalSourceID
 from asmrmanager.filemanager.exceptions import SrcNotExistsException
 from asmrmanager.logger import logger
@@ -28,7 +28,20 @@ def view():
     default="zip",
     show_default=True,
 )
-def add(source_id: LocalSourceID, mode: Literal["link", "zip", "adb", "copy"]):
+@click.option(
+    "--hardlink/--no-hardlink",
+    default=True,
+    show_default=True,
+    help=(
+        "in copy mode, hardlink the files if view path is on the same device"
+        " and reflink is not supported"
+    ),
+)
+def add(
+    source_id: LocalSourceID,
+    mode: Literal["link", "zip", "adb", "copy"],
+    hardlink: bool,
+):
     """add an ASMR to view path (use zip by default)"""
     from asmrmanager.cli.core import fm
     from asmrmanager.filemanager.utils import folder_chooser
@@ -57,7 +70,7 @@ def add(source_id: LocalSourceID, mode: Literal["link", "zip", "adb", "copy"]):
         case "link":
             fm.link(src, dst)
         case "copy":
-            fm._copy(src, dst, depth=1)
+            fm.copy(src, dst, depth=1, link=hardlink)
         case "adb":
             raise NotImplementedError
 
@@ -99,7 +112,9 @@ def list_(raw: bool):
             for id_, title, actors in res
         ],
         raw=raw,
-        image_paths=[str(fm.get_cover_path(id_)) for id_, *_ in res]
+        image_paths=fm.get_cover_thumbnails(
+            [id_ for id_, *_ in res], COVER_CELL_SIZE
+        )
         if support_image()
         else None,
     )
@@ -1,6 +1,4 @@
 import dataclasses
-import json
-from time import time
 from typing import TYPE_CHECKING, Any, Literal, Optional
 
 import click
@@ -14,7 +12,7 @@ from asmrmanager.cli.core import (
 )
 from asmrmanager.common.rj_parse import is_remote_source_id, source2id
 from asmrmanager.common.types import RemoteSourceID
-from asmrmanager.filemanager.appdirs_ import CACHE_PATH
+from asmrmanager.filemanager.cache import CacheManager
 from asmrmanager.logger import logger
 
 if TYPE_CHECKING:
@@ -26,22 +24,13 @@ def get_all_tags() -> list[dict]:
         api = create_tags_api()
         return api.run(api.get_all_tags())[0]
 
-    CACHE_PATH.mkdir(parents=True, exist_ok=True)
-    tags_cache = CACHE_PATH / "tags.json"
-
-    # skip if modified time is less than 24 hour
-    if (
-        not tags_cache.exists()
-        or time() - tags_cache.stat().st_mtime > 24 * 60 * 60
-    ):
+    cm = CacheManager.get_cm()
+    # refetch if it is modified more than 24 hours ago
+    tags = cm.read_json("api", "tags.json", ttl=24 * 60 * 60)
+    if tags is None:
         tags = fetch_all_tags()
-        with tags_cache.open("w", encoding="utf-8") as f:
-            json.dump(
-                tags,
-                f,
-                ensure_ascii=False,
-            )
-    return json.load(tags_cache.open(encoding="utf-8"))
+        cm.write_json("api", "tags.json", tags)
+    return tags
 
 
 def get_prev_id():
@@ -73,25 +62,17 @@ def get_prev_tags(source_id: RemoteSourceID):
         api = create_tags_api()
         return api.run(api.get_asmr_tags(RemoteSourceID(source_id)))[0]
 
-    CACHE_PATH.mkdir(parents=True, exist_ok=True)
-    prev_info_cache = CACHE_PATH / "prev_info.json"
-    if not prev_info_cache.exists() or (
-        json.load(prev_info_cache.open(encoding="utf-8"))["id"] != source_id
-    ):
+    cm = CacheManager.get_cm()
+    prev_info = cm.read_json("api", "prev_info.json")
+    if prev_info is None or prev_info["id"] != source_id:
         _prev_tags = fetch_prev_tags()
-        with prev_info_cache.open("w", encoding="utf-8") as f:
-            json.dump(
-                {
-                    "id": source_id,
-                    "tags": list(
-                        map(lambda t: dataclasses.asdict(t), _prev_tags)
-                    ),
-                },
-                f,
-                ensure_ascii=False,
-            )
+        prev_info = {
+            "id": source_id,
+            "tags": list(map(lambda t: dataclasses.asdict(t), _prev_tags)),
+        }
+        cm.write_json("api", "prev_info.json", prev_info)
 
-    return json.load(prev_info_cache.open(encoding="utf-8"))["tags"]
+    return prev_info["tags"]
 
 
 class TagType(click.ParamType):
@@ -111,14 +92,12 @@ class TagType(click.ParamType):
         if value.isdigit():
             value = int(value)
 
-        with (CACHE_PATH / "tags.json").open(encoding="utf-8") as f:
-            tags = json.load(f)
-            for tag in tags:
-                if tag["name"] == value or tag["id"] == value:
-                    logger.info(f"Selected tag_id={tag['id']}: {tag['name']}")
-                    return tag["id"]
-            else:
-                self.fail(f"Invalid tag name: {value}")
+        for tag in get_all_tags():
+            if tag["name"] == value or tag["id"] == value:
+                logger.info(f"Selected tag_id={tag['id']}: {tag['name']}")
+                return tag["id"]
+        else:
+            self.fail(f"Invalid tag name: {value}")
 
     def shell_complete(
         self, ctx: "click.Context", param: "click.Parameter", incomplete: str
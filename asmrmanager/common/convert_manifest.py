@@ -0,0 +1,103 @@
+"""
+manifest of the finished audio conversions.
+
+a job is keyed by the source (size, mtime and a hash of its head and tail),
+the codec arguments and the ffmpeg version, the entry records the output
+path with its size, mtime and checksum. a job whose output is still there
+and unchanged is skipped, so an interrupted `utils convert` or `file store`
+restarts where it stopped. entries are appended as json lines, the last
+one of a key wins.
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List
+
+import xxhash
+
+from asmrmanager.logger import logger
+
+# bytes hashed at both ends of the source, hashing whole multi-GB wavs
+# would cost as much reading as the conversion itself
+SAMPLE_SIZE = 1 << 20
+CHUNK_SIZE = 1 << 20
+
+
+def file_checksum(path: Path) -> str:
+    h = xxhash.xxh128()
+    with path.open("rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def source_fingerprint(path: Path) -> str:
+    stat = path.stat()
+    h = xxhash.xxh128(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    with path.open("rb") as f:
+        h.update(f.read(SAMPLE_SIZE))
+        if stat.st_size > 2 * SAMPLE_SIZE:
+            f.seek(-SAMPLE_SIZE, os.SEEK_END)
+            h.update(f.read(SAMPLE_SIZE))
+    return h.hexdigest()
+
+
+class ConversionManifest:
+    def __init__(self, path: Path, encoder_version: str):
+        self.path = path
+        self.encoder_version = encoder_version
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if path.exists():
+            with path.open(encoding="utf8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.entries[entry["key"]] = entry
+                    except (ValueError, KeyError):
+                        continue  # torn line of an interrupted write
+
+    def key(self, src: Path, convert_args: List[str]) -> str:
+        return xxhash.xxh128_hexdigest(
+            "\0".join(
+                [source_fingerprint(src), self.encoder_version, *convert_args]
+            ).encode()
+        )
+
+    def is_done(self, key: str, dst: Path) -> bool:
+        """whether the output of the job `key` is `dst` and unchanged"""
+        entry = self.entries.get(key)
+        if entry is None or entry["dst"] != str(dst) or not dst.exists():
+            return False
+        stat = dst.stat()
+        if (stat.st_size, stat.st_mtime_ns) == (
+            entry["size"],
+            entry["mtime_ns"],
+        ):
+            return True
+        # touched but maybe not changed, e.g. copied with a new mtime
+        return (
+            stat.st_size == entry["size"]
+            and file_checksum(dst) == entry["checksum"]
+        )
+
+    def record(self, key: str, src: Path, dst: Path):
+        stat = dst.stat()
+        entry = {
+            "key": key,
+            "src": str(src),
+            "dst": str(dst),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "checksum": file_checksum(dst),
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.entries[key] = entry
+            try:
+                with self.path.open("a", encoding="utf8") as f:
+                    f.write(line)
+            except OSError as e:
+                logger.warning(f"failed to write conversion manifest: {e}")
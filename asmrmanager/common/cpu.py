@@ -0,0 +1,146 @@
+"""
+cpu (and memory) detection and budgeting for the cpu bound jobs (like
+ffmpeg).
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+
+from asmrmanager.logger import logger
+
+
+def _cgroup_cpu_quota() -> float | None:
+    """cpus allowed by the cgroup (v2 or v1) quota, None if unlimited"""
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()[:2]
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        quota = Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read_text()
+        period = Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read_text()
+        if int(quota) > 0:
+            return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def available_cpus() -> int:
+    """cpus this process can use, honouring the affinity and cgroup quota"""
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on windows and macos
+        count = os.cpu_count() or 1
+    if (quota := _cgroup_cpu_quota()) is not None:
+        count = min(count, max(1, round(quota)))
+    return count
+
+
+def _cgroup_memory_free() -> int | None:
+    """bytes left below the cgroup (v2 or v1) limit, None if unlimited"""
+    for limit_file, usage_file in (
+        ("memory.max", "memory.current"),
+        ("memory/memory.limit_in_bytes", "memory/memory.usage_in_bytes"),
+    ):
+        try:
+            limit = Path("/sys/fs/cgroup", limit_file).read_text().strip()
+            usage = Path("/sys/fs/cgroup", usage_file).read_text().strip()
+        except OSError:
+            continue
+        # v1 reports no limit as a huge number
+        if limit == "max" or int(limit) >= 1 << 60:
+            return None
+        return max(0, int(limit) - int(usage))
+    return None
+
+
+def available_memory() -> int | None:
+    """bytes of memory available to new processes, None if unknown"""
+    available = None
+    try:
+        for line in Path("/proc/meminfo").read_text().splitlines():
+            if line.startswith("MemAvailable:"):
+                available = int(line.split()[1]) * 1024
+                break
+    except OSError:
+        try:
+            available = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf(
+                "SC_PAGE_SIZE"
+            )
+        except (AttributeError, ValueError, OSError):  # windows
+            pass
+    if (free := _cgroup_memory_free()) is not None:
+        available = free if available is None else min(available, free)
+    return available
+
+
+class CpuBudget:
+    """
+    cpu threads shared by the running jobs, a job takes as many as its
+    process will use. the limit starts at the number of cpus and is tuned
+    by hill climbing on the throughput (work done per second) observed
+    over windows of finished jobs, between half and twice the cpus, since
+    jobs also wait for the disk.
+    """
+
+    def __init__(self, cpus: int):
+        self.cpus = cpus
+        self.limit = cpus
+        self.min_limit = max(1, cpus // 2)
+        self.max_limit = 2 * cpus
+        self.used = 0
+        self.cond = threading.Condition()
+        self._step = 1
+        self._last_throughput: float | None = None
+        self._window_start = time.perf_counter()
+        self._window_work = 0.0
+        self._window_jobs = 0
+
+    def acquire(self, threads: int) -> int:
+        """block until `threads` are free, return the number taken"""
+        with self.cond:
+            threads = min(threads, self.limit)
+            while self.used + threads > self.limit:
+                self.cond.wait()
+            self.used += threads
+            return threads
+
+    def release(self, threads: int, work: float = 0):
+        """give back the threads of a job which has done `work`"""
+        with self.cond:
+            self.used -= threads
+            self._observe(work)
+            self.cond.notify_all()
+
+    def _observe(self, work: float):
+        if work <= 0:
+            return
+        self._window_work += work
+        self._window_jobs += 1
+        if self._window_jobs < max(4, self.limit):
+            return
+        now = time.perf_counter()
+        throughput = self._window_work / max(now - self._window_start, 1e-6)
+        if (
+            self._last_throughput is not None
+            and throughput < self._last_throughput
+        ):
+            self._step = -self._step  # the last move made it worse
+        self._last_throughput = throughput
+        limit = min(
+            max(self.limit + self._step, self.min_limit), self.max_limit
+        )
+        if limit != self.limit:
+            logger.debug(
+                f"throughput {throughput:.1f}/s, concurrency limit"
+                f" {self.limit} -> {limit}"
+            )
+            self.limit = limit
+        self._window_start = now
+        self._window_work = 0
+        self._window_jobs = 0
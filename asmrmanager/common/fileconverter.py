@@ -1,12 +1,29 @@
-import asyncio
+import os
+import queue
 import re
+import threading
+from collections import deque
+from concurrent.futures import (
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
 from pathlib import Path
 from shutil import which
-from typing import Any, Literal
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, Literal, Set
 
 from rich.console import Console
 from rich.table import Column
 
+from asmrmanager.common import flac_encoder
+from asmrmanager.common.convert_manifest import ConversionManifest
+from asmrmanager.common.cpu import CpuBudget, available_cpus
+from asmrmanager.logger import logger
+
+if TYPE_CHECKING:
+    from asmrmanager.database.media_index import MediaInfo
+
 
 def convert_vtt2lrc(vtt_path: Path):
     from .vtt2lrc import vtt2lrc
@@ -33,9 +50,74 @@ def convert_vtt2lrc(vtt_path: Path):
         f.write(lrc_content)
 
 
+AudioFormat = Literal["mp3", "flac", "m4a", "wav"]
+
+CODEC_ARGS: Dict[str, List[str]] = {
+    "mp3": ["mp3", "-ab", "320k"],
+    "flac": ["flac", "-compression_level", "5"],
+    "wav": ["pcm_s16le"],
+    "m4a": ["aac", "-ab", "320k"],
+}
+
+# threads given to one ffmpeg process, lame and pcm are single threaded,
+# the flac and aac encoders (with the decoder) make use of a second one
+CODEC_THREADS: Dict[str, int] = {
+    "mp3": 1,
+    "flac": 2,
+    "wav": 1,
+    "m4a": 2,
+}
+
+
+def ffmpeg_version() -> str:
+    from subprocess import run
+
+    res = run(
+        ["ffmpeg", "-hide_banner", "-version"],
+        capture_output=True,
+        text=True,
+        errors="ignore",
+    )
+    return res.stdout.split("\n", 1)[0]
+
+
+def default_workers() -> int:
+    return available_cpus()
+
+
+def _indexed_info(path: Path) -> "MediaInfo | None":
+    """the info of `path` in the media index, without probing it"""
+    try:
+        from asmrmanager.database.media_index import MediaIndex
+
+        return MediaIndex.get_index().lookup(path)
+    except Exception as e:
+        logger.debug(f"media index unavailable: {e}")
+        return None
+
+
 class AudioConverter:
+    """
+    process-wide conversion service, all the conversions (of every work in a
+    `file store` or `utils convert` run) share one job queue, one pool of
+    ffmpeg workers and one progress display. get it with `get_converter`
+    and enter it to show the progress, the outermost `with` waits for all
+    the jobs before it exits.
+
+    the ffmpeg processes draw their threads from a `CpuBudget` of
+    `workers` cpus, so the pool runs as many jobs as the codec allows.
+    the lossless wav to flac jobs are encoded by `flac_encoder` in a pool of
+    processes instead (when soundfile is installed), which also works
+    without ffmpeg.
+    """
+
+    _instance: "AudioConverter | None" = None
+
     def __init__(
-        self, title: str, threads: int = 6, refresh_per_second: int = 10
+        self,
+        title: str = "Audio conversion",
+        workers: int | None = None,
+        refresh_per_second: int = 10,
     ):
         from rich.live import Live
         from rich.panel import Panel
@@ -48,12 +130,31 @@ class AudioConverter:
             TimeRemainingColumn,
         )
 
-        if which("ffmpeg") is None:
+        self.ffmpeg = which("ffmpeg") is not None
+        if not self.ffmpeg and not flac_encoder.available():
             raise FileNotFoundError(
                 "ffmpeg not found, please make sure you have ffmpeg installed and"
                 " add it to your path"
             )
 
+        from asmrmanager.filemanager.manager import FileManager
+
+        self.manifest = ConversionManifest(
+            FileManager.DATA_PATH / "conversions.jsonl",
+            ffmpeg_version() if self.ffmpeg else "",
+        )
+        self.workers = workers or default_workers()
+        self.budget = CpuBudget(self.workers)
+        # the budget limits the running jobs, the pool only has to be large
+        # enough for the highest limit it can reach
+        self.executor = ThreadPoolExecutor(
+            self.budget.max_limit, thread_name_prefix="asmr-convert"
+        )
+        # process pool of the native encoder, created on the first flac job,
+        # each running job counts its frames in a slot of `frames_done`
+        self.process_pool: ProcessPoolExecutor | None = None
+        self.frames_done: Any = None
+        self.free_slots: queue.SimpleQueue[int] = queue.SimpleQueue()
         self.console = Console()
         self.progress = Progress(
             TextColumn(
@@ -67,15 +168,22 @@ class AudioConverter:
         )
         self.panel = Panel.fit(self.progress, title=title, border_style="blue")
         self.panel.subtitle = "Progress: [green]?[green]/?"
-        self.semophore = asyncio.Semaphore(threads)
         self.live = Live(
             self.panel, refresh_per_second=refresh_per_second, transient=True
         )
+        self.lock = threading.Lock()
+        self.pending: Set[Future] = set()
+        self.entered = 0
         self.tasks_total = 0
         self.tasks_done = 0
 
+    @classmethod
+    def get_converter(cls) -> "AudioConverter":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
     def update_total_progress(self):
-        self.tasks_done += 1
         if self.tasks_total > 0:
             self.panel.subtitle = (
                 f"Progress: [green bold]{self.tasks_done}[/green bold]"
@@ -85,59 +193,225 @@ class AudioConverter:
             self.panel.subtitle = "Progress: [green bold]?[/green bold]/?"
 
     def __enter__(self) -> "AudioConverter":
-        self.live.__enter__()
+        with self.lock:
+            self.entered += 1
+            if self.entered == 1:
+                self.live.__enter__()
         return self
 
     def __exit__(self, exc_type: Any, exc_val: Any, exc_tb: Any) -> None:
+        with self.lock:
+            self.entered -= 1
+            outermost = self.entered == 0
+        if not outermost:
+            return
+        self.join()
         self.live.__exit__(exc_type, exc_val, exc_tb)
+        self.tasks_total = self.tasks_done = 0
+
+    def submit(
+        self, src: Path, dst: AudioFormat = "mp3", remove_src: bool = False
+    ) -> "Future[Path]":
+        """
+        queue the conversion of `src` to the format `dst`, the future gives
+        the converted path. with `remove_src` the source is removed once
+        converted successfully
+        """
+        dst_path = src.with_suffix(f".{dst}")
+        with self.lock:
+            self.tasks_total += 1
+            self.update_total_progress()
+            future = self.executor.submit(
+                self._run_job,
+                src,
+                dst_path,
+                CODEC_ARGS[dst],
+                CODEC_THREADS[dst],
+                remove_src,
+            )
+            self.pending.add(future)
+        future.add_done_callback(self._job_done)
+        return future
+
+    def _job_done(self, future: Future):
+        with self.lock:
+            self.pending.discard(future)
+            self.tasks_done += 1
+            self.update_total_progress()
 
     def convert(
-        self, *src: Path, dst: Literal["mp3", "flac", "m4a", "wav"] = "mp3"
-    ):
-        self.tasks_total = len(src)
-        self.tasks_done = 0
-        self.update_total_progress()
-
-        match dst.lower():
-            case "mp3":
-                convert_args = ["mp3", "-ab", "320k"]
-            case "flac":
-                convert_args = ["flac", "-compression_level", "5"]
-            case "wav":
-                convert_args = ["pcm_s16le"]
-            case "m4a":
-                convert_args = ["aac", "-ab", "320k"]
-            case _:
-                assert False
-
-        async def _entry():
-            async def thread(*args, **kwargs):
-                async with self.semophore:
-                    return await asyncio.to_thread(
-                        self.__convert, *args, **kwargs
-                    )
+        self,
+        *src: Path,
+        dst: AudioFormat = "mp3",
+        remove_src: bool = False,
+    ) -> List[Path]:
+        """convert the files (except those already in `dst`) and wait"""
+        futures = [
+            self.submit(p, dst, remove_src)
+            for p in src
+            if not p.is_dir() and p.suffix.lower() != f".{dst}"
+        ]
+        wait(futures)
+        return [f.result() for f in futures]
 
-            await asyncio.gather(
-                *map(
-                    lambda x: thread(
-                        x, x.with_suffix(f".{dst}"), convert_args
-                    ),
-                    filter(
-                        lambda p: (
-                            not p.is_dir() and p.suffix.lower() != f".{dst}"
-                        ),
-                        src,
-                    ),
-                )
+    def join(self):
+        """wait for all the queued jobs"""
+        while True:
+            with self.lock:
+                pending = list(self.pending)
+            if not pending:
+                return
+            wait(pending)
+
+    def _run_job(
+        self,
+        src: Path,
+        dst: Path,
+        convert_args: List[str],
+        threads: int,
+        remove_src: bool,
+    ) -> Path:
+        wav_info = (
+            flac_encoder.wav_info(src) if dst.suffix == ".flac" else None
+        )
+        if wav_info is not None:
+            # keyed apart from the ffmpeg jobs of the same source
+            convert_args = [
+                "libsndfile",
+                flac_encoder.encoder_version(),
+                wav_info.subtype,
+            ]
+            threads = flac_encoder.segment_count(wav_info, self.workers)
+        elif not self.ffmpeg:
+            raise FileNotFoundError(
+                f"ffmpeg not found, can not convert {src} to {dst.suffix}"
             )
+        key = self.manifest.key(src, convert_args)
+        if self.manifest.is_done(key, dst):
+            logger.info("Already converted, skipping: %s", src)
+        else:
+            # write to a temporary name, so `dst` is either complete or absent
+            tmp = dst.with_name(f".{dst.stem}.converting{dst.suffix}")
+            threads = self.budget.acquire(threads)
+            seconds: float = 0
+            try:
+                if wav_info is not None:
+                    seconds = self._encode_flac(src, tmp, wav_info, threads)
+                else:
+                    seconds = self.__convert(src, tmp, convert_args, threads)
+                os.replace(tmp, dst)
+            finally:
+                self.budget.release(threads, seconds)
+                tmp.unlink(missing_ok=True)
+            self.manifest.record(key, src, dst)
+        if remove_src:
+            logger.info("Removing old file: %s", src)
+            src.unlink()
+        return dst
+
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        with self.lock:
+            if self.process_pool is None:
+                from multiprocessing import Array
 
-        asyncio.run(_entry())
+                slots = self.budget.max_limit
+                self.frames_done = Array("q", slots)
+                for slot in range(slots):
+                    self.free_slots.put(slot)
+                self.process_pool = ProcessPoolExecutor(
+                    self.workers,
+                    initializer=flac_encoder.init_worker,
+                    initargs=(self.frames_done,),
+                )
+            return self.process_pool
+
+    def _encode_flac(
+        self,
+        src: Path,
+        dst: Path,
+        wav_info: flac_encoder.WavInfo,
+        segment_count: int = 1,
+    ) -> float:
+        """
+        encode with `flac_encoder`, in `segment_count` parallel segments
+        joined afterwards, return the duration of `src`
+        """
+        from asmrmanager.common.flac_join import FlacJoinError, join_flac
 
-    def __convert(self, src: Path, dst: Path, convert_args: list[str]):
+        pool = self._get_process_pool()
+        slot = self.free_slots.get()
+        self.frames_done[slot] = 0
+        task_id = self.progress.add_task(
+            str(src.name), total=wav_info.frames, start=True
+        )
+        ranges = flac_encoder.segments(wav_info, segment_count)
+        parts = (
+            [dst.with_name(f"{dst.name}.{i}") for i in range(len(ranges))]
+            if len(ranges) > 1
+            else [dst]
+        )
+        futures: List[Future] = []
+        try:
+            futures.extend(
+                pool.submit(
+                    flac_encoder.encode_flac, src, part, slot, start, stop
+                )
+                for part, (start, stop) in zip(parts, ranges)
+            )
+            while True:
+                done, not_done = wait(futures, timeout=0.2)
+                for future in done:
+                    future.result()  # raise the error of a failed segment
+                if not not_done:
+                    break
+                self.progress.update(task_id, completed=self.frames_done[slot])
+            if len(parts) > 1:
+                try:
+                    frames = join_flac(parts, dst)
+                except FlacJoinError as e:
+                    logger.warning(
+                        f"failed to join the segments of {src} ({e}),"
+                        " encoding it as a whole"
+                    )
+                    self.frames_done[slot] = 0
+                    futures.append(
+                        pool.submit(flac_encoder.encode_flac, src, dst, slot)
+                    )
+                    futures[-1].result()
+                else:
+                    if frames != wav_info.frames:
+                        raise RuntimeError(
+                            f"sample count mismatch after joining {src}:"
+                            f" {frames} != {wav_info.frames}"
+                        )
+        except BaseException:
+            # the segments still running write to the parts and report to
+            # the slot, so they must be finished before either is reused
+            for future in futures:
+                future.cancel()
+            wait(futures)
+            raise
+        finally:
+            self.progress.remove_task(task_id)
+            self.free_slots.put(slot)
+            if len(parts) > 1:
+                for part in parts:
+                    part.unlink(missing_ok=True)
+        return wav_info.frames / wav_info.samplerate
+
+    def __convert(
+        self, src: Path, dst: Path, convert_args: list[str], threads: int
+    ) -> int:
+        """run ffmpeg, return the duration of `src` in seconds"""
         from subprocess import PIPE, Popen
 
         total_seconds = None
         task_id = None
+        if (info := _indexed_info(src)) is not None:
+            total_seconds = int(info.duration)
+            task_id = self.progress.add_task(
+                str(src.name), total=total_seconds, start=True
+            )
         # prog = ffmpeg(f"output_{id_}.mp3", _iter="err")
         prog = Popen(
             [
@@ -148,6 +422,8 @@ class AudioConverter:
                 "pipe:2",
                 "-i",
                 src,
+                "-threads",
+                str(threads),
                 "-acodec",
                 *convert_args,
                 dst,
@@ -159,11 +435,13 @@ class AudioConverter:
             errors="ignore",  # ignore broken metadata
         )
         assert prog.stderr is not None, "Process stderr is None"
+        tail: Deque[str] = deque(maxlen=5)
         for line in prog.stderr:
             assert isinstance(line, str)
             line = line.strip()
+            tail.append(line)
             # Duration: 01:00:00.00
-            if line.startswith("Duration: "):
+            if line.startswith("Duration: ") and task_id is None:
                 duration = re.search(r"Duration: (\d+):(\d+):(\d+\.\d+)", line)
                 if duration:
                     hours, minutes, seconds = map(float, duration.groups())
@@ -173,9 +451,7 @@ class AudioConverter:
                         total=total_seconds,
                         start=True,
                     )
-            elif line.startswith("out_time="):
-                assert total_seconds is not None, "Total seconds not set"
-                assert task_id is not None, "Task ID not set"
+            elif line.startswith("out_time=") and task_id is not None:
                 out_time = re.search(r"out_time=(\d+):(\d+):(\d+\.\d+)", line)
                 if out_time:
                     hours, minutes, seconds = map(float, out_time.groups())
@@ -184,6 +460,11 @@ class AudioConverter:
                     )
                     self.progress.update(task_id, completed=current_seconds)
 
-        assert task_id is not None, "Task ID not set"
-        self.progress.remove_task(task_id)
-        self.update_total_progress()
+        if task_id is not None:
+            self.progress.remove_task(task_id)
+        if prog.wait() != 0:
+            raise RuntimeError(
+                f"ffmpeg failed to convert {src} (exit code"
+                f" {prog.returncode}): {' '.join(tail)}"
+            )
+        return total_seconds or 0
@@ -0,0 +1,112 @@
+"""
+in-process wav to flac encoder on top of soundfile (libsndfile).
+
+the lossless wav to flac jobs skip ffmpeg: the wav is read in blocks and
+written as flac by a worker of a process pool, which reports the frames
+done through a shared counter array, one slot per running job. long wavs
+are cut into segments encoded by several workers, the parts are joined by
+`flac_join`.
+"""
+
+from pathlib import Path
+from typing import Any, List, NamedTuple, Tuple
+
+try:
+    import soundfile as sf
+except (ImportError, OSError):  # not installed, or libsndfile missing
+    sf = None
+
+BLOCK_FRAMES = 1 << 16
+# a segment is at least this long, shorter files are not worth the join
+SEGMENT_SECONDS = 600
+# the segments start at multiples of the flac block size (4096 for the
+# default compression level, this also covers 1152 and 4608)
+SEGMENT_ALIGN = 36864
+# wav subtype -> flac subtype of the same samples, float and 32 bit wavs
+# are left to ffmpeg
+FLAC_SUBTYPES = {
+    "PCM_U8": "PCM_S8",
+    "PCM_S8": "PCM_S8",
+    "PCM_16": "PCM_16",
+    "PCM_24": "PCM_24",
+}
+
+# shared array of frames done, set in the worker processes
+_counters: Any = None
+
+
+class WavInfo(NamedTuple):
+    frames: int
+    samplerate: int
+    subtype: str
+
+
+def available() -> bool:
+    return sf is not None
+
+
+def encoder_version() -> str:
+    assert sf is not None
+    return sf.__libsndfile_version__
+
+
+def wav_info(src: Path) -> WavInfo | None:
+    """the info of `src` if it can be encoded here, None otherwise"""
+    if sf is None or src.suffix.lower() != ".wav":
+        return None
+    try:
+        info = sf.info(str(src))
+    except (RuntimeError, sf.LibsndfileError):
+        return None
+    if info.format != "WAV" or info.subtype not in FLAC_SUBTYPES:
+        return None
+    return WavInfo(info.frames, info.samplerate, info.subtype)
+
+
+def segment_count(info: WavInfo, workers: int) -> int:
+    """how many workers the encoding of `info` can make use of"""
+    return max(
+        1, min(workers, info.frames // (SEGMENT_SECONDS * info.samplerate))
+    )
+
+
+def segments(info: WavInfo, count: int) -> List[Tuple[int, int]]:
+    """cut the frames of `info` into `count` aligned (start, stop) ranges"""
+    step = -(-info.frames // count // SEGMENT_ALIGN) * SEGMENT_ALIGN
+    return [
+        (start, min(start + step, info.frames))
+        for start in range(0, info.frames, step)
+    ]
+
+
+def init_worker(counters: Any):
+    global _counters
+    _counters = counters
+
+
+def encode_flac(
+    src: Path, dst: Path, slot: int, start: int = 0, stop: int | None = None
+):
+    """
+    encode the frames from `start` to `stop` of `src` into `dst`, counting
+    them in `_counters[slot]`
+    """
+    assert sf is not None and _counters is not None
+    with sf.SoundFile(str(src)) as fin:
+        fin.seek(start)
+        frames = (fin.frames if stop is None else stop) - start
+        with sf.SoundFile(
+            str(dst),
+            "w",
+            samplerate=fin.samplerate,
+            channels=fin.channels,
+            format="FLAC",
+            subtype=FLAC_SUBTYPES[fin.subtype],
+        ) as fout:
+            # int32 keeps the samples exact for every subtype above
+            for block in fin.blocks(
+                BLOCK_FRAMES, frames=frames, dtype="int32"
+            ):
+                fout.write(block)
+                with _counters.get_lock():
+                    _counters[slot] += len(block)
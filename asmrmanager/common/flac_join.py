@@ -0,0 +1,267 @@
+"""
+lossless concatenation of flac files encoded from consecutive segments.
+
+the frames are copied as they are, only their headers are rewritten: the
+frame numbers of each part start at zero, so they are renumbered, and the
+crc-8 of the header and crc-16 of the frame are updated. the crc-16 is
+linear, so the new one is derived from the stored one and the header
+change without reading the frame again. every part but the last must hold
+a whole number of blocks of the same fixed block size.
+"""
+
+import mmap
+import struct
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, NamedTuple, Tuple
+
+CRC16_POLY = 0x8005
+
+
+class FlacJoinError(Exception):
+    pass
+
+
+class StreamInfo(NamedTuple):
+    min_block: int
+    max_block: int
+    samplerate: int
+    channels: int
+    bps: int
+    total_samples: int
+
+
+def _crc8(data: bytes) -> int:
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07 if crc & 0x80 else crc << 1) & 0xFF
+    return crc
+
+
+def _crc16(data: bytes) -> int:
+    crc = 0
+    for byte in data:
+        crc ^= byte << 8
+        for _ in range(8):
+            crc = (
+                (crc << 1) ^ CRC16_POLY if crc & 0x8000 else crc << 1
+            ) & 0xFFFF
+    return crc
+
+
+def _mulmod(a: int, b: int) -> int:
+    """a * b modulo the crc-16 polynomial"""
+    res = 0
+    for i in range(15, -1, -1):
+        res = (res << 1) ^ (0x18005 if res & 0x8000 else 0)
+        if b >> i & 1:
+            res ^= a
+    return res & 0xFFFF
+
+
+# x^(8 * 2^i) mod the polynomial, the effect of 2^i zero bytes on a crc
+_ZEROS = [_mulmod(1 << 8, 1)]
+for _ in range(40):
+    _ZEROS.append(_mulmod(_ZEROS[-1], _ZEROS[-1]))
+
+
+def _shift(crc: int, n: int) -> int:
+    """the crc of a message after appending `n` zero bytes"""
+    i = 0
+    while n:
+        if n & 1:
+            crc = _mulmod(crc, _ZEROS[i])
+        n >>= 1
+        i += 1
+    return crc
+
+
+def _utf8(n: int) -> bytes:
+    """the "utf-8" coding of the frame number"""
+    if n < 0x80:
+        return bytes([n])
+    for length, limit in enumerate(
+        (0x800, 0x10000, 0x200000, 0x4000000, 0x80000000), 2
+    ):
+        if n < limit:
+            break
+    else:
+        raise FlacJoinError(f"frame number too large: {n}")
+    tail = [0x80 | (n >> 6 * i) & 0x3F for i in range(length - 1)]
+    head = (0xFF00 >> length) & 0xFF | n >> 6 * (length - 1)
+    return bytes([head, *reversed(tail)])
+
+
+def _utf8_length(first: int) -> int:
+    if first < 0x80:
+        return 1
+    length = 0
+    while first & 0x80 >> length:
+        length += 1
+    if not 2 <= length <= 6:
+        raise FlacJoinError("bad frame number coding")
+    return length
+
+
+def _read_metadata(m: mmap.mmap) -> Tuple[StreamInfo, int]:
+    """the stream info and the offset of the first frame"""
+    if m[:4] != b"fLaC":
+        raise FlacJoinError("not a flac file")
+    pos, info, last = 4, None, False
+    while not last:
+        header = m[pos]
+        last = bool(header & 0x80)
+        length = int.from_bytes(m[pos + 1 : pos + 4], "big")
+        if header & 0x7F == 0:
+            min_block, max_block = struct.unpack(">HH", m[pos + 4 : pos + 8])
+            packed = int.from_bytes(m[pos + 14 : pos + 22], "big")
+            info = StreamInfo(
+                min_block,
+                max_block,
+                packed >> 44,
+                (packed >> 41 & 0x7) + 1,
+                (packed >> 36 & 0x1F) + 1,
+                packed & 0xFFFFFFFFF,
+            )
+        pos += 4 + length
+    if info is None:
+        raise FlacJoinError("missing STREAMINFO")
+    return info, pos
+
+
+def _header_length(m: mmap.mmap, pos: int) -> int:
+    """length of the frame header at `pos` without its crc-8"""
+    length = 4 + _utf8_length(m[pos + 4])
+    blocksize_code, rate_code = m[pos + 2] >> 4, m[pos + 2] & 0xF
+    length += {6: 1, 7: 2}.get(blocksize_code, 0)
+    length += {12: 1, 13: 2, 14: 2}.get(rate_code, 0)
+    return length
+
+
+def _is_frame(
+    m: mmap.mmap, pos: int, first: bytes, number: int, last: bool
+) -> bool:
+    """whether a frame header numbered `number` starts at `pos`"""
+    # the sync code, sample rate and sample size are those of the first
+    # frame, so is the block size but for the last, shorter one
+    header = m[pos : pos + 4]
+    if (
+        len(header) < 4
+        or header[:2] != first[:2]
+        or (header[2] ^ first[2]) & (0x0F if last else 0xFF)
+        or (header[3] ^ first[3]) & 0x0F
+    ):
+        return False
+    try:
+        length = _header_length(m, pos)
+    except FlacJoinError:
+        return False
+    if m[pos + 4 : pos + 4 + len(_utf8(number))] != _utf8(number):
+        return False
+    return _crc8(m[pos : pos + length]) == m[pos + length]
+
+
+def _frames(m: mmap.mmap, start: int, count: int) -> Iterator[Tuple[int, int]]:
+    """(start, end) of the `count` frames from `start`"""
+    first = m[start : start + 4]
+    if first[:2] != b"\xff\xf8":
+        raise FlacJoinError("only fixed block size streams can be joined")
+    for number in range(count):
+        if not _is_frame(m, start, first, number, number == count - 1):
+            raise FlacJoinError(f"frame {number} not found")
+        if number == count - 1:
+            yield start, len(m)
+            return
+        end = start + 1
+        while True:
+            end = m.find(b"\xff\xf8", end)
+            if end < 0:
+                raise FlacJoinError(f"frame {number + 1} not found")
+            if _is_frame(m, end, first, number + 1, number + 2 == count):
+                break
+            end += 1
+        yield start, end
+        start = end
+
+
+def _renumber(m: mmap.mmap, start: int, end: int, number: int) -> bytes:
+    length = _header_length(m, start)
+    old_header = m[start : start + length]
+    num_length = _utf8_length(old_header[4])
+    new_header = old_header[:4] + _utf8(number) + old_header[4 + num_length :]
+    new_header += bytes([_crc8(new_header)])
+    old_header += m[start + length : start + length + 1]
+    rest = end - 2 - start - len(old_header)
+    (old_crc,) = struct.unpack(">H", m[end - 2 : end])
+    new_crc = old_crc ^ _shift(_crc16(old_header) ^ _crc16(new_header), rest)
+    return (
+        new_header
+        + m[start + len(old_header) : end - 2]
+        + struct.pack(">H", new_crc)
+    )
+
+
+def _write_streaminfo(
+    f: BinaryIO, info: StreamInfo, min_frame: int, max_frame: int
+):
+    packed = (
+        info.samplerate << 44
+        | (info.channels - 1) << 41
+        | (info.bps - 1) << 36
+        | info.total_samples
+    )
+    f.write(b"fLaC")
+    f.write(bytes([0x80]) + (34).to_bytes(3, "big"))  # last block
+    f.write(struct.pack(">HH", info.min_block, info.max_block))
+    f.write(min_frame.to_bytes(3, "big") + max_frame.to_bytes(3, "big"))
+    f.write(packed.to_bytes(8, "big"))
+    f.write(bytes(16))  # md5 unknown
+
+
+def join_flac(parts: List[Path], dst: Path) -> int:
+    """concatenate the flac `parts` into `dst`, return its sample count"""
+    infos: List[StreamInfo] = []
+    maps: List[Tuple[mmap.mmap, int]] = []
+    try:
+        for part in parts:
+            with part.open("rb") as f:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            info, start = _read_metadata(m)
+            infos.append(info)
+            maps.append((m, start))
+
+        block = infos[0].max_block
+        for i, info in enumerate(infos):
+            if info[2:5] != infos[0][2:5]:
+                raise FlacJoinError(f"format of part {i} differs")
+            if info.max_block != block or (
+                i < len(infos) - 1
+                and (info.min_block != block or info.total_samples % block)
+            ):
+                raise FlacJoinError(f"part {i} is not block aligned")
+
+        total = sum(info.total_samples for info in infos)
+        with dst.open("wb") as f:
+            # written again with the frame sizes once they are known
+            _write_streaminfo(f, infos[0], 0, 0)
+            min_frame, max_frame, number = 1 << 24, 0, 0
+            for (m, start), info in zip(maps, infos):
+                count = -(-info.total_samples // block)
+                for frame_start, frame_end in _frames(m, start, count):
+                    frame = _renumber(m, frame_start, frame_end, number)
+                    f.write(frame)
+                    min_frame = min(min_frame, len(frame))
+                    max_frame = max(max_frame, len(frame))
+                    number += 1
+            f.seek(0)
+            _write_streaminfo(
+                f,
+                infos[0]._replace(min_block=block, total_samples=total),
+                min_frame,
+                max_frame,
+            )
+        return total
+    finally:
+        for m, _ in maps:
+            m.close()
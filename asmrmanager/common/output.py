@@ -1,4 +1,11 @@
 from functools import cache
+from typing import Any, Iterable, Literal, Sequence
+
+# (columns, rows) of the cover cell in tables
+COVER_CELL_SIZE = (16, 6)
+
+StreamFormat = Literal["ndjson", "csv", "tsv"]
+STREAM_FORMATS = ("ndjson", "csv", "tsv")
 
 
 @cache
@@ -64,7 +71,7 @@ def print_table(
     rows,
     raw=False,
     image_paths: list[str] | None = None,
-    image_size=(16, 6),
+    image_size=COVER_CELL_SIZE,
 ):
     if raw or not support_image():
         _print_table(titles, rows, raw)
@@ -80,3 +87,44 @@ def print_table(
         )
     else:
         _print_table(titles, rows, raw)
+
+
+def stream_table(
+    titles: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+    format_: StreamFormat,
+):
+    """
+    write each row to stdout as it arrives instead of building the whole
+    output first, for piping large results into other tools
+    """
+    import os
+    import sys
+
+    out = sys.stdout
+    try:
+        if format_ == "ndjson":
+            import json
+
+            for row in rows:
+                out.write(
+                    json.dumps(
+                        dict(zip(titles, row)), ensure_ascii=False, default=str
+                    )
+                )
+                out.write("\n")
+        else:
+            import csv
+
+            writer = csv.writer(
+                out,
+                delimiter="," if format_ == "csv" else "\t",
+                lineterminator="\n",
+            )
+            writer.writerow(titles)
+            writer.writerows(rows)
+        out.flush()
+    except BrokenPipeError:
+        # the reader (e.g. head) is gone, silence the error on exit
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, out.fileno())
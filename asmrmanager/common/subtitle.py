@@ -1,18 +1,36 @@
+import json
 import os
+import shutil
+import sys
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    wait,
+)
 from datetime import timedelta
+from multiprocessing import get_context
 from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
 
 from rich.progress import (
     BarColumn,
     Progress,
+    TaskID,
+    TaskProgressColumn,
     TextColumn,
     TimeElapsedColumn,
     TimeRemainingColumn,
 )
 
 from asmrmanager.config import config
+from asmrmanager.filemanager.manager import FileManager
 from asmrmanager.logger import logger
 
+# seconds of audio transcribed by the calibration run
+CALIBRATION_SECONDS = 30
+
 
 def format_lrc_timestamp(seconds: float) -> str:
     total_seconds = round(seconds, 2)
@@ -49,73 +67,452 @@ def format_timedelta(seconds: float) -> str:
     return " ".join(parts)
 
 
-def generate_subtitle(
-    audio_path: Path, output: Path | None, force: bool = False
-):
+def subtitle_path(audio_path: Path, output: Path | None = None) -> Path:
+    """the lrc file of `audio_path`, `output` may be a file or a folder"""
+    if output is None:
+        return audio_path.with_suffix(".lrc")
+    if output.is_dir():
+        return output / audio_path.with_suffix(".lrc").name
+    return output
+
+
+def has_subtitle(audio_path: Path) -> bool:
+    """whether `audio_path` comes with a subtitle (lrc or vtt)"""
+    return any(
+        p.exists()
+        for p in (
+            audio_path.with_suffix(".lrc"),
+            audio_path.with_suffix(".vtt"),
+            audio_path.with_name(f"{audio_path.name}.vtt"),
+        )
+    )
+
+
+def _load_model(cpu_threads: int):
     try:
         from faster_whisper import WhisperModel
     except ImportError:
         raise ImportError(
-            "faster_whisper is not installed, please install asmrmanager with subtitle"
-            " dependency."
+            "faster_whisper is not installed, please install asmrmanager"
+            " with subtitle dependency."
         )
     subtitle_config = config.subtitle_config
-
-    if output is None:
-        output_path = audio_path.with_suffix(".lrc")
-    else:
-        output_path = Path(output)
-        if output_path.is_dir():
-            output_path = output_path / audio_path.with_suffix(".lrc").name
-
-    if output_path.exists() and not force:
-        logger.info(f"Skipping {audio_path.name}: LRC file already exists")
-        return
-
-    cpu_threads = os.cpu_count() or 4
-    model = WhisperModel(
+    logger.debug(
+        f"Loading whisper model {subtitle_config.model_size} with"
+        f" {cpu_threads} CPU threads"
+    )
+    return WhisperModel(
         subtitle_config.model_size,
         device=subtitle_config.device,
         cpu_threads=cpu_threads,
     )
-    logger.debug(f"Using {cpu_threads} CPU threads for processing")
 
+
+def _uses_gpu() -> bool:
+    device = config.subtitle_config.device
+    if device != "auto":
+        return device == "cuda"
+    try:
+        import ctranslate2
+    except ImportError:  # reported when the model is loaded
+        return False
+    return ctranslate2.get_cuda_device_count() > 0
+
+
+def _duration(audio_path: Path) -> float | None:
+    from asmrmanager.database.media_index import MediaIndex
+
+    try:
+        info = MediaIndex.get_index().get(audio_path)
+    except Exception as e:  # no database yet, the progress can do without
+        logger.debug(f"media index unavailable: {e}")
+        return None
+    return info.duration if info is not None else None
+
+
+def _write_lrc(
+    model,
+    audio_path: Path,
+    output_paths: List[Path],
+    on_segment: Callable[[float], None],
+) -> float:
+    """
+    transcribe `audio_path` into the lrc `output_paths`, `on_segment` gets
+    the seconds done, return the duration
+    """
     segments, info = model.transcribe(
         str(audio_path),
-        language=subtitle_config.language,
+        language=config.subtitle_config.language,
         vad_filter=True,
     )
+    # written aside first, an interrupted file is not taken as done
+    tmp_path = output_paths[0].with_name(f".{output_paths[0].name}.part")
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for segment in segments:
+                on_segment(segment.end)
+                start_lrc = format_lrc_timestamp(segment.start)
+                text = segment.text.strip().replace("\n", " ")
+                f.write(f"[{start_lrc}] {text}\n")
+        for output_path in output_paths[1:]:
+            shutil.copyfile(tmp_path, output_path)
+        os.replace(tmp_path, output_paths[0])
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return float(info.duration)
+
+
+# the model and the shared array of seconds done, set in the workers
+_model: Any = None
+_seconds_done: Any = None
+
+
+def _init_worker(cpu_threads: int, seconds_done: Any):
+    global _model, _seconds_done
+    _seconds_done = seconds_done
+    _model = _load_model(cpu_threads)
+
+
+def _transcribe_job(
+    audio_path: Path, output_paths: List[Path], slot: int
+) -> float:
+    def on_segment(end: float):
+        _seconds_done[slot] = end
+
+    return _write_lrc(_model, audio_path, output_paths, on_segment)
+
+
+def _rss() -> int:
+    """resident memory of this process in bytes, 0 if unknown"""
+    try:
+        pages = int(Path("/proc/self/statm").read_text().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:  # windows
+        return 0
+    # the peak, close enough right after the model is loaded
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _memory_cap(footprint: int) -> int:
+    """how many replicas of `footprint` bytes fit in the free memory"""
+    from asmrmanager.common.cpu import available_memory
+
+    available = available_memory()
+    if not footprint or available is None:
+        return 1 << 16
+    # keep some room for the rest of the system
+    return max(1, int(available * 0.8) // footprint)
+
+
+_barrier: Any = None
+_rss_before = 0
+
+
+def _init_calibration_worker(cpu_threads: int, barrier: Any):
+    global _model, _barrier, _rss_before
+    _barrier = barrier
+    _rss_before = _rss()
+    _model = _load_model(cpu_threads)
+
+
+def _calibrate_job(clip) -> Tuple[float, int]:
+    """
+    transcribe `clip` at the same time as the other workers, return the
+    seconds taken and the memory taken by the model
+    """
+    language = config.subtitle_config.language
+    # warm up, the first call pays one-off costs
+    segments, _ = _model.transcribe(clip[: 5 * 16000], language=language)
+    for _ in segments:
+        pass
+    # every worker waits here, so the jobs run on distinct workers at once
+    _barrier.wait(timeout=600)
+    start = time.perf_counter()
+    segments, _ = _model.transcribe(clip, language=language)
+    for _ in segments:
+        pass
+    return time.perf_counter() - start, _rss() - _rss_before
+
+
+def _time_replicas(clip, replicas: int, threads: int) -> Tuple[float, int]:
+    """
+    the seconds `replicas` workers take to transcribe `clip` at once and
+    the largest memory footprint of their models
+    """
+    ctx = get_context("spawn")
+    with ProcessPoolExecutor(
+        replicas,
+        mp_context=ctx,
+        initializer=_init_calibration_worker,
+        initargs=(threads, ctx.Barrier(replicas)),
+    ) as pool:
+        results = list(
+            pool.map(_calibrate_job, [clip] * replicas, chunksize=1)
+        )
+    return (
+        max(elapsed for elapsed, _ in results),
+        max(footprint for _, footprint in results),
+    )
+
+
+class SubtitleService:
+    """
+    transcribe a queue of audio files into lrc files. the whisper model is
+    loaded once and kept for the next files, loading it takes longer than
+    the transcription of a track for the bigger models.
+
+    on cpu a model scales sublinearly with its threads, so the files are
+    shared by N replicas in worker processes with cpus/N threads each. N is
+    the fastest of a calibration run, where 1, 2, 4 ... replicas transcribe
+    a clip at once, kept per model, device and cpu count with the memory
+    taken by a replica, N is also capped by the free memory.
+    """
+
+    _instance: "SubtitleService | None" = None
+
+    def __init__(self):
+        from asmrmanager.common.cpu import available_cpus
+
+        self._model = None
+        self.cpus = available_cpus()
+        self.calibration_path = (
+            FileManager.DATA_PATH / "subtitle_calibration.json"
+        )
+
+    @classmethod
+    def get_service(cls) -> "SubtitleService":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @property
+    def model(self):
+        if self._model is None:
+            logger.info(
+                f"Loading whisper model {config.subtitle_config.model_size}"
+            )
+            self._model = _load_model(self.cpus)
+        return self._model
+
+    def replicas(
+        self,
+        jobs: List[Tuple[Path, List[Path]]],
+        durations: List[float | None],
+        recalibrate: bool = False,
+    ) -> int:
+        """the number of model replicas to run `jobs` with"""
+        # at least 2 threads per replica
+        max_replicas = min(len(jobs), self.cpus // 2)
+        if max_replicas <= 1 or _uses_gpu():
+            return 1
+        subtitle_config = config.subtitle_config
+        key = (
+            f"{subtitle_config.model_size}/{subtitle_config.device}"
+            f"/{self.cpus}"
+        )
+        calibrations: Dict[str, Any] = {}
+        if self.calibration_path.exists():
+            calibrations = json.loads(self.calibration_path.read_text())
+        calibration = calibrations.get(key)
+        if recalibrate or not isinstance(calibration, dict):
+            # the shortest file, the whole of it is decoded
+            sample = min(
+                zip(jobs, durations), key=lambda x: x[1] or float("inf")
+            )[0][0]
+            calibration = self.calibrate(sample, self.cpus // 2)
+            calibrations[key] = calibration
+            self.calibration_path.write_text(json.dumps(calibrations))
+        return min(
+            calibration["replicas"],
+            max_replicas,
+            _memory_cap(calibration["footprint"]),
+        )
 
-    total_duration = float(info.duration) if info.duration > 0 else 1e-6
+    def calibrate(self, sample: Path, max_replicas: int) -> Dict[str, int]:
+        """
+        time 1, 2, 4 ... replicas transcribing a clip of `sample` at once,
+        return the fastest number of replicas and the memory footprint of
+        one
+        """
+        from faster_whisper import decode_audio
 
-    with (
-        open(output_path, "w", encoding="utf-8") as f,
-        Progress(
+        logger.info("Calibrating the number of whisper model replicas")
+        # 16khz mono, as the model takes it
+        clip = decode_audio(str(sample))[: CALIBRATION_SECONDS * 16000]
+        best = {"replicas": 1, "footprint": 0}
+        best_rate = 0.0
+        replicas = 1
+        while replicas <= max_replicas:
+            elapsed, footprint = _time_replicas(
+                clip, replicas, self.cpus // replicas
+            )
+            best["footprint"] = max(best["footprint"], footprint)
+            max_replicas = min(max_replicas, _memory_cap(best["footprint"]))
+            rate = replicas / elapsed
+            logger.debug(
+                f"{replicas} replicas of {self.cpus // replicas} threads:"
+                f" {rate:.2f} clips/s, {footprint >> 20} MiB each"
+            )
+            if rate <= best_rate:
+                break
+            best["replicas"], best_rate = replicas, rate
+            replicas *= 2
+        logger.info(f"Using {best['replicas']} whisper model replicas")
+        return best
+
+    def run(
+        self,
+        jobs: List[Tuple[Path, List[Path]]],
+        replicas: int | None = None,
+        recalibrate: bool = False,
+    ):
+        """
+        transcribe the audio of each job and write the lrc to all its
+        output paths, the existence of the outputs is checked by the caller
+        """
+        durations = [_duration(audio_path) for audio_path, _ in jobs]
+        if replicas is None:
+            replicas = self.replicas(jobs, durations, recalibrate)
+        replicas = max(1, min(replicas, len(jobs)))
+        with Progress(
             TextColumn("[bold blue]\\[{task.description}]"),
             BarColumn(),
-            TextColumn("{task.completed:.1f}/{task.total:.1f}s"),
+            # the duration of a file unknown to the media index is only
+            # known once it is done
+            TaskProgressColumn(),
             TimeElapsedColumn(),
             TextColumn("<"),
             TimeRemainingColumn(),
             auto_refresh=False,
-        ) as progress,
+        ) as progress:
+            total = progress.add_task(
+                f"total ({len(jobs)} files)",
+                total=sum(d or 0 for d in durations),
+            )
+            if replicas == 1:
+                self._run(jobs, durations, progress, total)
+            else:
+                self._run_parallel(jobs, durations, replicas, progress, total)
+
+    def _run(
+        self,
+        jobs: List[Tuple[Path, List[Path]]],
+        durations: List[float | None],
+        progress: Progress,
+        total: TaskID,
     ):
-        task = progress.add_task(
-            description=audio_path.name, total=total_duration, units="s"
-        )
+        finished = 0.0
+        for (audio_path, output_paths), duration in zip(jobs, durations):
+            logger.info(f"Generating LRC file for {audio_path.name}")
+            task = progress.add_task(audio_path.name, total=duration)
+
+            def on_segment(end: float):
+                progress.update(task, completed=end)
+                progress.update(total, completed=finished + end)
+                progress.refresh()
 
-        for segment in segments:
-            progress.update(
-                task, advance=segment.end - progress.tasks[task].completed
+            duration = _write_lrc(
+                self.model, audio_path, output_paths, on_segment
             )
-            progress.refresh()
+            finished = _finish(progress, total, task, finished, duration)
+
+    def _run_parallel(
+        self,
+        jobs: List[Tuple[Path, List[Path]]],
+        durations: List[float | None],
+        replicas: int,
+        progress: Progress,
+        total: TaskID,
+    ):
+        # a fork would inherit the openmp threads of the model loaded here
+        ctx = get_context("spawn")
+        self._model = None  # the workers hold their own
+        threads = self.cpus // replicas
+        logger.info(
+            f"Transcribing with {replicas} model replicas of {threads} threads"
+        )
+        seconds_done = ctx.Array("d", replicas)
+        free_slots = list(range(replicas))
+        queued = iter(zip(jobs, durations))
+        running: Dict[Future, Tuple[int, TaskID]] = {}
+        finished = 0.0
+        pool = ProcessPoolExecutor(
+            replicas,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(threads, seconds_done),
+        )
+        try:
+            while True:
+                while free_slots:
+                    if (job := next(queued, None)) is None:
+                        break
+                    (audio_path, output_paths), duration = job
+                    slot = free_slots.pop()
+                    seconds_done[slot] = 0
+                    future = pool.submit(
+                        _transcribe_job, audio_path, output_paths, slot
+                    )
+                    running[future] = (
+                        slot,
+                        progress.add_task(audio_path.name, total=duration),
+                    )
+                if not running:
+                    break
+                done, _ = wait(
+                    running, timeout=0.2, return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    slot, task = running.pop(future)
+                    free_slots.append(slot)
+                    finished = _finish(
+                        progress, total, task, finished, future.result()
+                    )
+                for slot, task in running.values():
+                    progress.update(task, completed=seconds_done[slot])
+                progress.update(
+                    total,
+                    completed=finished
+                    + sum(seconds_done[slot] for slot, _ in running.values()),
+                )
+                progress.refresh()
+        except BaseException:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        pool.shutdown()
 
-            start_lrc = format_lrc_timestamp(segment.start)
-            text = segment.text.strip().replace("\n", " ")
-            f.write(f"[{start_lrc}] {text}\n")
 
-        if progress.tasks[task].completed < total_duration:
-            progress.update(
-                task,
-                advance=total_duration - progress.tasks[task].completed,
-            )
+def _finish(
+    progress: Progress,
+    total: TaskID,
+    task: TaskID,
+    finished: float,
+    duration: float,
+) -> float:
+    """close the task of a file of `duration`, return the seconds finished"""
+    # the estimate of the media index (if any) replaced by the duration
+    tasks = {t.id: t for t in progress.tasks}
+    progress.update(
+        total,
+        total=(tasks[total].total or 0) - (tasks[task].total or 0) + duration,
+    )
+    progress.remove_task(task)
+    finished += duration
+    progress.update(total, completed=finished)
+    progress.refresh()
+    return finished
+
+
+def generate_subtitle(
+    audio_path: Path, output: Path | None, force: bool = False
+):
+    output_path = subtitle_path(audio_path, output)
+    if output_path.exists() and not force:
+        logger.info(f"Skipping {audio_path.name}: LRC file already exists")
+        return
+    SubtitleService.get_service().run([(audio_path, [output_path])])
@@ -1,7 +1,8 @@
+import time
 import uuid
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import NewType, TypedDict
+from typing import Any, Dict, List, NewType, NotRequired, TypedDict
 
 SourceID = NewType("SourceID", int)
 SourceName = NewType("SourceName", str)
@@ -34,8 +35,57 @@ class PlayListItem:
             "latest_work_id": self.latest_work_id,
         }
 
+    @classmethod
+    def fromdict(cls, d: Dict[str, Any]) -> "PlayListItem":
+        return cls(
+            id=uuid.UUID(d["id"]),
+            name=d["name"],
+            privacy=PRIVACY(d["privacy"]),
+            desc=d["desc"],
+            works_count=d["works_count"],
+            latest_work_id=d.get("latest_work_id"),
+        )
+
+
+@dataclass
+class PlayListCache:
+    playlists: List[PlayListItem]
+    total: int
+    synced_at: float = field(default_factory=time.time)
+
+    TTL = 24 * 60 * 60
+
+    def __post_init__(self):
+        self.by_id = {p.id: p for p in self.playlists}
+        self.by_name: Dict[str, PlayListItem] = {}
+        for p in self.playlists:
+            # names may duplicate, the first one wins
+            self.by_name.setdefault(p.name, p)
+
+    @property
+    def expired(self) -> bool:
+        return time.time() - self.synced_at > self.TTL
+
+    def asdict(self):
+        return {
+            "total": self.total,
+            "synced_at": self.synced_at,
+            "playlists": [p.asdict() for p in self.playlists],
+        }
+
+    @classmethod
+    def fromdict(cls, d: Dict[str, Any]) -> "PlayListCache":
+        return cls(
+            playlists=[PlayListItem.fromdict(p) for p in d["playlists"]],
+            total=d["total"],
+            synced_at=d["synced_at"],
+        )
+
 
 class RecoverRecord(TypedDict):
     path: str
     url: str
     should_download: bool
+    fileId: NotRequired[int]
+    # xxh128 of the raw file, for the ones converted while downloading
+    hash: NotRequired[str]
@@ -26,13 +26,16 @@ class Config:
     display_cover: bool
     editor: str
     filename_filters: List["Filter"]
-    download_method: Literal["aria2", "idm"]
+    download_method: Literal["aria2", "idm", "native"]
     idm_install_path: str | None
     aria2_config: "Aria2Config"
     subtitle_config: "SubtitleConfig"
     playlist_aliases: Dict[str, str]
+    cache_budgets: Dict[str, float]
     player: Literal["mpd", "pygame", "sounddevice"]
     mpd_config: "MPDConfig"
+    database_busy_timeout: float
+    ingest_format: Literal["flac", "mp3", "m4a"] | None
     before_store: str = ""
 
 
@@ -113,8 +116,11 @@ config = Config(
     idm_install_path=_config.get("idm_install_path", None),
     aria2_config=Aria2Config(**_config.get("aria2_config", {})),
     playlist_aliases=_config.get("playlist_aliases", {}),
+    cache_budgets=_config.get("cache_budgets", {}),
     player=_config.get("player", "sounddevice"),
     mpd_config=MPDConfig(**_config.get("mpd_config", {})),
+    database_busy_timeout=_config.get("database_busy_timeout", 10),
+    ingest_format=_config.get("ingest_format") or None,
     before_store=_config.get("before_store", ""),
     subtitle_config=SubtitleConfig(**_config.get("subtitle_config", {})),
 )
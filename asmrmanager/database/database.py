@@ -1,6 +1,14 @@
 from typing import Any
 
-from sqlalchemy import Boolean, Column, Date, ForeignKey, Integer, Text
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Date,
+    Float,
+    ForeignKey,
+    Integer,
+    Text,
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -15,7 +23,7 @@ class ASMR(Base):
     remote_id = Column(Integer, unique=True)
 
     title = Column(Text)
-    circle_name = Column(Text)  # 对应name字段
+    circle_name = Column(Text, index=True)  # 对应name字段
     tags = relationship("Tag", secondary="asmrs2tags", backref="asmrs")
     vas = relationship("VoiceActor", secondary="asmrs2vas", backref="asmrs")
     nsfw = Column(Boolean)
@@ -35,7 +43,7 @@ class ASMR(Base):
 class Tag(Base):
     __tablename__ = "tag"
     id = Column(Integer, primary_key=True, nullable=False)
-    name = Column(Text)
+    name = Column(Text, index=True)
     jp_name = Column(Text)
     cn_name = Column(Text)
     en_name = Column(Text)
@@ -49,13 +57,15 @@ class ASMRs2Tags(Base):
 
     asmr_id = Column(Integer, ForeignKey("asmr.id"), primary_key=True)
 
-    tag_id = Column(Integer, ForeignKey("tag.id"), primary_key=True)
+    tag_id = Column(
+        Integer, ForeignKey("tag.id"), primary_key=True, index=True
+    )
 
 
 class History(Base):
     __tablename__ = "history"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    asmr_id = Column(Integer, ForeignKey("asmr.id"))
+    asmr_id = Column(Integer, ForeignKey("asmr.id"), index=True)
     asmr = relationship(ASMR, backref="histories")
     date = Column(Date)
     finish = Column(Boolean, default=False)
@@ -66,7 +76,9 @@ class History(Base):
 class ASMRs2VAs(Base):
     __tablename__ = "asmrs2vas"
     asmr_id = Column(Integer, ForeignKey("asmr.id"), primary_key=True)
-    actor_id = Column(GUID, ForeignKey("voice_actor.id"), primary_key=True)
+    actor_id = Column(
+        GUID, ForeignKey("voice_actor.id"), primary_key=True, index=True
+    )
 
 
 class VoiceActor(Base):
@@ -78,5 +90,66 @@ class VoiceActor(Base):
         return str(self.name)
 
 
+class IDMapping(Base):
+    """local id to remote id of the works, including those not in asmr"""
+
+    __tablename__ = "id_mapping"
+    local_id = Column(Integer, primary_key=True)
+    remote_id = Column(Integer, index=True)
+
+
+class WorkStats(Base):
+    """precomputed per work statistics, maintained by stats.py"""
+
+    __tablename__ = "work_stats"
+    asmr_id = Column(Integer, ForeignKey("asmr.id"), primary_key=True)
+    tag_count = Column(Integer)
+    va_count = Column(Integer)
+    vas = Column(Text)  # names of the vas, separated by ", "
+    revenue = Column(Integer)  # dl_count * price
+    score = Column(Float)  # dl_count * log10(price + 1)
+    listen_count = Column(Integer)  # rows in history
+
+
+class TagStats(Base):
+    __tablename__ = "tag_stats"
+    tag_id = Column(Integer, ForeignKey("tag.id"), primary_key=True)
+    work_count = Column(Integer)
+    held_count = Column(Integer)
+    rated_count = Column(Integer)  # works with star
+    avg_star = Column(Float)
+    total_dl = Column(Integer)
+    listen_count = Column(Integer)
+
+
+class VAStats(Base):
+    __tablename__ = "va_stats"
+    actor_id = Column(GUID, ForeignKey("voice_actor.id"), primary_key=True)
+    work_count = Column(Integer)
+    held_count = Column(Integer)
+    rated_count = Column(Integer)
+    avg_star = Column(Float)
+    total_dl = Column(Integer)
+    listen_count = Column(Integer)
+
+
+class MediaFile(Base):
+    """audio files probed by the media index, see media_index.py"""
+
+    __tablename__ = "media_file"
+    path = Column(Text, primary_key=True)  # relative to download/storage
+    asmr_id = Column(Integer, index=True)
+    size = Column(Integer)
+    mtime_ns = Column(Integer)
+    duration = Column(Float)  # seconds
+    codec = Column(Text)
+    sample_rate = Column(Integer)
+    channels = Column(Integer)
+    bitrate = Column(Integer)  # bits per second
+    loudness = Column(Float)  # integrated loudness in LUFS, optional
+
+
 def bind_engine(engine):
-    Base.metadata.create_all(engine)
+    from asmrmanager.database.migrations import init_schema
+
+    init_schema(engine, Base.metadata)
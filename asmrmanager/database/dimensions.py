@@ -0,0 +1,124 @@
+"""
+in memory copy of the tag and voice actor rows for the ingest path.
+
+the same few thousand tags and vas recur across all the works, so they are
+loaded once per session and only the new or changed rows are written.
+the cache lives in `session.info` and is dropped on rollback, every write
+of these two tables should go through it to keep it in sync. rows missing
+from the cache may have been written since by another session or process,
+so they are upserted and read back.
+"""
+
+import uuid
+from typing import Any, Dict, Iterable, Tuple
+
+from sqlalchemy import event, func, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from asmrmanager.database.database import Tag, VoiceActor
+from asmrmanager.database.q_func import chunked
+
+TAG_COLUMNS = ("name", "cn_name", "jp_name", "en_name")
+# tags without i18n keep their known translations
+KEEP_IF_MISSING = ("cn_name", "jp_name", "en_name")
+
+_KEY = "asmr_dimensions"
+
+
+class DimensionCache:
+    def __init__(self, session: Session):
+        self.session = session
+        self.tags: Dict[int, Tuple[Any, ...]] = {
+            row[0]: tuple(row[1:])
+            for row in session.execute(
+                select(Tag.id, *(getattr(Tag, c) for c in TAG_COLUMNS))
+            )
+        }
+        self.vas: Dict[uuid.UUID, str] = {
+            row[0]: row[1]
+            for row in session.execute(select(VoiceActor.id, VoiceActor.name))
+        }
+
+    def write_tags(self, tags: Iterable[Dict[str, Any]]):
+        """insert or update the tags that are new or changed"""
+        new, changed = {}, {}
+        for tag in tags:
+            old = self.tags.get(tag["id"])
+            row = tuple(
+                (
+                    old[i]
+                    if old is not None
+                    and c in KEEP_IF_MISSING
+                    and tag.get(c) is None
+                    else tag.get(c)
+                )
+                for i, c in enumerate(TAG_COLUMNS)
+            )
+            if old == row:
+                continue
+            (new if old is None else changed)[tag["id"]] = row
+            self.tags[tag["id"]] = row
+        self._write(Tag, new, changed)
+
+    def write_vas(self, vas: Iterable[Dict[str, Any]]):
+        """insert or update the voice actors that are new or renamed"""
+        new, changed = {}, {}
+        for va in vas:
+            va_id = uuid.UUID(str(va["id"]))
+            old = self.vas.get(va_id)
+            if old == va["name"]:
+                continue
+            (new if old is None else changed)[va_id] = (va["name"],)
+            self.vas[va_id] = va["name"]
+        self._write(VoiceActor, new, changed)
+
+    def _write(self, model, new: Dict, changed: Dict):
+        columns = TAG_COLUMNS if model is Tag else ("name",)
+
+        def rows(d: Dict):
+            return [{"id": k, **dict(zip(columns, v))} for k, v in d.items()]
+
+        if new:
+            stmt = insert(model)
+            self.session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[model.id],
+                    set_={
+                        c: (
+                            func.coalesce(
+                                stmt.excluded[c], model.__table__.c[c]
+                            )
+                            if model is Tag and c in KEEP_IF_MISSING
+                            else stmt.excluded[c]
+                        )
+                        for c in columns
+                    },
+                ),
+                rows(new),
+            )
+            # the merged translations of a row written meanwhile
+            cache = self.tags if model is Tag else self.vas
+            for chunk in chunked(new):
+                for row in self.session.execute(
+                    select(
+                        model.id, *(getattr(model, c) for c in columns)
+                    ).where(model.id.in_(chunk))
+                ):
+                    cache[row[0]] = tuple(row[1:]) if model is Tag else row[1]
+        if changed:
+            # orm bulk update by primary key
+            self.session.execute(update(model), rows(changed))
+
+
+def get_dimensions(session: Session) -> DimensionCache:
+    """the dimension cache of `session`, loaded on first use"""
+    if (cache := session.info.get(_KEY)) is None:
+        cache = session.info[_KEY] = DimensionCache(session)
+        if not event.contains(session, "after_rollback", _drop):
+            event.listen(session, "after_rollback", _drop)
+    return cache
+
+
+def _drop(session: Session):
+    session.info.pop(_KEY, None)
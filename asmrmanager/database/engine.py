@@ -5,13 +5,26 @@ fm = FileManager.get_fm()
 _instance = None
 
 
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # wal lets readers and a writer (also of other processes) work at once,
+    # the journal mode is kept in the database file
+    dbapi_connection.execute("PRAGMA journal_mode = WAL")
+    dbapi_connection.execute("PRAGMA synchronous = NORMAL")
+
+
 def get_engine(check_same_thread: bool = False):
-    from sqlalchemy import create_engine
+    from sqlalchemy import create_engine, event
+
+    from asmrmanager.config import config
 
     if _instance is not None:
         return _instance
 
     db_path = fm.DATA_PATH / "data.db"
-    return create_engine(
-        f"sqlite:///{db_path}?check_same_thread={check_same_thread}"
+    engine = create_engine(
+        f"sqlite:///{db_path}?check_same_thread={check_same_thread}",
+        # the busy timeout of sqlite, in seconds
+        connect_args={"timeout": config.database_busy_timeout},
     )
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    return engine
@@ -0,0 +1,228 @@
+"""
+local faceted search, the counterpart of the filters of `dl search`
+compiled to sql against the local tables, so they can use the indexes on
+asmr.circle_name, asmrs2tags.tag_id, asmrs2vas.actor_id and tag.name.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Literal, Sequence, Tuple
+
+from sqlalchemy import (
+    ColumnElement,
+    Integer,
+    func,
+    or_,
+    select,
+    text,
+    tuple_,
+)
+from sqlalchemy.orm import Session
+
+from asmrmanager.database import fts
+from asmrmanager.database.database import (
+    ASMR,
+    ASMRs2Tags,
+    ASMRs2VAs,
+    MediaFile,
+    Tag,
+    VoiceActor,
+)
+
+Interval = Tuple[int | float | None, int | float | None]
+Order = Literal["id", "release", "dl_count", "price", "star", "count"]
+
+ORDERS = {
+    "id": ASMR.id,
+    "release": ASMR.release_date,
+    "dl_count": ASMR.dl_count,
+    "price": ASMR.price,
+    "star": ASMR.star,
+    "count": ASMR.count,
+}
+
+
+@dataclass
+class LocalFilter:
+    keyword: str = ""
+    tags: Sequence[str] = ()
+    no_tags: Sequence[str] = ()
+    vas: Sequence[str] = ()
+    no_vas: Sequence[str] = ()
+    circle: str | None = None
+    no_circle: Sequence[str] = ()
+    # there is no age category locally, r15 and general are both not nsfw
+    age: Literal["general", "r15", "adult"] | None = None
+    no_age: Sequence[Literal["general", "r15", "adult"]] = ()
+    price: Interval = (None, None)
+    sell: Interval = (None, None)
+    star: Interval = (None, None)
+    subtitle: bool | None = None
+    # total duration of the audio files, like `10m` or `1h`, read from the
+    # media index, so works not indexed never match
+    duration: Tuple[str | None, str | None] = (None, None)
+
+    def is_empty(self) -> bool:
+        return self == LocalFilter(keyword=self.keyword)
+
+    def conditions(self, session: Session) -> List[ColumnElement[bool]]:
+        conds: List[ColumnElement[bool]] = []
+        if self.keyword.strip():
+            conds.append(_keyword_condition(session, self.keyword))
+        conds.extend(ASMR.id.in_(_works_with_tag(t)) for t in self.tags)
+        conds.extend(ASMR.id.not_in(_works_with_tag(t)) for t in self.no_tags)
+        conds.extend(ASMR.id.in_(_works_with_va(va)) for va in self.vas)
+        conds.extend(ASMR.id.not_in(_works_with_va(va)) for va in self.no_vas)
+        if self.circle is not None:
+            conds.append(ASMR.circle_name == self.circle)
+        if self.no_circle:
+            conds.append(ASMR.circle_name.not_in(self.no_circle))
+        if self.age is not None:
+            conds.append(ASMR.nsfw == (self.age == "adult"))
+        for age in self.no_age:
+            conds.append(ASMR.nsfw == (age != "adult"))
+        for column, (low, high) in (
+            (ASMR.price, self.price),
+            (ASMR.dl_count, self.sell),
+            (ASMR.star, self.star),
+        ):
+            # a:b means a <= x < b, the same as `dl search`
+            if low is not None:
+                conds.append(column >= low)
+            if high is not None:
+                conds.append(column < high)
+        if self.subtitle is not None:
+            conds.append(ASMR.has_subtitle == self.subtitle)
+        if self.duration != (None, None):
+            conds.append(ASMR.id.in_(_works_with_duration(*self.duration)))
+        return conds
+
+
+def _seconds(duration: str) -> float:
+    """`10m` or `1h` (or minutes without a unit) in seconds"""
+    if duration[-1] == "h":
+        return float(duration[:-1]) * 3600
+    return float(duration.rstrip("m")) * 60
+
+
+def _works_with_duration(low: str | None, high: str | None):
+    total = func.sum(MediaFile.duration)
+    works = select(MediaFile.asmr_id).group_by(MediaFile.asmr_id)
+    if low is not None:
+        works = works.having(total >= _seconds(low))
+    if high is not None:
+        works = works.having(total < _seconds(high))
+    return works
+
+
+def _works_with_tag(name: str):
+    return (
+        select(ASMRs2Tags.asmr_id)
+        .join(Tag, Tag.id == ASMRs2Tags.tag_id)
+        .where(
+            or_(
+                Tag.name == name,
+                Tag.cn_name == name,
+                Tag.jp_name == name,
+                Tag.en_name == name,
+            )
+        )
+    )
+
+
+def _works_with_va(name: str):
+    return (
+        select(ASMRs2VAs.asmr_id)
+        .join(VoiceActor, VoiceActor.id == ASMRs2VAs.actor_id)
+        .where(VoiceActor.name == name)
+    )
+
+
+def _keyword_condition(session: Session, keyword: str) -> ColumnElement[bool]:
+    conn = session.connection()
+    if not fts.exists(conn):
+        return or_(
+            ASMR.title.contains(keyword), ASMR.circle_name.contains(keyword)
+        )
+    where, params, _ = fts.build_match(keyword)
+    matched = (
+        text(f"SELECT rowid FROM {fts.TABLE} WHERE {where}")
+        .bindparams(**params)
+        .columns(rowid=Integer)
+        .subquery()
+    )
+    return ASMR.id.in_(select(matched.c.rowid))
+
+
+def _order_key(order: Order):
+    # keep NULLs comparable, so they are not skipped by the keyset condition
+    column = ORDERS[order]
+    return column if order == "id" else func.coalesce(column, 0)
+
+
+def iter_works(
+    session: Session,
+    filter_: LocalFilter,
+    columns: Sequence[str],
+    order: Order = "release",
+    asc: bool = False,
+    limit: int = 100,
+    after: int | None = None,
+) -> Iterator[Tuple[Any, ...]]:
+    """
+    iterate `columns` of the works matching `filter_` as the rows arrive,
+    `after` is the id of the last work of the previous page (keyset
+    pagination), `limit` 0 means no limit
+    """
+    key = _order_key(order)
+    stmt = select(*(getattr(ASMR, c) for c in columns)).where(
+        *filter_.conditions(session)
+    )
+    if after is not None:
+        after_key = (
+            select(key).where(ASMR.id == after).scalar_subquery()
+            if order != "id"
+            else after
+        )
+        if asc:
+            stmt = stmt.where(tuple_(key, ASMR.id) > tuple_(after_key, after))
+        else:
+            stmt = stmt.where(tuple_(key, ASMR.id) < tuple_(after_key, after))
+    if asc:
+        stmt = stmt.order_by(key.asc(), ASMR.id.asc())
+    else:
+        stmt = stmt.order_by(key.desc(), ASMR.id.desc())
+    if limit:
+        stmt = stmt.limit(limit)
+    return (tuple(row) for row in session.execute(stmt))
+
+
+def facet_counts(
+    session: Session, filter_: LocalFilter, top: int = 10
+) -> Dict[str, List[Tuple[str, int]]]:
+    """the most common tags, vas and circles of the matched works"""
+    matched = select(ASMR.id).where(*filter_.conditions(session))
+    count = func.count().label("count")
+    tags = (
+        select(Tag.name, count)
+        .join(ASMRs2Tags, ASMRs2Tags.tag_id == Tag.id)
+        .where(ASMRs2Tags.asmr_id.in_(matched))
+        .group_by(Tag.id)
+    )
+    vas = (
+        select(VoiceActor.name, count)
+        .join(ASMRs2VAs, ASMRs2VAs.actor_id == VoiceActor.id)
+        .where(ASMRs2VAs.asmr_id.in_(matched))
+        .group_by(VoiceActor.id)
+    )
+    circles = (
+        select(ASMR.circle_name, count)
+        .where(*filter_.conditions(session))
+        .group_by(ASMR.circle_name)
+    )
+    return {
+        name: [
+            (row[0], row[1])
+            for row in session.execute(stmt.order_by(count.desc()).limit(top))
+        ]
+        for name, stmt in (("tag", tags), ("va", vas), ("circle", circles))
+    }
@@ -0,0 +1,205 @@
+"""
+full text index of the works for `asmr query`.
+
+`asmr_fts` is a fts5 table with the trigram tokenizer (any substring of
+at least 3 characters is matched by the index), one row per work keyed by
+asmr.id. the text is normalized in python (NFKC, casefold and katakana to
+hiragana) both when indexed and when queried, so the search is width, case
+and kana insensitive. rows are refreshed by the session of
+`DataBaseManager` when works are flushed and by the bulk importer.
+"""
+
+import sqlite3
+import unicodedata
+from typing import Iterable, Iterator, Sequence, Tuple
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Connection
+
+from asmrmanager.logger import logger
+
+TABLE = "asmr_fts"
+COLUMNS = ("title", "circle_name", "tags", "vas", "comment")
+# bm25 weights of the columns above
+WEIGHTS = (10.0, 5.0, 3.0, 3.0, 1.0)
+# trigram tokenizer can only use the index for terms this long
+MIN_TERM_LENGTH = 3
+
+KATAKANA2HIRAGANA = {c: c - 0x60 for c in range(0x30A1, 0x30F7)}
+
+_DOCUMENTS_SQL = """
+SELECT
+    asmr.id,
+    asmr_normalize(asmr.title),
+    asmr_normalize(asmr.circle_name),
+    asmr_normalize((
+        SELECT group_concat(
+            coalesce(tag.name, '') || ' ' || coalesce(tag.jp_name, '') || ' '
+            || coalesce(tag.cn_name, '') || ' ' || coalesce(tag.en_name, ''),
+            ' '
+        )
+        FROM asmrs2tags JOIN tag ON tag.id = asmrs2tags.tag_id
+        WHERE asmrs2tags.asmr_id = asmr.id
+    )),
+    asmr_normalize((
+        SELECT group_concat(voice_actor.name, ' ')
+        FROM asmrs2vas
+        JOIN voice_actor ON voice_actor.id = asmrs2vas.actor_id
+        WHERE asmrs2vas.asmr_id = asmr.id
+    )),
+    asmr_normalize(asmr.comment)
+FROM asmr
+"""
+_INSERT_SQL = f"INSERT INTO {TABLE} (rowid, {', '.join(COLUMNS)}) "
+
+
+def normalize(s: str | None) -> str:
+    if not s:
+        return ""
+    return (
+        unicodedata.normalize("NFKC", s)
+        .casefold()
+        .translate(KATAKANA2HIRAGANA)
+    )
+
+
+def _register_function(conn: Connection):
+    dbapi_connection = conn.connection.driver_connection
+    assert isinstance(dbapi_connection, sqlite3.Connection)
+    dbapi_connection.create_function(
+        "asmr_normalize", 1, normalize, deterministic=True
+    )
+
+
+def supported(conn: Connection) -> bool:
+    """fts5 with the trigram tokenizer needs sqlite 3.34+"""
+    try:
+        conn.execute(
+            text(
+                "CREATE VIRTUAL TABLE temp._fts_probe"
+                " USING fts5(x, tokenize = 'trigram')"
+            )
+        )
+        conn.execute(text("DROP TABLE temp._fts_probe"))
+    except Exception as e:
+        logger.warning(f"full text search is not supported by sqlite: {e}")
+        return False
+    return True
+
+
+def exists(conn: Connection) -> bool:
+    return (
+        conn.execute(
+            text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table'"
+                " AND name = :name"
+            ),
+            {"name": TABLE},
+        ).first()
+        is not None
+    )
+
+
+def create(conn: Connection) -> bool:
+    if not supported(conn):
+        return False
+    conn.execute(
+        text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE}"
+            f" USING fts5({', '.join(COLUMNS)}, tokenize = 'trigram')"
+        )
+    )
+    return True
+
+
+def rebuild(conn: Connection):
+    _register_function(conn)
+    conn.execute(text(f"DELETE FROM {TABLE}"))
+    conn.execute(text(_INSERT_SQL + _DOCUMENTS_SQL))
+
+
+def refresh(conn: Connection, ids: Iterable[int]):
+    """reindex the given works, removed works are dropped from the index"""
+    ids = list(ids)
+    if not ids:
+        return
+    _register_function(conn)
+    delete_stmt = text(f"DELETE FROM {TABLE} WHERE rowid IN :ids").bindparams(
+        bindparam("ids", expanding=True)
+    )
+    insert_stmt = text(
+        _INSERT_SQL + _DOCUMENTS_SQL + "WHERE asmr.id IN :ids"
+    ).bindparams(bindparam("ids", expanding=True))
+    # stay under the default limit of sqlite variables
+    for i in range(0, len(ids), 500):
+        conn.execute(delete_stmt, {"ids": ids[i : i + 500]})
+        conn.execute(insert_stmt, {"ids": ids[i : i + 500]})
+
+
+def is_stale(conn: Connection) -> bool:
+    """cheap check for works added or removed behind our back"""
+    return conn.execute(
+        text(
+            f"SELECT (SELECT count(*) FROM asmr)"
+            f" != (SELECT count(*) FROM {TABLE})"
+        )
+    ).scalar_one()
+
+
+def build_match(keyword: str) -> Tuple[str, dict, bool]:
+    """
+    return the where clause and its params matching all the terms of
+    `keyword`, and whether it can be ranked. it is a phrase query on the
+    index if every term is long enough for the trigram tokenizer, otherwise
+    LIKE on the indexed text
+    """
+    terms = normalize(keyword).split()
+    if not terms:
+        return "1", {}, False
+    if all(len(t) >= MIN_TERM_LENGTH for t in terms):
+        query = " AND ".join(
+            '"{}"'.format(t.replace('"', '""')) for t in terms
+        )
+        return f"{TABLE} MATCH :query", {"query": query}, True
+
+    clauses, params = [], {}
+    for i, term in enumerate(terms):
+        for c in ("\\", "%", "_"):
+            term = term.replace(c, "\\" + c)
+        params[f"term{i}"] = f"%{term}%"
+        clauses.append(
+            "("
+            + " OR ".join(
+                f"{TABLE}.{col} LIKE :term{i} ESCAPE '\\'" for col in COLUMNS
+            )
+            + ")"
+        )
+    return " AND ".join(clauses), params, False
+
+
+def search(
+    conn: Connection, keyword: str, limit: int = 0, columns: Sequence[str] = ()
+) -> Iterator[tuple]:
+    """
+    iterate the `columns` of asmr (default only the id) of the works matching
+    `keyword` as the rows arrive, best matches first, `limit` 0 means no limit
+    """
+    from asmrmanager.database.database import ASMR
+
+    where, params, ranked = build_match(keyword)
+    columns = columns or ("id",)
+    select = ", ".join(f"asmr.{c}" for c in columns)
+    sql = (
+        f"SELECT {select} FROM {TABLE} JOIN asmr ON asmr.id = {TABLE}.rowid"
+        f" WHERE {where}"
+    )
+    if ranked:
+        sql += f" ORDER BY bm25({TABLE}, {', '.join(map(str, WEIGHTS))})"
+    else:
+        sql += " ORDER BY asmr.id"
+    if limit:
+        sql += " LIMIT :limit"
+        params["limit"] = limit
+    # typed by the model, like the orm queries (booleans are not 1 and 0)
+    stmt = text(sql).columns(*(ASMR.__table__.c[c] for c in columns))
+    return (tuple(row) for row in conn.execute(stmt, params))
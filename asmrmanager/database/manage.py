@@ -1,9 +1,23 @@
 import math
+import sqlite3
+from concurrent.futures import Future
 from datetime import date
-from typing import Any, Dict, Sequence, Union, cast
+from itertools import chain
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Sequence,
+    Tuple,
+    Union,
+    cast,
+)
 
 import sqlalchemy.orm
-from sqlalchemy import event, text
+from sqlalchemy import event, or_, text
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.engine import Engine, ResultProxy
 from sqlalchemy.engine.result import Result
 from sqlalchemy.orm import Session, sessionmaker
@@ -13,18 +27,40 @@ from asmrmanager.common.types import LocalSourceID, RemoteSourceID
 from asmrmanager.database.orm_type import ASMRInstance
 from asmrmanager.logger import logger
 
-from .database import ASMR, Tag, VoiceActor, bind_engine
+from . import fts, stats
+from .database import (
+    ASMR,
+    History,
+    IDMapping,
+    Tag,
+    VoiceActor,
+    bind_engine,
+)
 from .engine import get_engine
-from .q_func import QFunc
+from .migrations import Migration, pending_migrations, upgrade
+from .q_func import QFunc, chunked
+from .tag_strategy import TagStrategy, compile_tag_strategy
+from .utils.reindex import parse_info_rows, write_chunk
+from .writer import DatabaseWriter
 
 
 def create_math_functions_on_connect(dbapi_connection, connection_record):
-    dbapi_connection.create_function("sin", 1, math.sin)
-    dbapi_connection.create_function("cos", 1, math.cos)
-    dbapi_connection.create_function("acos", 1, math.acos)
-    dbapi_connection.create_function("radians", 1, math.radians)
-    dbapi_connection.create_function("log2", 1, math.log2)
-    dbapi_connection.create_function("log10", 1, math.log10)
+    # sqlite 3.35+ may be built with native math functions, which are much
+    # faster than python callbacks invoked row by row
+    try:
+        dbapi_connection.execute("SELECT log10(1), acos(1), radians(1)")
+        return
+    except sqlite3.OperationalError:
+        pass
+    for name, f in (
+        ("sin", math.sin),
+        ("cos", math.cos),
+        ("acos", math.acos),
+        ("radians", math.radians),
+        ("log2", math.log2),
+        ("log10", math.log10),
+    ):
+        dbapi_connection.create_function(name, 1, f, deterministic=True)
 
 
 class DataBaseManager:
@@ -34,23 +70,104 @@ class DataBaseManager:
         tag_filter: Sequence[str] = tuple(),
     ):
         self.engine = engine or get_engine()
-        event.listens_for(self.engine, "connect")(
-            create_math_functions_on_connect
-        )  # add a listener after engine created, before session created
+        if not event.contains(
+            self.engine, "connect", create_math_functions_on_connect
+        ):  # add a listener after engine created, before session created
+            event.listen(
+                self.engine, "connect", create_math_functions_on_connect
+            )
         bind_engine(self.engine)
 
         self.tag_filter = set(tag_filter)
 
         self.session: Session = sessionmaker(self.engine)()
         self.func = QFunc(self.session)
+        self._writer: DatabaseWriter | None = None
+        # (source id, future) of the infos queued to the writer, checked by
+        # `commit` so a failed write is not missed
+        self._background_writes: List[Tuple[str, Future]] = []
+
+        # keep the full text index and the statistics in sync with the
+        # works written by this session, tags and vas are the ones the works
+        # were linked to before their associations got replaced
+        self._dirty: set[int] = set()
+        self._dirty_tags: set = set()
+        self._dirty_vas: set = set()
+        event.listen(self.session, "after_flush", self._collect_dirty)
+        event.listen(self.session, "before_commit", self._refresh_derived)
+        event.listen(self.session, "after_rollback", self._clear_dirty)
+
+    def _collect_dirty(self, session: Session, _):
+        for obj in chain(session.new, session.dirty, session.deleted):
+            if isinstance(obj, ASMR):
+                self._dirty.add(obj.id)  # type: ignore
+            elif isinstance(obj, History):
+                self._dirty.add(obj.asmr_id)  # type: ignore
+
+    def _refresh_derived(self, session: Session):
+        session.flush()
+        if not self._dirty:
+            return
+        conn = session.connection()
+        if fts.exists(conn):
+            fts.refresh(conn, self._dirty)
+        stats.refresh(conn, self._dirty, self._dirty_tags, self._dirty_vas)
+        self._clear_dirty(session)
+
+    def _clear_dirty(self, _):
+        self._dirty.clear()
+        self._dirty_tags.clear()
+        self._dirty_vas.clear()
+
+    def search(
+        self, keyword: str, limit: int = 0, columns: Sequence[str] = ()
+    ) -> Iterator[tuple]:
+        """
+        full text search of title, circle, tags, vas and comment,
+        iterate the `columns` of the matched works, best matches first
+        """
+        conn = self.session.connection()
+        if not fts.exists(conn):
+            return self._search_like(keyword, limit, columns)
+        if fts.is_stale(conn):
+            logger.info("rebuilding full text index")
+            fts.rebuild(conn)
+            self.session.commit()
+            conn = self.session.connection()
+        return fts.search(conn, keyword, limit, columns)
+
+    def _search_like(
+        self, keyword: str, limit: int, columns: Sequence[str]
+    ) -> Iterator[tuple]:
+        """fallback of `search` for sqlite without fts5 trigram support"""
+        from .database import ASMRs2Tags, ASMRs2VAs
+
+        query = (
+            self.query(*(getattr(ASMR, c) for c in (columns or ("id",))))
+            .outerjoin(ASMRs2Tags, ASMRs2Tags.asmr_id == ASMR.id)
+            .outerjoin(Tag, Tag.id == ASMRs2Tags.tag_id)
+            .outerjoin(ASMRs2VAs, ASMRs2VAs.asmr_id == ASMR.id)
+            .outerjoin(VoiceActor, VoiceActor.id == ASMRs2VAs.actor_id)
+            .filter(
+                ASMR.circle_name.contains(keyword)
+                | ASMR.title.contains(keyword)
+                | Tag.name.contains(keyword)
+                | ASMR.comment.contains(keyword)
+                | VoiceActor.name.contains(keyword)
+            )
+            .group_by(ASMR.id)
+            .order_by(ASMR.id)
+        )
+        if limit:
+            query = query.limit(limit)
+        return (tuple(row) for row in query)
 
-    def check_db_updated(self):
-        from sqlalchemy import inspect
+    def pending_migrations(self) -> List[Migration]:
+        return pending_migrations(self.engine)
 
-        inspector = inspect(self.engine)
-        columns = inspector.get_columns("asmr")
-        names = [c["name"] for c in columns]
-        return "remote_id" in names
+    def migrate(self) -> List[Migration]:
+        self.session.commit()
+        return upgrade(self.engine)
 
     def check_exists(
         self, source_id: LocalSourceID | RemoteSourceID
@@ -62,6 +179,39 @@ class DataBaseManager:
             .one_or_none()
         )
 
+    def check_exists_many(
+        self, source_ids: Iterable[LocalSourceID | RemoteSourceID]
+    ) -> Dict[int, ASMRInstance]:
+        """
+        bulk version of `check_exists`, map the given ids to the existing
+        works, a local id wins over a remote id with the same value
+        """
+        res: Dict[int, ASMRInstance] = {}
+        for chunk in chunked(source_ids):
+            for asmr in self.session.query(ASMR).filter(
+                or_(ASMR.id.in_(chunk), ASMR.remote_id.in_(chunk))
+            ):
+                if asmr.remote_id in chunk:
+                    res.setdefault(asmr.remote_id, asmr)
+                if asmr.id in chunk:
+                    res[asmr.id] = asmr
+        return res
+
+    def save_id_mappings(self, mappings: Iterable[Tuple[int, int]]):
+        """persist learned (local id, remote id) pairs"""
+        values = [{"local_id": lid, "remote_id": rid} for lid, rid in mappings]
+        if not values:
+            return
+        stmt = insert(IDMapping)
+        self.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[IDMapping.local_id],
+                set_={"remote_id": stmt.excluded.remote_id},
+            ),
+            values,
+        )
+        self.session.commit()
+
     @classmethod
     def parse_info(cls, info: Dict[str, Any]) -> ASMRInstance:
         source = info.get("source_id")
@@ -103,57 +253,58 @@ class DataBaseManager:
         self,
         info: Dict[str, Any],
         check: bool = True,
-        tag_strategy: str = "common_only",
+        tag_strategy: str | TagStrategy = "common_only",
     ) -> bool:
         """
         add/update info to database and check
         if it has tag in the filter or not,
         return True if should download
         """
+        should_download = self.check_info(info, check, tag_strategy)
+        self.write_info(info)
+        return should_download
 
-        def tag_strategy_filter(tag: dict) -> bool:
-            """true if tag should be accepted and stored in database"""
-            # logger.debug(f"evaluating tag: {tag}")
-            upvote: int = tag["upvote"]
-            downvote: int = tag["downvote"]
-            voteRank: int = (
-                tag["voteRank"] if "voteRank" in tag else upvote - downvote
-            )  # voteRank may be missing
-            myVote: int = tag["myVote"]
-            voteStatus: int = tag["voteStatus"]
-            if voteRank != upvote - downvote and voteStatus != 1:
-                logger.warning(
-                    f"voteRank is not equal to upvote - downvote: {tag}"
-                )
-
-            common_only = voteStatus == 1
-            accept_all = True
-            except_rejected = voteStatus in (0, 1)
-
-            res = eval(
-                tag_strategy,
-                {
-                    "upvote": upvote,
-                    "downvote": downvote,
-                    "voteRank": voteRank,
-                    "myVote": myVote,
-                    "voteStatus": voteStatus,
-                    "common_only": common_only,
-                    "accept_all": accept_all,
-                    "except_rejected": except_rejected,
-                    "tag": tag,
-                },
+    def add_info_in_background(
+        self,
+        info: Dict[str, Any],
+        check: bool = True,
+        tag_strategy: str | TagStrategy = "common_only",
+    ) -> bool:
+        """
+        the same as `add_info`, but the info is written by the writer
+        thread, so it never blocks the caller (like the event loop)
+        """
+        should_download = self.check_info(info, check, tag_strategy)
+        self._background_writes.append(
+            (
+                info["source_id"],
+                self.writer.submit(lambda db: db.write_info(info)),
             )
-            if not res:
-                logger.info(
-                    f"tag {tag['name']} ({upvote}/{downvote}, common={common_only}) is filtered"
-                )
-            return res
+        )
+        return should_download
 
-        info["tags"] = list(filter(tag_strategy_filter, info["tags"]))
-        asmr = self.parse_info(info)
+    @property
+    def writer(self) -> DatabaseWriter:
+        if self._writer is None:
+            self._writer = DatabaseWriter(
+                lambda: DataBaseManager(self.engine, tuple(self.tag_filter))
+            )
+        return self._writer
 
-        self.session.merge(asmr)
+    def check_info(
+        self,
+        info: Dict[str, Any],
+        check: bool = True,
+        tag_strategy: str | TagStrategy = "common_only",
+    ) -> bool:
+        """
+        apply the tag strategy to the tags of `info` (in place), return True
+        if it should be downloaded according to the tag filter
+        """
+        if isinstance(tag_strategy, str):
+            tag_strategy = compile_tag_strategy(tag_strategy)
+        info["tags"] = tag_strategy.filter(info["tags"])
+        source_id = info["source_id"]
 
         # check for tag filter
         tags = [t["name"] for t in info["tags"]]
@@ -161,14 +312,37 @@ class DataBaseManager:
         if filtered_tags := self.tag_filter.intersection(tags):
             if not check:
                 logger.warning(
-                    f"Continue to download {asmr.id} though it has tags:"
+                    f"Continue to download {source_id} though it has tags:"
                     f" {filtered_tags}"
                 )
                 return True
-            logger.info(f"ignore {asmr.id} since it has tags: {filtered_tags}")
+            logger.info(
+                f"ignore {source_id} since it has tags: {filtered_tags}"
+            )
             return False
         return True
 
+    def write_info(self, info: Dict[str, Any]):
+        """add/update the info whose tags are already filtered"""
+        work = parse_info_rows(info)
+        source_id = work.asmr["id"]
+
+        # plain statements instead of merge, tags and vas are checked
+        # against the dimension cache, so usually nothing is written for them
+        tag_ids, va_ids = stats.affected(
+            self.session.connection(), [source_id]
+        )
+        self._dirty_tags.update(tag_ids)
+        self._dirty_vas.update(va_ids)
+        write_chunk(self.session, [work])
+        if (
+            asmr := self.session.identity_map.get(
+                self.session.identity_key(ASMR, source_id)
+            )
+        ) is not None:
+            self.session.expire(asmr)
+        self._dirty.add(source_id)
+
     def update_review(
         self,
         source_id: LocalSourceID,
@@ -215,5 +389,17 @@ class DataBaseManager:
         return cast(sqlalchemy.orm.Query, self.session.query(*args, **kwargs))
 
     def commit(self):
+        if self._writer is not None:
+            self._writer.flush()
         self.session.commit()
+        writes, self._background_writes = self._background_writes, []
+        # not done if the writer thread is gone
+        if failed := [
+            s for s, f in writes if not f.done() or f.exception() is not None
+        ]:
+            logger.error(
+                f"failed to write the info of {len(failed)} works:"
+                f" {', '.join(failed)}, please download them again"
+            )
+            exit(-1)
         logger.info("successfully committed")
@@ -0,0 +1,263 @@
+"""
+index of the audio files of the library.
+
+one row per file (duration, codec, sample rate, channels, bitrate, size and
+optionally the integrated loudness), keyed by its path relative to the
+download or storage path, so a stored work keeps its rows. a row is valid
+while the size and mtime of the file are unchanged. the player and the
+converter look the files up here instead of probing them, `utils index`
+fills it with a thread pool, and `query --duration` and the statistics
+scripts read the durations from it.
+"""
+
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Engine
+
+from asmrmanager.common import MUSIC_SUFFIXES
+from asmrmanager.common.rj_parse import id2source_name, source2id
+from asmrmanager.common.types import LocalSourceID
+from asmrmanager.database.database import MediaFile
+from asmrmanager.database.q_func import chunked
+from asmrmanager.filemanager.manager import FileManager
+from asmrmanager.logger import logger
+
+fm = FileManager.get_fm()
+
+_COLUMNS = (
+    "duration",
+    "codec",
+    "sample_rate",
+    "channels",
+    "bitrate",
+    "size",
+    "loudness",
+)
+
+
+class MediaInfo(NamedTuple):
+    duration: float  # seconds
+    codec: str | None
+    sample_rate: int | None
+    channels: int | None
+    bitrate: int | None  # bits per second
+    size: int
+    loudness: float | None  # LUFS
+
+
+def rel_path(path: Path) -> str | None:
+    """`path` relative to the download or storage path, None if outside"""
+    path = path.absolute()
+    for root in (fm.download_path, fm.storage_path):
+        if path.is_relative_to(root):
+            return path.relative_to(root).as_posix()
+    return None
+
+
+def probe(path: Path) -> Dict[str, Any] | None:
+    """the media info of `path` read by mutagen, None if unsupported"""
+    from mutagen import MutagenError
+    from mutagen._file import File as MutagenFile
+
+    try:
+        f = MutagenFile(path)
+    except (MutagenError, OSError) as e:
+        logger.debug(f"failed to probe {path}: {e}")
+        return None
+    if f is None or getattr(f.info, "length", None) is None:
+        return None
+    info = f.info
+    return {
+        "duration": float(info.length),
+        "codec": getattr(info, "codec", None) or type(f).__name__.lower(),
+        "sample_rate": getattr(info, "sample_rate", None),
+        "channels": getattr(info, "channels", None),
+        "bitrate": getattr(info, "bitrate", None),
+    }
+
+
+def measure_loudness(path: Path) -> float | None:
+    """integrated loudness (EBU R128) measured by ffmpeg"""
+    from shutil import which
+    from subprocess import run
+
+    if which("ffmpeg") is None:
+        return None
+    res = run(
+        [
+            "ffmpeg",
+            "-hide_banner",
+            "-nostats",
+            "-i",
+            path,
+            "-filter_complex",
+            "ebur128",
+            "-f",
+            "null",
+            "-",
+        ],
+        capture_output=True,
+        text=True,
+        errors="ignore",
+    )
+    # the summary is at the end: "I:         -23.0 LUFS"
+    found = re.findall(r"I:\s+(-?[\d.]+) LUFS", res.stderr)
+    return float(found[-1]) if res.returncode == 0 and found else None
+
+
+class MediaIndex:
+    _instance: "MediaIndex | None" = None
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.lock = threading.Lock()
+
+    @classmethod
+    def get_index(cls) -> "MediaIndex":
+        if cls._instance is None:
+            from asmrmanager.database.engine import get_engine
+
+            cls._instance = cls(get_engine())
+        return cls._instance
+
+    def lookup(self, path: Path) -> MediaInfo | None:
+        """the indexed info of `path` if it is still valid"""
+        if (rel := rel_path(path)) is None:
+            return None
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(
+                    MediaFile.mtime_ns,
+                    *(getattr(MediaFile, c) for c in _COLUMNS),
+                ).where(MediaFile.path == rel)
+            ).first()
+        if row is None or (row.size, row.mtime_ns) != (
+            stat.st_size,
+            stat.st_mtime_ns,
+        ):
+            return None
+        return MediaInfo(*row[1:])
+
+    def get(self, path: Path) -> MediaInfo | None:
+        """the info of `path`, probed and indexed if it is not yet"""
+        if (info := self.lookup(path)) is not None:
+            return info
+        if (row := self._probe_row(path, loudness=False)) is None:
+            return None
+        if row["path"] is not None:
+            self._save([row])
+        return MediaInfo(*(row[c] for c in _COLUMNS))
+
+    def update(
+        self,
+        ids: Iterable[LocalSourceID],
+        loudness: bool = False,
+        workers: int | None = None,
+        on_progress: Callable[[int, int], None] | None = None,
+    ) -> int:
+        """
+        index the audio files of the works `ids` which are new or changed,
+        drop the rows of their removed files, return the number indexed.
+        `on_progress(done, total)` is called from the caller thread
+        """
+        files: Dict[str, Path] = {}
+        ids = list(ids)
+        for name in map(id2source_name, ids):
+            for root in (fm.storage_path, fm.download_path):
+                for p in (root / name).rglob("*"):
+                    if p.suffix.lower() in MUSIC_SUFFIXES and p.is_file():
+                        files.setdefault(p.relative_to(root).as_posix(), p)
+
+        stale: List[Path] = []
+        known = set()
+        with self.engine.connect() as conn:
+            for chunk in chunked(ids):
+                for row in conn.execute(
+                    select(
+                        MediaFile.path,
+                        MediaFile.size,
+                        MediaFile.mtime_ns,
+                        MediaFile.loudness,
+                    ).where(MediaFile.asmr_id.in_(chunk))
+                ):
+                    known.add(row.path)
+                    if (p := files.get(row.path)) is None:
+                        continue
+                    stat = p.stat()
+                    if (row.size, row.mtime_ns) != (
+                        stat.st_size,
+                        stat.st_mtime_ns,
+                    ) or (loudness and row.loudness is None):
+                        stale.append(p)
+        stale.extend(p for rel, p in files.items() if rel not in known)
+        removed = known - files.keys()
+        if removed:
+            with self.engine.begin() as conn:
+                for chunk in chunked(removed):
+                    conn.execute(
+                        delete(MediaFile).where(MediaFile.path.in_(chunk))
+                    )
+
+        rows = []
+        count = 0
+        with ThreadPoolExecutor(
+            workers or min(32, (os.cpu_count() or 1) + 4),
+            thread_name_prefix="asmr-media-index",
+        ) as executor:
+            for done, row in enumerate(
+                executor.map(lambda p: self._probe_row(p, loudness), stale),
+                1,
+            ):
+                if row is not None:
+                    rows.append(row)
+                    count += 1
+                if len(rows) >= 200:
+                    self._save(rows)
+                    rows.clear()
+                if on_progress is not None:
+                    on_progress(done, len(stale))
+        self._save(rows)
+        return count
+
+    @staticmethod
+    def _probe_row(path: Path, loudness: bool) -> Dict[str, Any] | None:
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        if (info := probe(path)) is None:
+            return None
+        rel = rel_path(path)
+        return {
+            "path": rel,
+            "asmr_id": source2id(rel.split("/", 1)[0]) if rel else None,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "loudness": measure_loudness(path) if loudness else None,
+            **info,
+        }
+
+    def _save(self, rows: List[Dict[str, Any]]):
+        if not rows:
+            return
+        stmt = insert(MediaFile)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[MediaFile.path],
+            set_={
+                c: getattr(stmt.excluded, c)
+                for c in ("asmr_id", "mtime_ns", *_COLUMNS)
+            },
+        )
+        with self.lock, self.engine.begin() as conn:
+            conn.execute(stmt, rows)
@@ -0,0 +1,151 @@
+"""
+versioned schema migrations.
+
+the version of a database is kept in the `schema_version` table, a fresh
+database is created by `create_all` with the latest schema, then it and
+existing ones are upgraded by running the pending steps in order. steps
+must be idempotent, so an interrupted step is simply run again next time.
+to change the schema, update the models in database.py and register a new
+step here with the next version number.
+"""
+
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from asmrmanager.logger import logger
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    def _(f: Callable[[Connection], None]):
+        assert not MIGRATIONS or MIGRATIONS[-1].version == version - 1, (
+            "migrations must be registered in order"
+        )
+        MIGRATIONS.append(Migration(version, description, f))
+        return f
+
+    return _
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+
+def _columns(conn: Connection, table: str) -> List[str]:
+    return [
+        row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))
+    ]
+
+
+@migration(1, "add asmr.remote_id (2.0.0)")
+def _add_remote_id(conn: Connection):
+    if "remote_id" in _columns(conn, "asmr"):
+        return
+    conn.execute(text("ALTER TABLE asmr ADD COLUMN remote_id integer"))
+    conn.execute(text("UPDATE asmr SET remote_id = id"))
+    conn.execute(
+        text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_asmr_remote_id"
+            " ON asmr (remote_id)"
+        )
+    )
+
+
+@migration(2, "add indexes for tag, va, circle and history lookups")
+def _add_lookup_indexes(conn: Connection):
+    for table, column in (
+        ("asmrs2tags", "tag_id"),
+        ("asmrs2vas", "actor_id"),
+        ("asmr", "circle_name"),
+        ("tag", "name"),
+        ("history", "asmr_id"),
+    ):
+        conn.execute(
+            text(
+                f"CREATE INDEX IF NOT EXISTS ix_{table}_{column}"
+                f" ON {table} ({column})"
+            )
+        )
+    conn.execute(text("ANALYZE"))
+
+
+@migration(3, "add full text index for asmr query")
+def _add_fts(conn: Connection):
+    from asmrmanager.database import fts
+
+    if fts.create(conn):
+        fts.rebuild(conn)
+
+
+@migration(4, "add statistics tables for ranking queries")
+def _add_stats(conn: Connection):
+    from asmrmanager.database import stats
+
+    stats.rebuild(conn)
+
+
+def _ensure_version_table(conn: Connection):
+    conn.execute(
+        text(
+            "CREATE TABLE IF NOT EXISTS schema_version"
+            " (version INTEGER NOT NULL)"
+        )
+    )
+
+
+def get_version(conn: Connection) -> int:
+    if not inspect(conn).has_table("schema_version"):
+        return 0
+    return conn.execute(
+        text("SELECT coalesce(max(version), 0) FROM schema_version")
+    ).scalar_one()
+
+
+def _set_version(conn: Connection, version: int):
+    _ensure_version_table(conn)
+    conn.execute(text("DELETE FROM schema_version"))
+    conn.execute(
+        text("INSERT INTO schema_version (version) VALUES (:v)"),
+        {"v": version},
+    )
+
+
+def init_schema(engine: Engine, metadata):
+    """
+    create missing tables, a fresh database runs all the steps at once,
+    they are no-ops for the tables of the models but create what the models
+    do not cover (like the full text index)
+    """
+    with engine.begin() as conn:
+        fresh = not inspect(conn).has_table("asmr")
+        metadata.create_all(conn)
+    if fresh:
+        upgrade(engine)
+
+
+def pending_migrations(engine: Engine) -> List[Migration]:
+    with engine.connect() as conn:
+        version = get_version(conn)
+    return [m for m in MIGRATIONS if m.version > version]
+
+
+def upgrade(engine: Engine) -> List[Migration]:
+    """run the pending migrations in order, return the applied ones"""
+    applied = []
+    for m in pending_migrations(engine):
+        logger.debug(f"migrating to version {m.version}: {m.description}")
+        with engine.begin() as conn:
+            m.upgrade(conn)
+            _set_version(conn, m.version)
+        applied.append(m)
+    return applied
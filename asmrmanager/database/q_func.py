@@ -1,13 +1,25 @@
 import typing
+from typing import Dict, Iterable, List, TypeVar
 
-from sqlalchemy import func
+from sqlalchemy import func, literal, select, text, union_all
 from sqlalchemy.orm import Session
 
 from asmrmanager.common.types import LocalSourceID
 from asmrmanager.database.orm_type import ASMRInstance
 from asmrmanager.logger import logger
 
-from .database import ASMR, Tag
+from .database import ASMR, IDMapping, Tag
+
+T = TypeVar("T")
+
+# stay under the default limit of sqlite variables
+CHUNK_SIZE = 500
+
+
+def chunked(ids: Iterable[T]) -> Iterable[List[T]]:
+    items = list(ids)
+    for i in range(0, len(items), CHUNK_SIZE):
+        yield items[i : i + CHUNK_SIZE]
 
 
 class QFunc:
@@ -49,3 +61,34 @@ class QFunc:
         if res:
             return int(res.remote_id)
         return None
+
+    def get_local_ids(self, remote_ids: Iterable[int]) -> Dict[int, int]:
+        """remote id -> local id of the known ones, in one query per chunk"""
+        return self._get_mappings(
+            remote_ids,
+            (IDMapping.remote_id, IDMapping.local_id),
+            (ASMR.remote_id, ASMR.id),
+        )
+
+    def get_remote_ids(self, local_ids: Iterable[int]) -> Dict[int, int]:
+        """local id -> remote id of the known ones, in one query per chunk"""
+        return self._get_mappings(
+            local_ids,
+            (IDMapping.local_id, IDMapping.remote_id),
+            (ASMR.id, ASMR.remote_id),
+        )
+
+    def _get_mappings(self, ids: Iterable[int], mapping, asmr):
+        res: Dict[int, int] = {}
+        for chunk in chunked(ids):
+            # the works in asmr come last, so they win over the learned ones
+            stmt = union_all(
+                select(*mapping, literal(0).label("p")).where(
+                    mapping[0].in_(chunk)
+                ),
+                select(*asmr, literal(1).label("p")).where(asmr[0].in_(chunk)),
+            ).order_by(text("p"))
+            res.update(
+                (k, v) for k, v, _ in self.ss.execute(stmt) if v is not None
+            )
+        return res
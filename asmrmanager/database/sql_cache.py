@@ -0,0 +1,190 @@
+"""
+result cache of `asmr sql`.
+
+results are keyed by the normalized sql text and the version of the
+database, which changes with every committed write only: the file change
+counter in the sqlite header (bumped by the writes in rollback journal
+mode), the size and mtime of the database file (changed by the writes and
+the checkpoints in wal mode) and the committed frames of the wal file,
+identified by its salts and their count. the mtime of the wal file is not
+used, opening a connection recreates it. `PRAGMA data_version` is not used
+either as it is only meaningful within a single connection.
+"""
+
+import hashlib
+import os
+import re
+import struct
+from pathlib import Path
+from typing import Any, List, NamedTuple, Sequence
+
+from asmrmanager.filemanager.cache import CacheManager
+from asmrmanager.logger import logger
+
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<string>'(?:[^']|'')*')
+    | (?P<quoted>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+    | (?P<comment>--[^\n]*|/\*.*?(?:\*/|$))
+    | (?P<space>\s+)
+    | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    | (?P<other>.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+# statements that write, or functions whose results change by themselves
+UNCACHEABLE_WORDS = {
+    "INSERT",
+    "UPDATE",
+    "DELETE",
+    "REPLACE",
+    "CREATE",
+    "DROP",
+    "ALTER",
+    "ATTACH",
+    "DETACH",
+    "VACUUM",
+    "REINDEX",
+    "ANALYZE",
+    "PRAGMA",
+    "BEGIN",
+    "COMMIT",
+    "ROLLBACK",
+    "SAVEPOINT",
+    "RANDOM",
+    "RANDOMBLOB",
+    "CHANGES",
+    "LAST_INSERT_ROWID",
+    "TOTAL_CHANGES",
+    "CURRENT_DATE",
+    "CURRENT_TIME",
+    "CURRENT_TIMESTAMP",
+    "NOW",
+    # the date and time functions may read the clock whatever their
+    # arguments are (`date()` is today), so every call of them is excluded,
+    # see `normalize_sql`
+    "DATE()",
+    "TIME()",
+    "DATETIME()",
+    "JULIANDAY()",
+    "UNIXEPOCH()",
+    "STRFTIME()",
+    "TIMEDIFF()",
+}
+WAL_HEADER_SIZE = 32
+WAL_FRAME_HEADER_SIZE = 24
+
+
+class CachedResult(NamedTuple):
+    titles: List[str]
+    rows: List[List[Any]]
+
+
+def normalize_sql(sql: str) -> tuple[str, set[str]]:
+    """
+    drop comments and collapse whitespace outside of literals, also
+    return the upper cased words (keywords and identifiers) and the called
+    functions (like `DATE()`)
+    """
+    parts: List[str] = []
+    words: set[str] = set()
+    last_word = None
+    for m in _TOKEN_RE.finditer(sql):
+        kind = m.lastgroup
+        if kind == "comment":
+            kind = "space"
+        if kind == "space":
+            if parts and parts[-1] != " ":
+                parts.append(" ")
+            continue
+        token = m.group()
+        if token == "(" and last_word is not None:
+            words.add(f"{last_word}()")
+        last_word = None
+        if kind == "word":
+            token = token.upper()
+            words.add(token)
+            last_word = token
+        elif kind == "quoted":  # `"date"(...)` calls date too
+            last_word = token[1:-1].upper()
+        parts.append(token)
+    return "".join(parts).strip(" ;"), words
+
+
+def is_cacheable(words: set[str]) -> bool:
+    return not (words & UNCACHEABLE_WORDS)
+
+
+def _wal_frames(wal_path: Path) -> str:
+    """the salts and count of the committed frames of the wal file"""
+    try:
+        f = wal_path.open("rb")
+    except FileNotFoundError:
+        return ""
+    with f:
+        header = f.read(WAL_HEADER_SIZE)
+        if len(header) < WAL_HEADER_SIZE:
+            return ""  # empty, as just created by a connection
+        page_size, _, salts = struct.unpack(">8xII8s8x", header)
+        # a reset wal is written over from the start with new salts, the
+        # frames left of the previous generation have the old ones
+        frames = committed = 0
+        while True:
+            f.seek(
+                WAL_HEADER_SIZE + frames * (WAL_FRAME_HEADER_SIZE + page_size)
+            )
+            frame_header = f.read(WAL_FRAME_HEADER_SIZE)
+            if len(frame_header) < WAL_FRAME_HEADER_SIZE:
+                break
+            _, db_size, frame_salts = struct.unpack(">II8s8x", frame_header)
+            if frame_salts != salts:
+                break
+            frames += 1
+            if db_size:  # the last frame of a transaction
+                committed = frames
+    return f"{salts.hex()}:{committed}"
+
+
+def db_version(db_path: str | os.PathLike) -> str:
+    path = Path(db_path)
+    with path.open("rb") as f:
+        f.seek(24)
+        change_counter = int.from_bytes(f.read(4), "big")
+    stat = path.stat()
+    return "/".join(
+        (
+            str(change_counter),
+            f"{stat.st_size}:{stat.st_mtime_ns}",
+            _wal_frames(path.with_name(path.name + "-wal")),
+        )
+    )
+
+
+def _key(normalized_sql: str, version: str) -> str:
+    digest = hashlib.sha256(f"{version}\0{normalized_sql}".encode("utf-8"))
+    return digest.hexdigest()[:32] + ".json"
+
+
+def get(normalized_sql: str, version: str) -> CachedResult | None:
+    data = CacheManager.get_cm().read_json(
+        "sql", _key(normalized_sql, version)
+    )
+    if data is None:
+        return None
+    logger.debug("sql result cache hit")
+    return CachedResult(data["titles"], data["rows"])
+
+
+def put(
+    normalized_sql: str,
+    version: str,
+    titles: Sequence[str],
+    rows: Sequence[Sequence[Any]],
+):
+    if any(isinstance(v, bytes) for row in rows for v in row):
+        return  # blobs are not worth caching as json
+    CacheManager.get_cm().write_json(
+        "sql",
+        _key(normalized_sql, version),
+        {"titles": list(titles), "rows": [list(row) for row in rows]},
+    )
@@ -0,0 +1,129 @@
+"""
+materialized statistics for ranking queries.
+
+`work_stats` has one row per work (tag and va counts, the names of the
+vas, the score components and the listen count from history), `tag_stats`
+and `va_stats` aggregate the works of each tag and voice actor. the rows
+are refreshed by the session of `DataBaseManager` for the works it
+changes, and rebuilt as a whole by the bulk importer, so the sql scripts
+can read them instead of joining and aggregating the whole library.
+"""
+
+from typing import Iterable, Set, Tuple
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Connection
+
+from asmrmanager.database.q_func import chunked
+
+_WORK_SQL = """
+INSERT INTO work_stats
+    (asmr_id, tag_count, va_count, vas, revenue, score, listen_count)
+SELECT
+    asmr.id,
+    (SELECT count(*) FROM asmrs2tags WHERE asmr_id = asmr.id),
+    (SELECT count(*) FROM asmrs2vas WHERE asmr_id = asmr.id),
+    (
+        SELECT group_concat(voice_actor.name, ', ')
+        FROM asmrs2vas
+        JOIN voice_actor ON voice_actor.id = asmrs2vas.actor_id
+        WHERE asmrs2vas.asmr_id = asmr.id
+    ),
+    coalesce(asmr.dl_count, 0) * coalesce(asmr.price, 0),
+    coalesce(asmr.dl_count, 0) * log10(coalesce(asmr.price, 0) + 1),
+    (SELECT count(*) FROM history WHERE asmr_id = asmr.id)
+FROM asmr
+"""
+
+# {link} is the association table, {key} its column of the dimension
+_AGGREGATE_SQL = """
+INSERT INTO {table}
+    ({key}, work_count, held_count, rated_count, avg_star, total_dl,
+     listen_count)
+SELECT
+    link.{key},
+    count(*),
+    count(nullif(asmr.held, 0)),
+    count(nullif(asmr.star, 0)),
+    avg(nullif(asmr.star, 0)),
+    coalesce(sum(asmr.dl_count), 0),
+    coalesce(sum(work_stats.listen_count), 0)
+FROM {link} AS link
+JOIN asmr ON asmr.id = link.asmr_id
+LEFT JOIN work_stats ON work_stats.asmr_id = asmr.id
+"""
+
+_DIMENSIONS = (
+    ("tag_stats", "asmrs2tags", "tag_id"),
+    ("va_stats", "asmrs2vas", "actor_id"),
+)
+
+
+def _in(sql: str):
+    return text(sql).bindparams(bindparam("ids", expanding=True))
+
+
+def rebuild(conn: Connection):
+    conn.execute(text("DELETE FROM work_stats"))
+    conn.execute(text(_WORK_SQL))
+    for table, link, key in _DIMENSIONS:
+        conn.execute(text(f"DELETE FROM {table}"))
+        conn.execute(
+            text(
+                _AGGREGATE_SQL.format(table=table, link=link, key=key)
+                + f"GROUP BY link.{key}"
+            )
+        )
+
+
+def affected(conn: Connection, ids: Iterable[int]) -> Tuple[Set, Set]:
+    """the raw tag ids and va ids linked to the given works"""
+    tag_ids, va_ids = set(), set()
+    stmt = _in(
+        "SELECT 0, tag_id FROM asmrs2tags WHERE asmr_id IN :ids"
+        " UNION ALL SELECT 1, actor_id FROM asmrs2vas WHERE asmr_id IN :ids"
+    )
+    for chunk in chunked(ids):
+        for kind, key in conn.execute(stmt, {"ids": chunk}):
+            (va_ids if kind else tag_ids).add(key)
+    return tag_ids, va_ids
+
+
+def refresh(
+    conn: Connection,
+    ids: Iterable[int],
+    tag_ids: Iterable = (),
+    va_ids: Iterable = (),
+):
+    """
+    refresh the given works and the aggregates of their tags and vas,
+    `tag_ids` and `va_ids` are the ones they were linked to before (from
+    `affected`), removed works are dropped
+    """
+    ids = list(ids)
+    if not ids:
+        return
+    current_tags, current_vas = affected(conn, ids)
+    for chunk in chunked(ids):
+        conn.execute(
+            _in("DELETE FROM work_stats WHERE asmr_id IN :ids"),
+            {"ids": chunk},
+        )
+        conn.execute(_in(_WORK_SQL + "WHERE asmr.id IN :ids"), {"ids": chunk})
+
+    for (table, link, key), keys in zip(
+        _DIMENSIONS,
+        (current_tags.union(tag_ids), current_vas.union(va_ids)),
+    ):
+        for chunk in chunked(keys):
+            conn.execute(
+                _in(f"DELETE FROM {table} WHERE {key} IN :ids"),
+                {"ids": chunk},
+            )
+            conn.execute(
+                _in(
+                    _AGGREGATE_SQL.format(table=table, link=link, key=key)
+                    + f"WHERE link.{key} IN :ids GROUP BY link.{key}"
+                ),
+                {"ids": chunk},
+            )
@@ -0,0 +1,162 @@
+import ast
+from functools import cache
+from typing import Any, Callable, Dict, Iterable, List
+
+from asmrmanager.logger import logger
+
+# names usable in the expression, in the order of the compiled arguments
+NAMES = (
+    "upvote",
+    "downvote",
+    "voteRank",
+    "myVote",
+    "voteStatus",
+    "common_only",
+    "accept_all",
+    "except_rejected",
+    "tag",
+)
+
+ALLOWED_NODES = (
+    ast.Expression,
+    ast.BoolOp,
+    ast.And,
+    ast.Or,
+    ast.UnaryOp,
+    ast.Not,
+    ast.USub,
+    ast.UAdd,
+    ast.BinOp,
+    ast.Add,
+    ast.Sub,
+    ast.Mult,
+    ast.Div,
+    ast.FloorDiv,
+    ast.Mod,
+    ast.Compare,
+    ast.Eq,
+    ast.NotEq,
+    ast.Lt,
+    ast.LtE,
+    ast.Gt,
+    ast.GtE,
+    ast.In,
+    ast.NotIn,
+    ast.Is,
+    ast.IsNot,
+    ast.IfExp,
+    ast.Name,
+    ast.Load,
+    ast.Constant,
+    ast.List,
+    ast.Tuple,
+    ast.Set,
+    ast.Subscript,
+)
+
+
+class TagStrategyError(ValueError):
+    pass
+
+
+def _validate(tree: ast.Expression, expr: str):
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            raise TagStrategyError(
+                f"{type(node).__name__} is not allowed in tag_strategy: {expr}"
+            )
+        if isinstance(node, ast.Name) and node.id not in NAMES:
+            raise TagStrategyError(
+                f"unknown name {node.id} in tag_strategy: {expr}, "
+                f"available names are {', '.join(NAMES)}"
+            )
+        if isinstance(node, ast.Subscript) and not (
+            isinstance(node.slice, ast.Constant)
+            and isinstance(node.value, (ast.Name, ast.Subscript))
+        ):
+            raise TagStrategyError(
+                f"only constant keys of tag can be accessed: {expr}"
+            )
+
+
+class TagStrategy:
+    """
+    a tag_strategy expression parsed, validated and compiled once,
+    only comparisons, boolean logic, arithmetic and constant subscripts of
+    the names in `NAMES` are allowed, so no code can be run by the config
+    """
+
+    def __init__(self, expr: str):
+        self.expr = expr
+        try:
+            tree = ast.parse(expr.strip(), "<tag_strategy>", mode="eval")
+        except SyntaxError as e:
+            raise TagStrategyError(f"invalid tag_strategy: {expr}: {e}")
+        _validate(tree, expr)
+
+        # compile as `lambda upvote, downvote, ...: <expr>`
+        func = ast.Expression(
+            ast.Lambda(
+                args=ast.arguments(
+                    posonlyargs=[],
+                    args=[ast.arg(name) for name in NAMES],
+                    kwonlyargs=[],
+                    kw_defaults=[],
+                    defaults=[],
+                ),
+                body=tree.body,
+            )
+        )
+        ast.fix_missing_locations(func)
+        self._predicate: Callable[..., Any] = eval(
+            compile(func, "<tag_strategy>", "eval"), {"__builtins__": {}}
+        )
+
+    def __call__(self, tag: Dict[str, Any], verbose: bool = True) -> bool:
+        """
+        true if tag should be accepted and stored in database,
+        filtered tags are logged if `verbose`
+        """
+        upvote: int = tag["upvote"]
+        downvote: int = tag["downvote"]
+        # voteRank may be missing
+        voteRank: int = tag.get("voteRank", upvote - downvote)
+        voteStatus: int = tag["voteStatus"]
+        if voteRank != upvote - downvote and voteStatus != 1:
+            logger.warning(
+                f"voteRank is not equal to upvote - downvote: {tag}"
+            )
+
+        common_only = voteStatus == 1
+        res = bool(
+            self._predicate(
+                upvote,
+                downvote,
+                voteRank,
+                tag["myVote"],
+                voteStatus,
+                common_only,
+                True,
+                voteStatus in (0, 1),
+                tag,
+            )
+        )
+        if not res and verbose:
+            logger.info(
+                f"tag {tag['name']} ({upvote}/{downvote},"
+                f" common={common_only}) is filtered"
+            )
+        return res
+
+    def filter(
+        self, tags: Iterable[Dict[str, Any]], verbose: bool = True
+    ) -> List[Dict[str, Any]]:
+        return [tag for tag in tags if self(tag, verbose)]
+
+    def __repr__(self):
+        return f"TagStrategy({self.expr!r})"
+
+
+@cache
+def compile_tag_strategy(expr: str) -> TagStrategy:
+    return TagStrategy(expr)
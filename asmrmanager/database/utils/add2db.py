@@ -1,18 +1,12 @@
-import json
-import os
+from pathlib import Path
 
 from asmrmanager.database.manage import DataBaseManager
+from asmrmanager.database.utils.reindex import reindex
 
 
-def add2db(start_dir: str):
+def add2db(start_dir: str, tag_strategy: str = "common_only"):
     db = DataBaseManager()
-    for root, dirs, files in os.walk(start_dir):
-        for file in files:
-            if file.startswith("RJ") and file.endswith(".json"):
-                with open(os.path.join(root, file), encoding="utf8") as f:
-                    db.add_info(json.load(f))
-
-    db.commit()
+    reindex(db.session, [Path(start_dir)], tag_strategy=tag_strategy)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,249 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Sequence
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from asmrmanager.common.rj_parse import is_local_source_id, source2id
+from asmrmanager.database import fts
+from asmrmanager.database.database import ASMR, ASMRs2Tags, ASMRs2VAs
+from asmrmanager.database.dimensions import get_dimensions
+from asmrmanager.database.stats import rebuild as rebuild_stats
+from asmrmanager.logger import logger
+
+# works written per transaction
+CHUNK_SIZE = 1000
+
+# columns of asmr that come from the info json, the others (star, count,
+# comment, held, stored) are user data and never overwritten
+INFO_COLUMNS = (
+    "remote_id",
+    "title",
+    "circle_name",
+    "nsfw",
+    "release_date",
+    "price",
+    "dl_count",
+    "has_subtitle",
+)
+
+
+class ParsedInfo(NamedTuple):
+    asmr: Dict[str, Any]
+    tags: List[Dict[str, Any]]
+    vas: List[Dict[str, Any]]
+
+
+class ReindexStats(NamedTuple):
+    files: int
+    works: int
+    tags: int
+    vas: int
+    errors: int
+    seconds: float
+
+
+def find_info_files(start_dirs: Iterable[Path]) -> List[Path]:
+    files = []
+    for start_dir in start_dirs:
+        for root, _, names in os.walk(start_dir):
+            files.extend(
+                Path(root) / name
+                for name in names
+                if name.startswith("RJ") and name.endswith(".json")
+            )
+    return files
+
+
+def parse_info_rows(info: Dict[str, Any]) -> ParsedInfo:
+    """
+    plain rows of an info json whose tags are already filtered, the same
+    as `DataBaseManager.parse_info` but without orm objects
+    """
+    source = info.get("source_id")
+    assert isinstance(source, str), "source_id missing"
+    source_id = source2id(source)
+    assert source_id is not None and is_local_source_id(source_id)
+
+    asmr = {
+        "id": source_id,
+        "remote_id": info["id"],
+        "title": info["title"],
+        "circle_name": info["name"],
+        "nsfw": info["nsfw"],
+        "release_date": date.fromisoformat(info["release"]),
+        "price": info["price"],
+        "dl_count": info["dl_count"],
+        "has_subtitle": info["has_subtitle"],
+    }
+    tags = []
+    for tag_info in info["tags"]:
+        if not tag_info.get("id"):
+            continue
+        tag = {"id": tag_info["id"], "name": tag_info["name"]}
+        if i18n := tag_info["i18n"]:
+            tag["cn_name"] = i18n["zh-cn"]["name"]
+            tag["jp_name"] = i18n["ja-jp"]["name"]
+            tag["en_name"] = i18n["en-us"]["name"]
+        else:
+            assert tag["id"] == 10000
+            tag.update(cn_name=None, jp_name=None, en_name=None)
+        tags.append(tag)
+    vas = [{"id": va["id"], "name": va["name"]} for va in info["vas"]]
+    return ParsedInfo(asmr, tags, vas)
+
+
+def parse_info_file(path: Path, tag_strategy: str) -> ParsedInfo | str:
+    """
+    parse an info json file into plain rows (picklable), return the error
+    message if failed
+    """
+    from asmrmanager.database.tag_strategy import compile_tag_strategy
+
+    try:
+        info = json.loads(path.read_bytes())
+        info["tags"] = compile_tag_strategy(tag_strategy).filter(
+            info["tags"], verbose=False
+        )
+        return parse_info_rows(info)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+
+
+def write_chunk(session: Session, works: Sequence[ParsedInfo]):
+    """
+    upsert the works with their tags and vas, the caller commits and
+    refreshes the full text index
+    """
+    dimensions = get_dimensions(session)
+    dimensions.write_tags(t for w in works for t in w.tags)
+    dimensions.write_vas(va for w in works for va in w.vas)
+    ids = [w.asmr["id"] for w in works]
+
+    stmt = insert(ASMR)
+    session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[ASMR.id],
+            set_={col: stmt.excluded[col] for col in INFO_COLUMNS},
+        ),
+        [w.asmr for w in works],
+    )
+
+    # associations are replaced as a whole, like merge does
+    session.execute(delete(ASMRs2Tags).where(ASMRs2Tags.asmr_id.in_(ids)))
+    session.execute(delete(ASMRs2VAs).where(ASMRs2VAs.asmr_id.in_(ids)))
+    asmrs2tags = {(w.asmr["id"], t["id"]) for w in works for t in w.tags}
+    asmrs2vas = {(w.asmr["id"], va["id"]) for w in works for va in w.vas}
+    if asmrs2tags:
+        session.execute(
+            insert(ASMRs2Tags),
+            [{"asmr_id": a, "tag_id": t} for a, t in asmrs2tags],
+        )
+    if asmrs2vas:
+        session.execute(
+            insert(ASMRs2VAs),
+            [{"asmr_id": a, "actor_id": va} for a, va in asmrs2vas],
+        )
+
+
+def reindex(
+    session: Session,
+    start_dirs: Iterable[Path],
+    tag_strategy: str = "common_only",
+    processes: int | None = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> ReindexStats:
+    """
+    rebuild the info of all works from the `RJ*.json` files under
+    `start_dirs`, the files are parsed in a process pool and written with
+    batched upserts, `chunk_size` works per transaction
+    """
+    from rich.progress import (
+        BarColumn,
+        MofNCompleteColumn,
+        Progress,
+        TextColumn,
+        TimeElapsedColumn,
+        TimeRemainingColumn,
+    )
+
+    start = time.perf_counter()
+    files = find_info_files(start_dirs)
+    logger.info(f"found {len(files)} info files")
+
+    works: Dict[int, ParsedInfo] = {}
+    tag_ids: set[int] = set()
+    va_ids: set[str] = set()
+    errors = 0
+    written = 0
+
+    def flush():
+        nonlocal written
+        if not works:
+            return
+        write_chunk(session, list(works.values()))
+        conn = session.connection()
+        if fts.exists(conn):
+            fts.refresh(conn, list(works))
+        session.commit()
+        written += len(works)
+        works.clear()
+
+    with (
+        ProcessPoolExecutor(processes) as executor,
+        Progress(
+            TextColumn("{task.description}"),
+            BarColumn(),
+            MofNCompleteColumn(),
+            TimeElapsedColumn(),
+            TimeRemainingColumn(),
+            transient=True,
+        ) as progress,
+    ):
+        task = progress.add_task("reindexing", total=len(files))
+        results = executor.map(
+            parse_info_file,
+            files,
+            [tag_strategy] * len(files),
+            chunksize=max(1, min(64, len(files) // (4 * (processes or 8)))),
+        )
+        for path, res in zip(files, results):
+            progress.advance(task)
+            if isinstance(res, str):
+                logger.warning(f"failed to parse {path}: {res}")
+                errors += 1
+                continue
+            # the same work may exist in both download and storage path
+            if res.asmr["id"] in works:
+                flush()
+            works[res.asmr["id"]] = res
+            tag_ids.update(t["id"] for t in res.tags)
+            va_ids.update(va["id"] for va in res.vas)
+            if len(works) >= chunk_size:
+                flush()
+        flush()
+
+    rebuild_stats(session.connection())
+    session.commit()
+
+    stats = ReindexStats(
+        files=len(files),
+        works=written,
+        tags=len(tag_ids),
+        vas=len(va_ids),
+        errors=errors,
+        seconds=time.perf_counter() - start,
+    )
+    logger.info(
+        f"reindexed {stats.works} works, {stats.tags} tags and {stats.vas}"
+        f" vas from {stats.files} files in {stats.seconds:.1f}s"
+        f" ({stats.works / max(stats.seconds, 1e-6):.0f} works/s),"
+        f" {stats.errors} failed"
+    )
+    return stats
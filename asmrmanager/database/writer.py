@@ -0,0 +1,142 @@
+"""
+background writer of the database.
+
+writes are queued as callables and applied by a single thread with its own
+session (so its own connection), committed in batches of `batch_size`
+writes or once the queue stays empty for `interval` seconds. the download
+pipeline hands its writes over here instead of blocking the event loop on
+sqlite, readers keep using the session of the main thread, which sees the
+committed batches thanks to wal.
+"""
+
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Any, Callable, List, Tuple
+
+from sqlalchemy.exc import OperationalError
+
+from asmrmanager.logger import logger
+
+if TYPE_CHECKING:
+    from asmrmanager.database.manage import DataBaseManager
+
+Write = Callable[["DataBaseManager"], Any]
+
+# a commit still failing with "database is locked" after the busy timeout
+# is retried this many times, replaying the writes of the batch
+MAX_RETRIES = 3
+
+
+class DatabaseWriter:
+    def __init__(
+        self,
+        create_db: Callable[[], "DataBaseManager"],
+        batch_size: int = 50,
+        interval: float = 0.5,
+    ):
+        self.create_db = create_db
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue: queue.Queue[Tuple[Write | None, Future] | None] = (
+            queue.Queue()
+        )
+        self.thread = threading.Thread(
+            target=self._run, name="asmr-db-writer", daemon=True
+        )
+        self.thread.start()
+        atexit.register(self.close)
+
+    def submit(self, write: Write) -> Future:
+        """queue `write`, the future is done once it is committed"""
+        future: Future = Future()
+        self.queue.put((write, future))
+        return future
+
+    def flush(self):
+        """wait until all the queued writes are committed"""
+        if not self.thread.is_alive():
+            return
+        future: Future = Future()
+        self.queue.put((None, future))
+        future.result()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def _run(self):
+        db = self.create_db()
+        batch: List[Tuple[Write, Future]] = []
+        while True:
+            try:
+                item = self.queue.get(timeout=self.interval if batch else None)
+            except queue.Empty:
+                self._commit(db, batch)
+                continue
+            if item is None:
+                self._commit(db, batch)
+                return
+            write, future = item
+            if write is None:  # flush
+                self._commit(db, batch)
+                future.set_result(None)
+                continue
+            self._apply(db, batch, write, future)
+            if len(batch) >= self.batch_size:
+                self._commit(db, batch)
+
+    def _apply(
+        self,
+        db: "DataBaseManager",
+        batch: List[Tuple[Write, Future]],
+        write: Write,
+        future: Future,
+    ):
+        try:
+            write(db)
+        except Exception as e:
+            logger.error(f"failed to write to database: {e}")
+            future.set_exception(e)
+            # the session may be unusable, start the batch over without it
+            db.session.rollback()
+            self._replay(db, batch)
+            return
+        batch.append((write, future))
+
+    def _replay(
+        self, db: "DataBaseManager", batch: List[Tuple[Write, Future]]
+    ):
+        pending = list(batch)
+        batch.clear()
+        for write, future in pending:
+            self._apply(db, batch, write, future)
+
+    def _commit(
+        self, db: "DataBaseManager", batch: List[Tuple[Write, Future]]
+    ):
+        if not batch:
+            return
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                db.session.commit()
+            except OperationalError as e:
+                db.session.rollback()
+                if "locked" not in str(e) or attempt == MAX_RETRIES:
+                    logger.error(f"failed to commit {len(batch)} writes: {e}")
+                    for _, future in batch:
+                        future.set_exception(e)
+                    batch.clear()
+                    return
+                logger.debug(f"database is busy, retrying: {e}")
+                time.sleep(0.1 * 2**attempt)
+                self._replay(db, batch)
+                continue
+            break
+        logger.debug(f"committed {len(batch)} writes")
+        for _, future in batch:
+            future.set_result(None)
+        batch.clear()
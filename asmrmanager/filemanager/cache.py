@@ -0,0 +1,233 @@
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple
+
+from asmrmanager.filemanager.appdirs_ import CACHE_PATH
+from asmrmanager.logger import logger
+
+
+@dataclass
+class Namespace:
+    name: str
+    budget: int | None = None  # bytes, evict least recently used files
+    ttl: float | None = None  # seconds, expire files by modified time
+    # files kept at the root of CACHE_PATH before namespaces existed
+    legacy: tuple[str, ...] = ()
+
+
+NamespaceStats = NamedTuple(
+    "NamespaceStats",
+    [
+        ("name", str),
+        ("files", int),
+        ("size", int),
+        ("budget", int | None),
+        ("ttl", float | None),
+    ],
+)
+
+MiB = 1024 * 1024
+DAY = 24 * 60 * 60
+
+# defaults, budgets can be overridden by `cache_budgets` in the config
+NAMESPACES: Dict[str, Namespace] = {
+    ns.name: ns
+    for ns in (
+        Namespace("covers", budget=200 * MiB),
+        Namespace("thumbnails", budget=50 * MiB),
+        Namespace(
+            "api",
+            budget=20 * MiB,
+            ttl=DAY,
+            legacy=("tags.json", "prev_info.json"),
+        ),
+        Namespace("sql", budget=50 * MiB, ttl=7 * DAY),
+        Namespace("playlist", ttl=7 * DAY, legacy=("playlist.cache",)),
+        Namespace("login", ttl=30 * DAY, legacy=("login_cache.json",)),
+        Namespace("tmp", ttl=DAY, legacy=("tempfile.sql",)),
+    )
+}
+
+
+class CacheManager:
+    """
+    all files under CACHE_PATH live in a namespace (a sub directory),
+    each namespace is bounded by a byte budget (least recently used files
+    are evicted first) and/or a ttl (files older than it are ignored and
+    pruned). writes are atomic.
+    """
+
+    CACHE_PATH = CACHE_PATH
+    __instance = None
+
+    def __init__(self, namespaces: Dict[str, Namespace] = NAMESPACES):
+        self.namespaces = namespaces
+        # approximate size of each namespace, computed on first write
+        self._sizes: Dict[str, int] = {}
+        self._ready: set[str] = set()
+
+    def _namespace(self, ns: str) -> Namespace:
+        if ns not in self.namespaces:
+            raise ValueError(f"Unknown cache namespace: {ns}")
+        return self.namespaces[ns]
+
+    def dir(self, ns: str) -> Path:
+        namespace = self._namespace(ns)
+        path = self.CACHE_PATH / namespace.name
+        if ns not in self._ready:
+            path.mkdir(parents=True, exist_ok=True)
+            for name in namespace.legacy:
+                legacy_path = self.CACHE_PATH / name
+                if legacy_path.exists():
+                    logger.debug(f"move legacy cache {legacy_path} to {path}")
+                    legacy_path.replace(path / name)
+            self._ready.add(ns)
+        return path
+
+    def path(self, ns: str, key: str) -> Path:
+        return self.dir(ns) / key
+
+    def get(self, ns: str, key: str, ttl: float | None = None) -> Path | None:
+        """
+        return the path of a valid cache entry and mark it as recently used,
+        `ttl` overrides the ttl of the namespace
+        """
+        path = self.path(ns, key)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        ttl = ttl if ttl is not None else self._namespace(ns).ttl
+        if ttl is not None and time.time() - stat.st_mtime > ttl:
+            logger.debug(f"cache {ns}/{key} expired")
+            return None
+        # only atime is touched, so mtime still tells when it was written
+        os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+        return path
+
+    def read_bytes(
+        self, ns: str, key: str, ttl: float | None = None
+    ) -> bytes | None:
+        if (path := self.get(ns, key, ttl)) is None:
+            return None
+        return path.read_bytes()
+
+    def read_json(self, ns: str, key: str, ttl: float | None = None) -> Any:
+        if (data := self.read_bytes(ns, key, ttl)) is None:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError as e:
+            logger.warning(f"broken cache {ns}/{key}: {e}")
+            return None
+
+    def write_bytes(self, ns: str, key: str, data: bytes) -> Path:
+        path = self.path(ns, key)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(data)
+        tmp_path.replace(path)
+        self.add(ns, path)
+        return path
+
+    def write_text(self, ns: str, key: str, text: str) -> Path:
+        return self.write_bytes(ns, key, text.encode("utf-8"))
+
+    def write_json(self, ns: str, key: str, obj: Any) -> Path:
+        return self.write_text(ns, key, json.dumps(obj, ensure_ascii=False))
+
+    def add(self, ns: str, path: Path):
+        """account a file written into the namespace, evict if over budget"""
+        namespace = self._namespace(ns)
+        if namespace.budget is None:
+            return
+        if ns not in self._sizes:
+            self._sizes[ns] = sum(p.stat().st_size for p in self._files(ns))
+        else:
+            self._sizes[ns] += path.stat().st_size
+        if self._sizes[ns] > namespace.budget:
+            self.prune([ns])
+
+    def remove(self, ns: str, key: str):
+        self.path(ns, key).unlink(missing_ok=True)
+        self._sizes.pop(ns, None)
+
+    def _files(self, ns: str) -> List[Path]:
+        return [p for p in self.dir(ns).rglob("*") if p.is_file()]
+
+    def stats(self) -> List[NamespaceStats]:
+        res = []
+        for ns, namespace in self.namespaces.items():
+            files = self._files(ns)
+            res.append(
+                NamespaceStats(
+                    ns,
+                    len(files),
+                    sum(p.stat().st_size for p in files),
+                    namespace.budget,
+                    namespace.ttl,
+                )
+            )
+        return res
+
+    def prune(self, namespaces: Iterable[str] | None = None, clear=False):
+        """
+        remove expired entries, then the least recently used ones until the
+        namespace fits in 90% of its budget. remove everything if `clear`.
+        return the number of bytes freed
+        """
+        freed = 0
+        for ns in namespaces or self.namespaces:
+            namespace = self._namespace(ns)
+            if clear:
+                path = self.dir(ns)
+                freed += sum(p.stat().st_size for p in self._files(ns))
+                shutil.rmtree(path)
+                self._ready.discard(ns)
+                self._sizes.pop(ns, None)
+                continue
+
+            now = time.time()
+            entries = []
+            for p in self._files(ns):
+                stat = p.stat()
+                # leftovers of interrupted writes are given an hour
+                ttl = 60 * 60 if p.name.endswith(".tmp") else namespace.ttl
+                if ttl is not None and now - stat.st_mtime > ttl:
+                    freed += stat.st_size
+                    p.unlink(missing_ok=True)
+                    continue
+                entries.append((max(stat.st_atime, stat.st_mtime), stat, p))
+
+            size = sum(stat.st_size for _, stat, _ in entries)
+            if namespace.budget is not None and size > namespace.budget:
+                entries.sort(key=lambda e: e[0])
+                for _, stat, p in entries:
+                    if size <= namespace.budget * 0.9:
+                        break
+                    p.unlink(missing_ok=True)
+                    size -= stat.st_size
+                    freed += stat.st_size
+            self._sizes[ns] = size
+        if freed:
+            logger.debug(f"pruned {freed} bytes of cache")
+        return freed
+
+    @classmethod
+    def get_cm(cls) -> "CacheManager":
+        from asmrmanager.config import config
+
+        if cls.__instance is None:
+            namespaces = dict(NAMESPACES)
+            for ns, budget_mb in config.cache_budgets.items():
+                if ns not in namespaces:
+                    logger.warning(f"Unknown cache namespace in config: {ns}")
+                    continue
+                namespaces[ns] = replace(
+                    namespaces[ns], budget=int(budget_mb * MiB)
+                )
+            cls.__instance = cls(namespaces)
+        return cls.__instance
@@ -0,0 +1,143 @@
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Literal, Tuple
+
+from asmrmanager.logger import logger
+
+CopyMethod = Literal["reflink", "hardlink", "copy"]
+
+FICLONE = 0x40049409  # linux/fs.h, _IOW(0x94, 9, int)
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def _reflink(src: Path, dst: Path) -> bool:
+    """clone src to dst on CoW filesystems (btrfs, xfs, bcachefs ...)"""
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+
+    with src.open("rb") as fin, dst.open("wb") as fout:
+        try:
+            fcntl.ioctl(fout.fileno(), FICLONE, fin.fileno())
+        except OSError:
+            fail = True
+        else:
+            fail = False
+    if fail:
+        dst.unlink(missing_ok=True)
+    return not fail
+
+
+def _copy_range(src: Path, dst: Path, advance: Callable[[int], None]):
+    """copy file content in kernel space when possible"""
+    copy_file_range = getattr(os, "copy_file_range", None)
+    with src.open("rb") as fin, dst.open("wb") as fout:
+        if copy_file_range is not None:
+            copied = 0
+            try:
+                while n := copy_file_range(
+                    fin.fileno(), fout.fileno(), CHUNK_SIZE
+                ):
+                    copied += n
+                    advance(n)
+                return
+            except OSError as e:
+                # e.g. EXDEV on old kernels or unsupported filesystems
+                logger.debug(f"copy_file_range failed for {src}: {e}")
+                advance(-copied)  # copied again below
+                fin.seek(0)
+                fout.seek(0)
+                fout.truncate()
+        while chunk := fin.read(CHUNK_SIZE):
+            fout.write(chunk)
+            advance(len(chunk))
+
+
+def _collect(src: Path, dst: Path, depth: int) -> List[Tuple[Path, Path]]:
+    """list (src, dst) file pairs, depth -1 means no limit"""
+    if src.is_file():
+        return [(src, dst)]
+    if depth == 0:
+        return []
+    pairs = []
+    for subfile in src.iterdir():
+        pairs.extend(_collect(subfile, dst / subfile.name, depth - 1))
+    return pairs
+
+
+def copy_folder(
+    src: Path,
+    dst: Path,
+    depth: int = -1,
+    threads: int = 4,
+    link: bool = True,
+) -> CopyMethod | None:
+    """
+    copy `src` to `dst`, try reflink first, then per-file hardlinks if
+    `link` is enabled and both are on the same device, otherwise copy the
+    files in parallel. return the method finally used.
+    """
+    from rich.progress import (
+        BarColumn,
+        DownloadColumn,
+        Progress,
+        TextColumn,
+        TimeRemainingColumn,
+        TransferSpeedColumn,
+    )
+
+    pairs = _collect(src, dst, depth)
+    if not pairs:
+        logger.warning(f"nothing to copy in {src}")
+        return None
+    for _, d in pairs:
+        d.parent.mkdir(parents=True, exist_ok=True)
+
+    first_src, first_dst = pairs[0]
+    if _reflink(first_src, first_dst):
+        for s, d in pairs[1:]:
+            if not _reflink(s, d):
+                shutil.copyfile(s, d)
+        logger.info(f"reflinked {len(pairs)} files to {dst}")
+        return "reflink"
+
+    if link and (
+        os.stat(first_src).st_dev == os.stat(first_dst.parent).st_dev
+    ):
+        try:
+            for s, d in pairs:
+                os.link(s, d)
+            logger.info(f"hardlinked {len(pairs)} files to {dst}")
+            return "hardlink"
+        except OSError as e:
+            # filesystems like FAT have no hardlink support
+            logger.debug(f"hardlink failed: {e}, fallback to copy")
+            for _, d in pairs:
+                d.unlink(missing_ok=True)
+
+    total_size = sum(s.stat().st_size for s, _ in pairs)
+    with (
+        Progress(
+            TextColumn("{task.description}"),
+            BarColumn(),
+            DownloadColumn(),
+            TransferSpeedColumn(),
+            TimeRemainingColumn(),
+            transient=True,
+        ) as progress,
+        ThreadPoolExecutor(threads) as executor,
+    ):
+        task = progress.add_task(f"copying {src.name}", total=total_size)
+        futures = [
+            executor.submit(
+                _copy_range, s, d, lambda n: progress.advance(task, n)
+            )
+            for s, d in pairs
+        ]
+        for future in futures:
+            future.result()
+    logger.info(f"copied {len(pairs)} files to {dst}")
+    return "copy"
@@ -1,16 +1,337 @@
-import zipfile
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from typing import BinaryIO, Deque, Iterator, List, Tuple
 
 from asmrmanager.logger import logger
 
-from .utils import folder_chooser
+# only these members are worth deflating, everything else (audio, video and
+# the compressed image formats) is stored as is
+DEFLATE_SUFFIXES = (
+    # text
+    ".txt",
+    ".lrc",
+    ".vtt",
+    ".srt",
+    ".ass",
+    ".json",
+    ".md",
+    ".htm",
+    ".html",
+    ".xml",
+    ".csv",
+    ".ini",
+    ".nfo",
+    ".log",
+    ".cue",
+    ".recover",
+    # uncompressed images
+    ".bmp",
+    ".tif",
+    ".tiff",
+    ".psd",
+)
+CHUNK_SIZE = 1024 * 1024
 
 
-def zip_chosen_folder(src: Path, dst: Path):
+def should_deflate(file: Path) -> bool:
+    return file.suffix.lower() in DEFLATE_SUFFIXES
+
+
+def _deflate(file: Path, level: int) -> Tuple[bytes, int, int]:
+    """return the raw deflate stream, crc32 and size of the file"""
+    data = file.read_bytes()
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return (
+        compressor.compress(data) + compressor.flush(),
+        zlib.crc32(data),
+        len(data),
+    )
+
+
+def _dos_datetime(mtime: float) -> Tuple[int, int]:
+    year, month, day, hour, minute, second = time.localtime(mtime)[:6]
+    if year < 1980:
+        year, month, day, hour, minute, second = 1980, 1, 1, 0, 0, 0
+    return (
+        (hour << 11) | (minute << 5) | (second // 2),
+        ((year - 1980) << 9) | (month << 5) | day,
+    )
+
+
+class _ZipWriter:
+    """
+    a minimal zip writer which can take members that are already deflated,
+    `zipfile` has no public api for that and compresses everything it writes
+    on the calling thread
+    """
+
+    # sizes and offsets from here on go to the zip64 extra field
+    LIMIT = 0xFFFFFFFF
+    MASK = 0xFFFFFFFF
+
+    def __init__(self, fp: BinaryIO):
+        self.fp = fp
+        # name, flags, method, time, date, crc, csize, size, offset, mode
+        self.entries: List[tuple] = []
+
+    def _local_header(
+        self,
+        name: bytes,
+        flags: int,
+        method: int,
+        dos: Tuple[int, int],
+        crc: int,
+        csize: int,
+        size: int,
+        zip64: bool,
+    ) -> bytes:
+        extra = b""
+        if zip64:
+            extra = struct.pack("<HHQQ", 1, 16, size, csize)
+            csize = size = self.MASK
+        return (
+            struct.pack(
+                "<IHHHHHIIIHH",
+                0x04034B50,
+                45 if zip64 else 20,
+                flags,
+                method,
+                *dos,
+                crc,
+                csize,
+                size,
+                len(name),
+                len(extra),
+            )
+            + name
+            + extra
+        )
+
+    def _add(
+        self,
+        file: Path,
+        method: int,
+        payload: Iterator[bytes],
+        crc: int,
+        csize: int,
+        size: int,
+    ):
+        """
+        write a member, `crc` and `csize` may be 0 for a stored member,
+        they are computed while writing and patched into the header
+        """
+        st = file.stat()
+        name = file.name.encode("utf-8")
+        flags = 0 if file.name.isascii() else 0x800
+        dos = _dos_datetime(st.st_mtime)
+        zip64 = max(size, csize) >= self.LIMIT
+        offset = self.fp.tell()
+        self.fp.write(
+            self._local_header(
+                name, flags, method, dos, crc, csize, size, zip64
+            )
+        )
+
+        written = 0
+        for chunk in payload:
+            self.fp.write(chunk)
+            written += len(chunk)
+            if method == 0:
+                crc = zlib.crc32(chunk, crc)
+        if method == 0:
+            if written != size:
+                raise RuntimeError(f"{file} changed while zipping")
+            csize = written
+            end = self.fp.tell()
+            self.fp.seek(offset)
+            self.fp.write(
+                self._local_header(
+                    name, flags, method, dos, crc, csize, size, zip64
+                )
+            )
+            self.fp.seek(end)
+
+        self.entries.append(
+            (name, flags, method, dos, crc, csize, size, offset, st.st_mode)
+        )
+
+    def add_deflated(self, file: Path, payload: bytes, crc: int, size: int):
+        self._add(file, 8, iter((payload,)), crc, len(payload), size)
+
+    def add_stored(self, file: Path, chunks: Iterator[bytes]):
+        self._add(file, 0, chunks, 0, 0, file.stat().st_size)
+
+    def close(self):
+        cd_offset = self.fp.tell()
+        for (
+            name,
+            flags,
+            method,
+            dos,
+            crc,
+            csize,
+            size,
+            offset,
+            mode,
+        ) in self.entries:
+            values = [size, csize, offset]
+            large = [v for v in values if v >= self.LIMIT]
+            extra = b""
+            if large:
+                extra = struct.pack("<HH", 1, 8 * len(large))
+                extra += struct.pack(f"<{len(large)}Q", *large)
+                size, csize, offset = (
+                    self.MASK if v >= self.LIMIT else v for v in values
+                )
+            self.fp.write(
+                struct.pack(
+                    "<IHHHHHHIIIHHHHHII",
+                    0x02014B50,
+                    (3 << 8) | 45,  # made by unix
+                    45 if large else 20,
+                    flags,
+                    method,
+                    *dos,
+                    crc,
+                    csize,
+                    size,
+                    len(name),
+                    len(extra),
+                    0,
+                    0,
+                    0,
+                    (mode & 0xFFFF) << 16,
+                    offset,
+                )
+                + name
+                + extra
+            )
+        cd_size = self.fp.tell() - cd_offset
+
+        count = len(self.entries)
+        if count >= 0xFFFF or max(cd_offset, cd_size) >= self.LIMIT:
+            zip64_offset = self.fp.tell()
+            self.fp.write(
+                struct.pack(
+                    "<IQHHIIQQQQ",
+                    0x06064B50,
+                    44,
+                    45,
+                    45,
+                    0,
+                    0,
+                    count,
+                    count,
+                    cd_size,
+                    cd_offset,
+                )
+            )
+            self.fp.write(struct.pack("<IIQI", 0x07064B50, 0, zip64_offset, 1))
+        self.fp.write(
+            struct.pack(
+                "<IHHHHIIH",
+                0x06054B50,
+                0,
+                0,
+                min(count, 0xFFFF),
+                min(count, 0xFFFF),
+                self.MASK if cd_size >= self.LIMIT else cd_size,
+                self.MASK if cd_offset >= self.LIMIT else cd_offset,
+                0,
+            )
+        )
+
+
+def _read_chunks(file: Path, progress, task) -> Iterator[bytes]:
+    with file.open("rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            yield chunk
+            progress.advance(task, len(chunk))
+
+
+def zip_folder(
+    src: Path,
+    dst: Path,
+    threads: int | None = None,
+    compresslevel: int = 6,
+):
+    """
+    zip the files (not recursively) in `src` to `dst`,
+    media files are stored while text and uncompressed images are deflated
+    in a thread pool
+    """
+    from rich.progress import (
+        BarColumn,
+        DownloadColumn,
+        Progress,
+        TextColumn,
+        TimeRemainingColumn,
+        TransferSpeedColumn,
+    )
+
     assert src.is_dir() and dst.exists() is False
-    folder = folder_chooser(src)
-    logger.info("start zipping...")
-    files = [f for f in folder.iterdir() if not f.is_dir()]
-    with zipfile.ZipFile(dst, "w", zipfile.ZIP_DEFLATED) as zf:
-        for file in files:
-            zf.write(file, arcname=file.name)
+    files = sorted(f for f in src.iterdir() if f.is_file())
+    total_size = sum(f.stat().st_size for f in files)
+    logger.info(
+        f"start zipping {len(files)} files "
+        f"({total_size / 1024**2:.1f} MiB) to {dst}"
+    )
+
+    workers = threads or os.cpu_count() or 4
+    # at most this many deflated members are held in memory, they are
+    # compressed ahead of the writer and written in order
+    window = 2 * workers
+    to_deflate = iter([f for f in files if should_deflate(f)])
+    deflating: Deque[Future] = deque()
+
+    # write to a temporary file first, so an interrupted run leaves no
+    # broken archive at the destination
+    tmp_dst = dst.with_name(f"{dst.name}.part")
+    with (
+        ThreadPoolExecutor(workers) as executor,
+        Progress(
+            TextColumn("{task.description}"),
+            BarColumn(),
+            DownloadColumn(),
+            TransferSpeedColumn(),
+            TimeRemainingColumn(),
+            transient=True,
+        ) as progress,
+    ):
+
+        def fill_window():
+            while len(deflating) < window:
+                if (file := next(to_deflate, None)) is None:
+                    return
+                deflating.append(
+                    executor.submit(_deflate, file, compresslevel)
+                )
+
+        task = progress.add_task(f"zipping {src.name}", total=total_size)
+        try:
+            with tmp_dst.open("wb") as fp:
+                zw = _ZipWriter(fp)
+                fill_window()
+                for file in files:
+                    if should_deflate(file):
+                        payload, crc, size = deflating.popleft().result()
+                        fill_window()
+                        zw.add_deflated(file, payload, crc, size)
+                        progress.advance(task, size)
+                        continue
+
+                    zw.add_stored(file, _read_chunks(file, progress, task))
+                zw.close()
+            tmp_dst.replace(dst)
+        except BaseException:
+            for future in deflating:
+                future.cancel()
+            tmp_dst.unlink(missing_ok=True)
+            raise
+
+    logger.info(f"zipped {len(files)} files to {dst}")
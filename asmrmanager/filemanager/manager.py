@@ -8,10 +8,9 @@ from typing import (
     Literal,
     NamedTuple,
     Set,
+    Tuple,
 )
 
-import toml
-
 from asmrmanager.common.rj_parse import (
     id2source_name,
     source2id,
@@ -19,6 +18,7 @@ from asmrmanager.common.rj_parse import (
 )
 from asmrmanager.common.types import (
     LocalSourceID,
+    PlayListCache,
     PlayListItem,
     RecoverRecord,
     SourceName,
@@ -29,6 +29,7 @@ from asmrmanager.filemanager.appdirs_ import (
     DATA_PATH,
     LOG_PATH,
 )
+from asmrmanager.filemanager.cache import CacheManager
 from asmrmanager.logger import logger
 
 # from .exceptions import DstItemAlreadyExistsException, SrcNotExistsException
@@ -100,22 +101,30 @@ class FileManager:
         )
 
     @classmethod
-    def get_playlist_cache(cls) -> List[PlayListItem] | None:
-        cls.CACHE_PATH.mkdir(parents=True, exist_ok=True)
-        dst_path = cls.CACHE_PATH / "playlist.cache"
-        if dst_path.exists():
-            playlists = toml.load(dst_path)["playlists"]
-            return [PlayListItem(**p) for p in playlists]
-        return None
+    def get_playlist_cache(cls) -> PlayListCache | None:
+        """the playlist cache, possibly expired (check `.expired`)"""
+        data = CacheManager.get_cm().read_json(
+            "playlist", "playlists.json", ttl=float("inf")
+        )
+        if data is None:
+            return None
+        try:
+            return PlayListCache.fromdict(data)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"broken playlist cache: {e}")
+            return None
 
     @classmethod
-    def save_playlist_cache(cls, playlists: List[PlayListItem]):
-        cls.CACHE_PATH.mkdir(parents=True, exist_ok=True)
-        dst_path = cls.CACHE_PATH / "playlist.cache"
-        toml.dump(
-            {"playlists": [p.asdict() for p in playlists]},
-            dst_path.open(mode="w", encoding="utf-8"),
+    def save_playlist_cache(
+        cls, playlists: List[PlayListItem], total: int | None = None
+    ) -> PlayListCache:
+        cache = PlayListCache(
+            playlists, len(playlists) if total is None else total
         )
+        CacheManager.get_cm().write_json(
+            "playlist", "playlists.json", cache.asdict()
+        )
+        return cache
 
     def __init__(
         self,
@@ -234,18 +243,14 @@ class FileManager:
             os.symlink(src, dst)
 
     @staticmethod
-    def _copy(src: Path, dst: Path, depth: int = -1):
-        if src.is_file():
-            shutil.copyfile(src, dst)
-            return
-
-        if depth == 0:
-            return
-
-        dst.mkdir(parents=True, exist_ok=True)
+    def copy(src: Path, dst: Path, depth: int = -1, link: bool = True):
+        """
+        copy with reflinks on CoW filesystems, per-file hardlinks on the same
+        device (if `link`), or a parallel copy otherwise
+        """
+        from asmrmanager.filemanager.file_copier import copy_folder
 
-        for subfile in src.iterdir():
-            FileManager._copy(subfile, dst / subfile.name, depth - 1)
+        copy_folder(src, dst, depth=depth, link=link)
 
     def remove_view(self, source_id: LocalSourceID):
         assert self.could_view()
@@ -286,9 +291,10 @@ class FileManager:
             yield LocalSourceID(rj_id)
 
     def zip_file(self, src: Path, dst: Path):
-        from asmrmanager.filemanager.file_zipper import zip_chosen_folder
+        """zip the already chosen folder `src` to `dst`"""
+        from asmrmanager.filemanager.file_zipper import zip_folder
 
-        zip_chosen_folder(src, dst)
+        zip_folder(src, dst)
 
     def get_location(
         self,
@@ -449,13 +455,26 @@ class FileManager:
         return l1 | l2
 
     def get_cover_path(self, source_id: LocalSourceID) -> Path:
-        cache_cover = self.CACHE_PATH.joinpath("covers").joinpath(
-            f"{id2source_name(source_id)}.jpg"
+        cache_cover = CacheManager.get_cm().get(
+            "covers", f"{id2source_name(source_id)}.jpg"
         )
-        if cache_cover.exists():
+        if cache_cover is not None:
             return cache_cover
         return self.get_path(source_id, "cover.jpg") or self.default_cover
 
+    def get_cover_thumbnails(
+        self, source_ids: Iterable[LocalSourceID], size: Tuple[int, int]
+    ) -> List[str]:
+        """covers resized for a `size` (columns, rows) table cell"""
+        from asmrmanager.filemanager.thumbnail import get_thumbnails
+
+        return get_thumbnails(
+            list(source_ids),
+            self.get_cover_path,
+            size,
+            default_cover=self.default_cover,
+        )
+
     @classmethod
     def get_fm(cls):
         from asmrmanager.config import config
@@ -0,0 +1,8 @@
+-- 本地音频的统计，来自媒体索引(media_file)，请先运行 asmr utils index --all
+select asmr.id, asmr.title, count(*) as files, round(sum(mf.duration) / 3600, 2) as hours,
+       group_concat(distinct mf.codec) as codecs, sum(mf.size) / 1048576 as mb
+from media_file mf
+         join asmr on asmr.id = mf.asmr_id
+group by mf.asmr_id
+order by hours desc  -- 或者 mb desc
+limit 20;
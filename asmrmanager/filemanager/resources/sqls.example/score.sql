@@ -1,13 +1,9 @@
-select asmr.id,title,circle_name,nsfw,release_date,price,dl_count,star,asmr.count,held,has_subtitle, va.name
+-- 排行榜，读取预先计算好的work_stats，不需要每次join整个库
+select asmr.id,title,circle_name,nsfw,release_date,price,dl_count,star,asmr.count,held,has_subtitle, ws.vas
 from asmr
-         join asmrs2tags a2t on asmr.id = a2t.asmr_id
-         join tag t on a2t.tag_id = t.id
-         join asmrs2vas a2v on asmr.id = a2v.asmr_id
-         join voice_actor va on a2v.actor_id = va.id
+         join work_stats ws on asmr.id = ws.asmr_id
 where true
 and asmr.star = 5
 and held = false
-group by asmr.id
-order by dl_count * price desc
+order by ws.revenue desc  -- dl_count * price, 或者 ws.score: dl_count * log10(price + 1)
 limit 20;
-
@@ -1,7 +1,7 @@
--- 搜索tags
-select *
+-- 搜索tags，附带预先计算好的统计(tag_stats)
+select tag.*, ts.work_count, ts.rated_count, ts.avg_star, ts.total_dl, ts.listen_count
 from tag
+         left join tag_stats ts on tag.id = ts.tag_id
 -- where tag.name == 'tag.name'
-order by random()
+order by random()  -- 或者 ts.work_count desc, ts.avg_star desc
 limit 20
-
@@ -1,3 +1,6 @@
-select * from voice_actor
-order by random()
-limit 20;
\ No newline at end of file
+-- 搜索声优，附带预先计算好的统计(va_stats)
+select voice_actor.*, vs.work_count, vs.rated_count, vs.avg_star, vs.total_dl, vs.listen_count
+from voice_actor
+         left join va_stats vs on voice_actor.id = vs.actor_id
+order by random()  -- 或者 vs.work_count desc, vs.avg_star desc
+limit 20;
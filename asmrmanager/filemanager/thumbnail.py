@@ -0,0 +1,107 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from asmrmanager.common.rj_parse import id2source_name
+from asmrmanager.common.types import LocalSourceID
+from asmrmanager.filemanager.cache import CacheManager
+from asmrmanager.logger import logger
+
+# approximate pixels of a terminal cell, thumbnails are rendered at twice
+# this size so they stay sharp on HiDPI terminals
+CELL_PIXELS = (10, 20)
+
+
+def _load_index(cm: CacheManager) -> Dict[str, Tuple[str, int]]:
+    index = cm.read_json("thumbnails", "index.json") or {}
+    try:
+        return {k: (v[0], v[1]) for k, v in index.items()}
+    except (AttributeError, IndexError, TypeError) as e:
+        logger.warning(f"broken thumbnail index, rebuild it: {e}")
+        return {}
+
+
+def _make_thumbnail(cover: Path, thumbnail: Path, size: Tuple[int, int]):
+    from PIL import Image
+
+    pixels = (size[0] * CELL_PIXELS[0] * 2, size[1] * CELL_PIXELS[1] * 2)
+    with Image.open(cover) as image:
+        image.draft("RGB", pixels)  # let the jpeg decoder downscale for us
+        image = image.convert("RGB")
+        image.thumbnail(pixels)
+        tmp_path = thumbnail.with_suffix(".tmp")
+        image.save(tmp_path, format="PNG")
+        tmp_path.replace(thumbnail)
+
+
+def get_thumbnails(
+    source_ids: Sequence[LocalSourceID],
+    get_cover_path: Callable[[LocalSourceID], Path],
+    size: Tuple[int, int],
+    default_cover: Path | None = None,
+    threads: int | None = None,
+) -> List[str]:
+    """
+    return the thumbnail paths of the covers of `source_ids`,
+    missing or outdated (by cover mtime) thumbnails are generated
+    in a thread pool, `get_cover_path` is only called for those.
+    works falling back to `default_cover` are not indexed, so their real
+    covers are picked up once fetched.
+    """
+    from importlib.util import find_spec
+
+    if not find_spec("PIL"):
+        return [str(get_cover_path(id_)) for id_ in source_ids]
+
+    cm = CacheManager.get_cm()
+    thumbnail_path = cm.dir("thumbnails")
+    index = _load_index(cm)
+    results: List[str] = []
+    jobs: Dict[Path, Path] = {}  # thumbnail -> cover
+    for source_id in source_ids:
+        source_name = id2source_name(source_id)
+        thumbnail = thumbnail_path / f"{source_name}_{size[0]}x{size[1]}.png"
+        results.append(str(thumbnail))
+        if thumbnail in jobs:
+            continue
+
+        if (entry := index.get(thumbnail.name)) is not None:
+            cover_str, mtime = entry
+            try:
+                fresh = os.stat(cover_str).st_mtime_ns == mtime
+            except OSError:
+                fresh = False
+            if fresh and cm.get("thumbnails", thumbnail.name):
+                continue
+
+        cover = get_cover_path(source_id)
+        if cover == default_cover:
+            thumbnail = thumbnail_path / f"default_{size[0]}x{size[1]}.png"
+            results[-1] = str(thumbnail)
+            if thumbnail in jobs or cm.get("thumbnails", thumbnail.name):
+                continue
+        else:
+            index[thumbnail.name] = (str(cover), cover.stat().st_mtime_ns)
+        jobs[thumbnail] = cover
+
+    if not jobs:
+        return results
+
+    logger.debug(f"generating {len(jobs)} thumbnails")
+    with ThreadPoolExecutor(threads or os.cpu_count() or 4) as executor:
+        futures = {
+            thumbnail: executor.submit(_make_thumbnail, cover, thumbnail, size)
+            for thumbnail, cover in jobs.items()
+        }
+    for thumbnail, future in futures.items():
+        if (e := future.exception()) is not None:
+            logger.warning(f"failed to generate thumbnail {thumbnail}: {e}")
+            results = [
+                str(jobs[thumbnail]) if r == str(thumbnail) else r
+                for r in results
+            ]
+        else:
+            cm.add("thumbnails", thumbnail)
+    cm.write_json("thumbnails", "index.json", index)
+    return results
@@ -4,6 +4,8 @@ from typing import List, NamedTuple
 
 from mutagen._file import File as MutagenFile
 
+from asmrmanager.logger import logger
+
 from ..lrcparse import LRC, LyricsData
 
 # PlayerStatus = NamedTuple(
@@ -129,6 +131,15 @@ class BasePlayer:
         return self.info.total_time
 
     def get_total_time(self) -> int:
+        try:
+            from asmrmanager.database.media_index import MediaIndex
+
+            info = MediaIndex.get_index().get(self.current.path)
+        except Exception as e:  # the player also works without a database
+            logger.debug(f"media index unavailable: {e}")
+            info = None
+        if info is not None:
+            return int(info.duration * 1000)
         return int(MutagenFile(self.current.path).info.length * 1000)  # type: ignore
 
     @property
@@ -8,7 +8,7 @@ from aiohttp import ClientConnectorError, ClientSession
 from aiohttp.connector import TCPConnector
 
 from asmrmanager.common.types import RemoteSourceID
-from asmrmanager.filemanager.appdirs_ import CACHE_PATH
+from asmrmanager.filemanager.cache import CacheManager
 from asmrmanager.logger import logger
 from asmrmanager.spider.utils.retry import RetryError, retry
 
@@ -49,36 +49,32 @@ class ASMRAPI:
 
     @property
     def login_cache(self) -> LoginCache | None:
-        CACHE_PATH.mkdir(parents=True, exist_ok=True)
-        login_cache_path = CACHE_PATH / "login_cache.json"
-        if not login_cache_path.exists():
+        data = CacheManager.get_cm().read_json("login", "login_cache.json")
+        if data is None:
             return None
         try:
-            with open(login_cache_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                return LoginCache(
-                    token=data["token"],
-                    recommender_uuid=data["recommender_uuid"],
-                    expire_time=data["expire_time"],
-                    username=data.get("username", ""),
-                )
+            return LoginCache(
+                token=data["token"],
+                recommender_uuid=data["recommender_uuid"],
+                expire_time=data["expire_time"],
+                username=data.get("username", ""),
+            )
         except Exception as e:
             logger.error(f"Failed to load login cache: {e}")
             return None
 
     @login_cache.setter
     def login_cache(self, cache: LoginCache) -> None:
-        login_cache_path = CACHE_PATH / "login_cache.json"
-        with open(login_cache_path, "w", encoding="utf-8") as f:
-            json.dump(
-                {
-                    "token": cache.token,
-                    "recommender_uuid": cache.recommender_uuid,
-                    "expire_time": cache.expire_time,
-                    "username": cache.username,
-                },
-                f,
-            )
+        CacheManager.get_cm().write_json(
+            "login",
+            "login_cache.json",
+            {
+                "token": cache.token,
+                "recommender_uuid": cache.recommender_uuid,
+                "expire_time": cache.expire_time,
+                "username": cache.username,
+            },
+        )
 
     async def login(self) -> None:
         login_cache = self.login_cache
@@ -16,6 +16,7 @@ from typing import (
 import asyncstdlib
 
 from asmrmanager.common import MUSIC_SUFFIXES
+from asmrmanager.common.fileconverter import AudioFormat
 from asmrmanager.common.rj_parse import id2source_name, source_name2id
 from asmrmanager.common.types import RemoteSourceID
 from asmrmanager.config import Aria2Config
@@ -97,9 +98,10 @@ class ASMRDownloadAPI(ASMRAPI):
         ],
         replace=False,
         limit: int = 3,
-        download_method: Literal["aria2", "idm"] = "idm",
+        download_method: Literal["aria2", "idm", "native"] = "idm",
         aria2_config: Aria2Config | None = None,
         fetch_cover: bool = False,
+        ingest_format: AudioFormat | None = None,
     ):
         # self._session: Optional[ClientSession] = None  # for __aenter__
         super().__init__(name, password, proxy, limit)
@@ -108,11 +110,14 @@ class ASMRDownloadAPI(ASMRAPI):
         self.name_should_download = name_should_download
         self.replace = replace
         self.fetch_cover = fetch_cover
-        self.download_file = (
-            self.download_by_idm
-            if download_method == "idm"
-            else self.download_by_aria2
-        )
+        self.download_file = {
+            "idm": self.download_by_idm,
+            "aria2": self.download_by_aria2,
+            "native": self.download_by_native,
+        }[download_method]
+        # xxh128 of the raw streams of the files converted while downloading,
+        # kept in the recover file since the raw file is never written
+        self.raw_hashes: Dict[Path, str] = {}
 
         self.aria2_config = aria2_config
         self.download_method = download_method
@@ -124,6 +129,10 @@ class ASMRDownloadAPI(ASMRAPI):
             )
             # 不默认使用配置文件中的proxy，可以在aria2.conf中自行添加all-proxy配置
             self.aria2_downloader = Aria2Downloader(None)
+        elif self.download_method == "native":
+            from .utils.native_downloader import NativeDownloader
+
+            self.native_downloader = NativeDownloader(ingest_format)
         else:
             assert IDMHelper is not None, (
                 "You have `download_method = idm` configured, "
@@ -220,23 +229,38 @@ class ASMRDownloadAPI(ASMRAPI):
         if self.fetch_cover and all(str(f.path.relative_to(voice_path)) != 'cover.jpg' for f in file_list):
             await self.download_cover(voice_id, voice_path)
         await self.create_dir_and_download(file_list)
+        if any(f.path in self.raw_hashes for f in file_list):
+            self.create_recover_file(file_list, voice_path)
 
     def create_recover_file(
         self,
         file_list: List[FileInfo],
         voice_path: Path,
     ):
-        recover = [
-            {
-                "path": str(file.path.relative_to(voice_path)).replace(
-                    "\\", "/"
-                ),
+        old_hashes = {}
+        if (voice_path / ".recover").exists():
+            try:
+                old_hashes = {
+                    i["path"]: i["hash"]
+                    for i in json.loads(
+                        (voice_path / ".recover").read_text(encoding="utf-8")
+                    )
+                    if "hash" in i
+                }
+            except (ValueError, KeyError, TypeError):
+                pass
+        recover = []
+        for file in file_list:
+            path = str(file.path.relative_to(voice_path)).replace("\\", "/")
+            record = {
+                "path": path,
                 "url": file.url,
                 "should_download": file.should_download,
                 "fileId": file.id,
             }
-            for file in file_list
-        ]
+            if hash_ := self.raw_hashes.get(file.path, old_hashes.get(path)):
+                record["hash"] = hash_
+            recover.append(record)
         with open(voice_path / ".recover", "w", encoding="utf-8") as f:
             json.dump(recover, f, ensure_ascii=False, indent=4)
 
@@ -301,6 +325,18 @@ class ASMRDownloadAPI(ASMRAPI):
         await self.aria2_downloader.download(url, save_path, file_name)
         return True
 
+    async def download_by_native(
+        self, url: str, save_path: Path, file_name: str
+    ) -> bool:
+        """the save path + file should not exist,
+        and the filename should be legal"""
+        hash_ = await self.native_downloader.download(
+            self._session, url, save_path, file_name, self.headers, self.proxy
+        )
+        if self.native_downloader.should_ingest(file_name):
+            self.raw_hashes[save_path / file_name] = hash_
+        return True
+
     def check_exists(self, download_file_path: Path):
         p = (
             fm.download_path
@@ -382,7 +418,10 @@ class ASMRDownloadAPI(ASMRAPI):
                 )
                 exit(-1)
             except Exception as e:
-                logger.error(f"Unknow download error: {e}")
+                logger.error(
+                    f"Unknow download error of {file_path.name}:"
+                    f" {type(e).__name__}: {e}"
+                )
                 continue
 
     def get_file_list(
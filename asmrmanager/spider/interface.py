@@ -17,11 +17,22 @@ import click
 import xxhash
 
 from asmrmanager.common.browse_params import BrowseParams
-from asmrmanager.common.output import print_table, support_image
+from asmrmanager.common.fileconverter import AudioFormat
+from asmrmanager.common.output import (
+    COVER_CELL_SIZE,
+    print_table,
+    support_image,
+)
 from asmrmanager.common.rj_parse import source_name2id
 from asmrmanager.common.select import select_multiple
-from asmrmanager.common.types import RemoteSourceID, SourceName
+from asmrmanager.common.types import (
+    PlayListCache,
+    PlayListItem,
+    RemoteSourceID,
+    SourceName,
+)
 from asmrmanager.config import Aria2Config
+from asmrmanager.filemanager.cache import CacheManager
 from asmrmanager.filemanager.manager import FileManager
 from asmrmanager.logger import logger
 from asmrmanager.spider.asmrapi import ASMRAPI
@@ -71,15 +82,21 @@ class AsyncManager:
         if path.name != "akarin.jpg":
             logger.debug("Using cached cover for %s", source_name)
             return str(path)
-        save_path = fm.CACHE_PATH.joinpath("covers").joinpath(
-            f"{source_name}.jpg"
-        )
-        save_path.parent.mkdir(exist_ok=True, parents=True)
         image_data = await self.api.get_cover(remote_id)
-        with save_path.open("wb") as f:
-            f.write(image_data)
+        save_path = CacheManager.get_cm().write_bytes(
+            "covers", f"{source_name}.jpg", image_data
+        )
         return str(save_path)
 
+    async def get_cover_thumbnails(self, works: List[Any]) -> List[str]:
+        """fetch the missing covers and return their table thumbnails"""
+        await asyncio.gather(*[self.get_cover_path(w) for w in works])
+        return await asyncio.to_thread(
+            fm.get_cover_thumbnails,
+            [source_name2id(w["source_id"]) for w in works],
+            COVER_CELL_SIZE,
+        )
+
 
 class ASMRDownloadManager(AsyncManager):
     def __init__(
@@ -93,11 +110,12 @@ class ASMRDownloadManager(AsyncManager):
             Callable[[str, Literal["directory", "file"]], int] | None
         ) = None,
         replace=False,
-        download_method: Literal["aria2", "idm"] = "idm",
+        download_method: Literal["aria2", "idm", "native"] = "idm",
         aria2_config: Aria2Config | None = None,
         limit: int = 4,
         fetch_cover: bool = False,
         tagger: Literal["tag", "tagw"] = "tag",
+        ingest_format: AudioFormat | None = None,
     ):
         self.downloader = ASMRDownloadAPI(
             name=name,
@@ -110,6 +128,7 @@ class ASMRDownloadManager(AsyncManager):
             download_method=download_method,
             aria2_config=aria2_config,
             fetch_cover=fetch_cover,
+            ingest_format=ingest_format,
         )
         super().__init__(self.downloader)
         self.id_should_download = id_should_download or (lambda _: True)
@@ -229,8 +248,8 @@ class ASMRDownloadManager(AsyncManager):
                 if not support_image():
                     cover_paths = None
                 else:
-                    cover_paths = await asyncio.gather(
-                        *[self.get_cover_path(r) for r in preview_results]
+                    cover_paths = await self.get_cover_thumbnails(
+                        preview_results
                     )
                 print_table(
                     titles=["id", "title", "circle_name"],
@@ -361,32 +380,69 @@ class ASMRPlayListManager(AsyncManager):
         )
         super().__init__(self.playlist)
 
-    async def list(self, num: int = 12, raw: bool = False):
-        from asmrmanager.common.output import print_table
-
+    async def sync(
+        self, page_size: int = 100, full: bool = False
+    ) -> PlayListCache:
+        """
+        sync the local playlist cache with the server.
+        if the total number is unchanged, pages are fetched only until a
+        page whose playlists (works_count, latest_work_id ...) are all
+        identical to the cached ones, otherwise everything is refetched.
+        the rest is taken from the cache, unless the playlists do not add
+        up to the total then (one was deleted and another created).
+        """
+        cache = None if full else fm.get_playlist_cache()
         page = 1
         playlists, total = await self.playlist.get_playlists(
-            page=page, page_size=num
+            page=page, page_size=page_size
         )
         logger.info(f"fetching playlists ({len(playlists)}/{total})")
-        while num * page < total:
+
+        def page_changed(page_playlists: List[PlayListItem]) -> bool:
+            assert cache is not None
+            return any(cache.by_id.get(p.id) != p for p in page_playlists)
+
+        async def fetch_next_page():
+            nonlocal page
             page += 1
             playlists_, _ = await self.playlist.get_playlists(
-                page=page, page_size=num
+                page=page, page_size=page_size
             )
-            playlists += playlists_
+            playlists.extend(playlists_)
             logger.info(f"fetching playlists ({len(playlists)}/{total})")
+
+        incremental = cache is not None and cache.total == total
+        while page_size * page < total and (
+            not incremental or page_changed(playlists[-page_size:])
+        ):
+            await fetch_next_page()
+
+        if incremental and page_size * page < total:
+            assert cache is not None
+            fetched_ids = set(p.id for p in playlists)
+            merged = playlists + [
+                p for p in cache.playlists if p.id not in fetched_ids
+            ]
+            if len(merged) == total:
+                return fm.save_playlist_cache(merged, total)
+            logger.info("playlists were deleted, fetching all of them")
+            while page_size * page < total:
+                await fetch_next_page()
+        return fm.save_playlist_cache(playlists, total)
+
+    async def list(self, num: int = 12, raw: bool = False, full: bool = False):
+        from asmrmanager.common.output import print_table
+
+        cache = await self.sync(page_size=num, full=full)
         print_table(
             titles=["id", "name", "amount", "privacy"],
             rows=[
                 (str(p.id), p.name, p.works_count, p.privacy.name)
-                for p in playlists
+                for p in cache.playlists
             ],
             raw=raw,
         )
 
-        fm.save_playlist_cache(playlists)
-
     async def remove(self, pl_ids: List[uuid.UUID]):
         res = await asyncio.gather(*map(self.playlist.delete_playlist, pl_ids))
 
@@ -402,6 +458,9 @@ class ASMRPlayListManager(AsyncManager):
                 return
             logger.info(f"Sucessfully delete playlist {r['id']}.")
 
+        logger.info("Updating local playlist cache...")
+        await self.sync()
+
     async def create(
         self,
         name: str,
@@ -420,7 +479,7 @@ class ASMRPlayListManager(AsyncManager):
         logger.info(f"Sucessfully create playlist: {res['id']}.")
 
         logger.info("Updating local playlist cache...")
-        await self.list()
+        await self.sync()
 
     async def add(self, source_ids: List[RemoteSourceID], pl_id: uuid.UUID):
         res = await self.playlist.add_works_to_playlist(source_ids, pl_id)
@@ -474,9 +533,7 @@ class ASMRPlayListManager(AsyncManager):
                     works,
                 )
             ),
-            image_paths=[
-                *await asyncio.gather(*[self.get_cover_path(w) for w in works])
-            ]
+            image_paths=await self.get_cover_thumbnails(works)
             if support_image()
             else None,
         )
@@ -546,8 +603,11 @@ class ASMRGeneralManager(AsyncManager):
         self.api = ASMRAPI(name, password, proxy, limit)
 
     @concurrent_rate_limit()
-    async def verify(self, file_path: Path, file_id: int) -> bool:
-        xxhash_ = xxhash.xxh128_hexdigest(file_path.read_bytes())
+    async def verify(
+        self, file_path: Path, file_id: int, hash_: str | None = None
+    ) -> bool:
+        """verify the file, or the recorded `hash_` of its raw stream"""
+        xxhash_ = hash_ or xxhash.xxh128_hexdigest(file_path.read_bytes())
         res = await self.api.verify_hash(file_id, xxhash_)
         logger.debug(f"Hash of file {file_id}: {xxhash_}")
         logger.debug(f"Response: {res}")
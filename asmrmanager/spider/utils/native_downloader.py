@@ -0,0 +1,132 @@
+import asyncio
+import os
+from pathlib import Path
+from shutil import which
+from typing import Any, Dict
+
+import xxhash
+from aiohttp import ClientSession, ClientTimeout
+
+from asmrmanager.common.fileconverter import CODEC_ARGS, AudioFormat
+from asmrmanager.logger import logger
+
+CHUNK_SIZE = 1 << 20
+# a large wav takes longer than the 5 minutes total of the api session,
+# only a stalled connection is given up
+TIMEOUT = ClientTimeout(total=None, sock_connect=30, sock_read=120)
+
+
+class NativeDownloader:
+    """
+    download through the aiohttp session of the api. with `ingest_format`
+    the wav files are piped into ffmpeg while they are received, so only the
+    encoded file is written, the raw stream is still hashed (xxh128) for the
+    hash verification of the server.
+    """
+
+    def __init__(self, ingest_format: AudioFormat | None = None) -> None:
+        if ingest_format is not None and which("ffmpeg") is None:
+            logger.warning(
+                "ffmpeg not found, wav files will be downloaded without"
+                f" converting to {ingest_format}"
+            )
+            ingest_format = None
+        self.ingest_format = ingest_format
+
+    def should_ingest(self, filename: str) -> bool:
+        return (
+            self.ingest_format is not None
+            and Path(filename).suffix.lower() == ".wav"
+        )
+
+    async def download(
+        self,
+        session: ClientSession,
+        url: str,
+        save_path: Path,
+        filename: str,
+        headers: Dict[str, Any],
+        proxy: str | None,
+    ) -> str:
+        """download `url`, return the xxh128 of the raw stream"""
+        dst = save_path / filename
+        if self.should_ingest(filename):
+            assert self.ingest_format is not None
+            dst = dst.with_suffix(f".{self.ingest_format}")
+        # write to a temporary name, so `dst` is either complete or absent
+        tmp = dst.with_name(f".{dst.stem}.part{dst.suffix}")
+        try:
+            async with session.get(
+                url, headers=headers, proxy=proxy, timeout=TIMEOUT
+            ) as resp:
+                resp.raise_for_status()
+                if dst.name != filename:
+                    digest, size = await self._encode(resp, tmp)
+                else:
+                    digest, size = await self._write(resp, tmp)
+                if (
+                    resp.content_length is not None
+                    and size != resp.content_length
+                ):
+                    raise IOError(
+                        f"incomplete download of {filename}: {size}"
+                        f"/{resp.content_length} bytes"
+                    )
+            os.replace(tmp, dst)
+        finally:
+            tmp.unlink(missing_ok=True)
+        logger.debug(f"Raw hash of {filename}: {digest}")
+        return digest
+
+    @staticmethod
+    async def _write(resp, tmp: Path):
+        h = xxhash.xxh128()
+        size = 0
+        with tmp.open("wb") as f:
+            async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                h.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+        return h.hexdigest(), size
+
+    async def _encode(self, resp, tmp: Path):
+        assert self.ingest_format is not None
+        proc = await asyncio.create_subprocess_exec(
+            "ffmpeg",
+            "-y",
+            "-loglevel",
+            "error",
+            "-f",
+            "wav",
+            "-i",
+            "pipe:0",
+            "-acodec",
+            *CODEC_ARGS[self.ingest_format],
+            str(tmp),
+            stdin=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        assert proc.stdin is not None and proc.stderr is not None
+        # drain stderr meanwhile, a full pipe would block ffmpeg
+        stderr = asyncio.create_task(proc.stderr.read())
+        h = xxhash.xxh128()
+        size = 0
+        try:
+            async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                h.update(chunk)
+                size += len(chunk)
+                proc.stdin.write(chunk)
+                await proc.stdin.drain()
+            proc.stdin.close()
+            returncode = await proc.wait()
+        except BaseException:
+            proc.kill()
+            await proc.wait()
+            raise
+        if returncode != 0:
+            err = (await stderr).decode(errors="ignore").strip()
+            raise RuntimeError(
+                f"ffmpeg failed to encode {tmp.name} (exit code"
+                f" {returncode}): {err}"
+            )
+        return h.hexdigest(), size